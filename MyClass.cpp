@@ -9,6 +9,90 @@
 #include "Interfaces/IHttpRequest.h"
 #include "Interfaces/IHttpResponse.h"
 
+// Vector channel ({"x", "y", "z"}), zero if absent
+static FVector ParseVector(const TSharedPtr<FJsonObject>& Object, const FString& Field)
+{
+    if (!Object->HasField(Field))
+    {
+        return FVector::ZeroVector;
+    }
+    TSharedPtr<FJsonObject> VectorObject = Object->GetObjectField(Field);
+    return FVector(VectorObject->GetNumberField("x"), VectorObject->GetNumberField("y"), VectorObject->GetNumberField("z"));
+}
+
+// Scalar channel, zero if absent
+static float ParseScalar(const TSharedPtr<FJsonObject>& Object, const FString& Field)
+{
+    return Object->HasField(Field) ? Object->GetNumberField(Field) : 0.0f;
+}
+
+// Every channel except time and jaw, from a keyframe or a viseme pose
+static void ParseChannels(const TSharedPtr<FJsonObject>& Object, FJawKeyframe& Keyframe)
+{
+    // Funnel values
+    Keyframe.FunnelRightUp = ParseScalar(Object, "funnelRightUp");
+    Keyframe.FunnelRightDown = ParseScalar(Object, "funnelRightDown");
+    Keyframe.FunnelLeftUp = ParseScalar(Object, "funnelLeftUp");
+    Keyframe.FunnelLeftDown = ParseScalar(Object, "funnelLeftDown");
+    
+    // Purse values
+    Keyframe.PurseRightUp = ParseScalar(Object, "purseRightUp");
+    Keyframe.PurseRightDown = ParseScalar(Object, "purseRightDown");
+    Keyframe.PurseLeftUp = ParseScalar(Object, "purseLeftUp");
+    Keyframe.PurseLeftDown = ParseScalar(Object, "purseLeftDown");
+    
+    // Corner pull values
+    Keyframe.CornerPullRight = ParseScalar(Object, "cornerPullRight");
+    Keyframe.CornerPullLeft = ParseScalar(Object, "cornerPullLeft");
+    
+    // Teeth and tongue values
+    Keyframe.TeethUpperValue = ParseVector(Object, "teethUpperValue");
+    Keyframe.TeethLowerValue = ParseVector(Object, "teethLowerValue");
+    Keyframe.TongueValue = ParseVector(Object, "tongueValue");
+    Keyframe.TongueInOut = ParseScalar(Object, "tongueInOut");
+    
+    // Press values
+    Keyframe.PressRightUp = ParseScalar(Object, "pressRightUp");
+    Keyframe.PressRightDown = ParseScalar(Object, "pressRightDown");
+    Keyframe.PressLeftUp = ParseScalar(Object, "pressLeftUp");
+    Keyframe.PressLeftDown = ParseScalar(Object, "pressLeftDown");
+    
+    // Towards values
+    Keyframe.TowardsRightUp = ParseScalar(Object, "towardsRightUp");
+    Keyframe.TowardsRightDown = ParseScalar(Object, "towardsRightDown");
+    Keyframe.TowardsLeftUp = ParseScalar(Object, "towardsLeftUp");
+    Keyframe.TowardsLeftDown = ParseScalar(Object, "towardsLeftDown");
+}
+
+// Rest + Weight * (Pose - Rest) on every channel except time and jaw (viseme record expansion)
+static FJawKeyframe BlendPose(const FJawKeyframe& Rest, const FJawKeyframe& Pose, float Weight)
+{
+    FJawKeyframe Keyframe;
+    Keyframe.FunnelRightUp = FMath::Lerp(Rest.FunnelRightUp, Pose.FunnelRightUp, Weight);
+    Keyframe.FunnelRightDown = FMath::Lerp(Rest.FunnelRightDown, Pose.FunnelRightDown, Weight);
+    Keyframe.FunnelLeftUp = FMath::Lerp(Rest.FunnelLeftUp, Pose.FunnelLeftUp, Weight);
+    Keyframe.FunnelLeftDown = FMath::Lerp(Rest.FunnelLeftDown, Pose.FunnelLeftDown, Weight);
+    Keyframe.PurseRightUp = FMath::Lerp(Rest.PurseRightUp, Pose.PurseRightUp, Weight);
+    Keyframe.PurseRightDown = FMath::Lerp(Rest.PurseRightDown, Pose.PurseRightDown, Weight);
+    Keyframe.PurseLeftUp = FMath::Lerp(Rest.PurseLeftUp, Pose.PurseLeftUp, Weight);
+    Keyframe.PurseLeftDown = FMath::Lerp(Rest.PurseLeftDown, Pose.PurseLeftDown, Weight);
+    Keyframe.CornerPullRight = FMath::Lerp(Rest.CornerPullRight, Pose.CornerPullRight, Weight);
+    Keyframe.CornerPullLeft = FMath::Lerp(Rest.CornerPullLeft, Pose.CornerPullLeft, Weight);
+    Keyframe.TeethUpperValue = FMath::Lerp(Rest.TeethUpperValue, Pose.TeethUpperValue, Weight);
+    Keyframe.TeethLowerValue = FMath::Lerp(Rest.TeethLowerValue, Pose.TeethLowerValue, Weight);
+    Keyframe.TongueValue = FMath::Lerp(Rest.TongueValue, Pose.TongueValue, Weight);
+    Keyframe.TongueInOut = FMath::Lerp(Rest.TongueInOut, Pose.TongueInOut, Weight);
+    Keyframe.PressRightUp = FMath::Lerp(Rest.PressRightUp, Pose.PressRightUp, Weight);
+    Keyframe.PressRightDown = FMath::Lerp(Rest.PressRightDown, Pose.PressRightDown, Weight);
+    Keyframe.PressLeftUp = FMath::Lerp(Rest.PressLeftUp, Pose.PressLeftUp, Weight);
+    Keyframe.PressLeftDown = FMath::Lerp(Rest.PressLeftDown, Pose.PressLeftDown, Weight);
+    Keyframe.TowardsRightUp = FMath::Lerp(Rest.TowardsRightUp, Pose.TowardsRightUp, Weight);
+    Keyframe.TowardsRightDown = FMath::Lerp(Rest.TowardsRightDown, Pose.TowardsRightDown, Weight);
+    Keyframe.TowardsLeftUp = FMath::Lerp(Rest.TowardsLeftUp, Pose.TowardsLeftUp, Weight);
+    Keyframe.TowardsLeftDown = FMath::Lerp(Rest.TowardsLeftDown, Pose.TowardsLeftDown, Weight);
+    return Keyframe;
+}
+
 void UMyClass::NativeInitializeAnimation()
 {
     Super::NativeInitializeAnimation();
@@ -24,6 +108,12 @@ void UMyClass::NativeInitializeAnimation()
         UE_LOG(LogTemp, Error, TEXT("HTTP module is not enabled"));
     }
     
+    // Compact viseme replies need the pose table first; fetching it opts this session in
+    if (bUseVisemes)
+    {
+        FetchPoseTable();
+    }
+    
     // Load the animation data from JSON but don't use it yet
     LoadJawAnimationData();
     
@@ -127,15 +217,29 @@ void UMyClass::NativeUpdateAnimation(float DeltaSeconds)
         int32 NextIndex = 0;
         bool bFoundCurrent = false;
         
-        // Improved keyframe searching - find the keyframes that bracket our current time
-        for (int32 i = 0; i < JawKeyframes.Num() - 1; i++)
+        if (FrameRate > 0.0f)
         {
-            if (ElapsedTime >= JawKeyframes[i].Time && ElapsedTime < JawKeyframes[i + 1].Time)
+            // Fixed-rate keyframes: the bracketing frames follow directly from the time
+            const int32 Frame = FMath::FloorToInt(ElapsedTime * FrameRate);
+            if (Frame >= 0 && Frame < JawKeyframes.Num() - 1)
             {
-                CurrentIndex = i;
-                NextIndex = i + 1;
+                CurrentIndex = Frame;
+                NextIndex = Frame + 1;
                 bFoundCurrent = true;
-                break;
+            }
+        }
+        else
+        {
+            // Improved keyframe searching - find the keyframes that bracket our current time
+            for (int32 i = 0; i < JawKeyframes.Num() - 1; i++)
+            {
+                if (ElapsedTime >= JawKeyframes[i].Time && ElapsedTime < JawKeyframes[i + 1].Time)
+                {
+                    CurrentIndex = i;
+                    NextIndex = i + 1;
+                    bFoundCurrent = true;
+                    break;
+                }
             }
         }
         
@@ -233,7 +337,12 @@ void UMyClass::NativeUpdateAnimation(float DeltaSeconds)
             
             // Use smoother interpolation curve (ease-in-out)
             // Use stronger easing for rest phases
-            if (bIsRestingPhase)
+            // (fixed-rate frames already carry the server-side easing, so they stay linear)
+            if (FrameRate > 0.0f)
+            {
+                // Linear between adjacent frames
+            }
+            else if (bIsRestingPhase)
             {
                 // Stronger ease-out for resting phase
                 Alpha = 1.0f - FMath::Pow(1.0f - Alpha, 3.0f);
@@ -371,6 +480,7 @@ void UMyClass::LoadJawAnimationData()
     // Reset speech end time flag
     bJsonHasSpeechEndTime = false;
     JsonSpeechEndTime = 0.0f;
+    FrameRate = 0.0f;
     
     UE_LOG(LogTemp, Display, TEXT("Attempting to load JSON animation from: %s"), *JsonFilePath);
     
@@ -400,8 +510,20 @@ void UMyClass::LoadJawAnimationData()
                 UE_LOG(LogTemp, Display, TEXT("Speech ends at: %f seconds"), JsonSpeechEndTime);
             }
             
+            // Keyframes resampled onto a fixed grid can be indexed directly
+            if (JsonObject->HasField("frame_rate"))
+            {
+                FrameRate = JsonObject->GetNumberField("frame_rate");
+                UE_LOG(LogTemp, Display, TEXT("Fixed-rate keyframes at %f fps"), FrameRate);
+            }
+            
+            // Compact viseme records are expanded with the pose table
+            if (JsonObject->HasField("format") && JsonObject->GetStringField("format") == "visemes")
+            {
+                LoadVisemeRecords(JsonObject);
+            }
             // Parse the keyframes array
-            if (JsonObject->HasField("keyframes"))
+            else if (JsonObject->HasField("keyframes"))
             {
                 TArray<TSharedPtr<FJsonValue>> KeyframesArray = JsonObject->GetArrayField("keyframes");
                 UE_LOG(LogTemp, Display, TEXT("Found %d keyframes in JSON"), KeyframesArray.Num());
@@ -452,73 +574,8 @@ void UMyClass::LoadJawAnimationData()
                             UE_LOG(LogTemp, Warning, TEXT("Keyframe at %f missing jawValue"), Keyframe.Time);
                         }
                         
-                        // Parse funnel values
-                        Keyframe.FunnelRightUp = KeyframeObject->HasField("funnelRightUp") ? KeyframeObject->GetNumberField("funnelRightUp") : 0.0f;
-                        Keyframe.FunnelRightDown = KeyframeObject->HasField("funnelRightDown") ? KeyframeObject->GetNumberField("funnelRightDown") : 0.0f;
-                        Keyframe.FunnelLeftUp = KeyframeObject->HasField("funnelLeftUp") ? KeyframeObject->GetNumberField("funnelLeftUp") : 0.0f;
-                        Keyframe.FunnelLeftDown = KeyframeObject->HasField("funnelLeftDown") ? KeyframeObject->GetNumberField("funnelLeftDown") : 0.0f;
-                        
-                        // Parse purse values
-                        Keyframe.PurseRightUp = KeyframeObject->HasField("purseRightUp") ? KeyframeObject->GetNumberField("purseRightUp") : 0.0f;
-                        Keyframe.PurseRightDown = KeyframeObject->HasField("purseRightDown") ? KeyframeObject->GetNumberField("purseRightDown") : 0.0f;
-                        Keyframe.PurseLeftUp = KeyframeObject->HasField("purseLeftUp") ? KeyframeObject->GetNumberField("purseLeftUp") : 0.0f;
-                        Keyframe.PurseLeftDown = KeyframeObject->HasField("purseLeftDown") ? KeyframeObject->GetNumberField("purseLeftDown") : 0.0f;
-                        
-                        // Parse corner pull values
-                        Keyframe.CornerPullRight = KeyframeObject->HasField("cornerPullRight") ? KeyframeObject->GetNumberField("cornerPullRight") : 0.0f;
-                        Keyframe.CornerPullLeft = KeyframeObject->HasField("cornerPullLeft") ? KeyframeObject->GetNumberField("cornerPullLeft") : 0.0f;
-                        
-                        // Parse teeth values
-                        if (KeyframeObject->HasField("teethUpperValue"))
-                        {
-                            TSharedPtr<FJsonObject> TeethUpperObject = KeyframeObject->GetObjectField("teethUpperValue");
-                            Keyframe.TeethUpperValue.X = TeethUpperObject->GetNumberField("x");
-                            Keyframe.TeethUpperValue.Y = TeethUpperObject->GetNumberField("y");
-                            Keyframe.TeethUpperValue.Z = TeethUpperObject->GetNumberField("z");
-                        }
-                        else
-                        {
-                            Keyframe.TeethUpperValue = FVector::ZeroVector;
-                        }
-                        
-                        if (KeyframeObject->HasField("teethLowerValue"))
-                        {
-                            TSharedPtr<FJsonObject> TeethLowerObject = KeyframeObject->GetObjectField("teethLowerValue");
-                            Keyframe.TeethLowerValue.X = TeethLowerObject->GetNumberField("x");
-                            Keyframe.TeethLowerValue.Y = TeethLowerObject->GetNumberField("y");
-                            Keyframe.TeethLowerValue.Z = TeethLowerObject->GetNumberField("z");
-                        }
-                        else
-                        {
-                            Keyframe.TeethLowerValue = FVector::ZeroVector;
-                        }
-                        
-                        // Parse tongue values
-                        if (KeyframeObject->HasField("tongueValue"))
-                        {
-                            TSharedPtr<FJsonObject> TongueObject = KeyframeObject->GetObjectField("tongueValue");
-                            Keyframe.TongueValue.X = TongueObject->GetNumberField("x");
-                            Keyframe.TongueValue.Y = TongueObject->GetNumberField("y");
-                            Keyframe.TongueValue.Z = TongueObject->GetNumberField("z");
-                        }
-                        else
-                        {
-                            Keyframe.TongueValue = FVector::ZeroVector;
-                        }
-                        
-                        Keyframe.TongueInOut = KeyframeObject->HasField("tongueInOut") ? KeyframeObject->GetNumberField("tongueInOut") : 0.0f;
-                        
-                        // Parse press values
-                        Keyframe.PressRightUp = KeyframeObject->HasField("pressRightUp") ? KeyframeObject->GetNumberField("pressRightUp") : 0.0f;
-                        Keyframe.PressRightDown = KeyframeObject->HasField("pressRightDown") ? KeyframeObject->GetNumberField("pressRightDown") : 0.0f;
-                        Keyframe.PressLeftUp = KeyframeObject->HasField("pressLeftUp") ? KeyframeObject->GetNumberField("pressLeftUp") : 0.0f;
-                        Keyframe.PressLeftDown = KeyframeObject->HasField("pressLeftDown") ? KeyframeObject->GetNumberField("pressLeftDown") : 0.0f;
-                        
-                        // Parse towards values
-                        Keyframe.TowardsRightUp = KeyframeObject->HasField("towardsRightUp") ? KeyframeObject->GetNumberField("towardsRightUp") : 0.0f;
-                        Keyframe.TowardsRightDown = KeyframeObject->HasField("towardsRightDown") ? KeyframeObject->GetNumberField("towardsRightDown") : 0.0f;
-                        Keyframe.TowardsLeftUp = KeyframeObject->HasField("towardsLeftUp") ? KeyframeObject->GetNumberField("towardsLeftUp") : 0.0f;
-                        Keyframe.TowardsLeftDown = KeyframeObject->HasField("towardsLeftDown") ? KeyframeObject->GetNumberField("towardsLeftDown") : 0.0f;
+                        // Parse the remaining facial channels
+                        ParseChannels(KeyframeObject, Keyframe);
                         
                         // Add to our keyframes array
                         JawKeyframes.Add(Keyframe);
@@ -563,3 +620,83 @@ void UMyClass::LoadJawAnimationData()
         UE_LOG(LogTemp, Warning, TEXT("Failed to load JSON file from path: %s"), *JsonFilePath);
     }
 }
+
+void UMyClass::FetchPoseTable()
+{
+    TSharedRef<IHttpRequest, ESPMode::ThreadSafe> HttpRequest = FHttpModule::Get().CreateRequest();
+    HttpRequest->SetURL(PoseTableURL);
+    HttpRequest->SetVerb(TEXT("GET"));
+    HttpRequest->OnProcessRequestComplete().BindUObject(this, &UMyClass::OnPoseTableResponse);
+    HttpRequest->ProcessRequest();
+}
+
+void UMyClass::OnPoseTableResponse(FHttpRequestPtr Request, FHttpResponsePtr Response, bool bWasSuccessful)
+{
+    if (!bWasSuccessful || !Response.IsValid() || Response->GetResponseCode() != 200)
+    {
+        UE_LOG(LogTemp, Warning, TEXT("Failed to fetch the viseme pose table"));
+        return;
+    }
+    
+    TSharedPtr<FJsonObject> JsonObject;
+    TSharedRef<TJsonReader<>> Reader = TJsonReaderFactory<>::Create(Response->GetContentAsString());
+    if (!FJsonSerializer::Deserialize(Reader, JsonObject) || !JsonObject.IsValid() || !JsonObject->HasField("pose_table"))
+    {
+        UE_LOG(LogTemp, Warning, TEXT("Failed to parse the viseme pose table"));
+        return;
+    }
+    
+    TSharedPtr<FJsonObject> PoseTable = JsonObject->GetObjectField("pose_table");
+    TArray<TSharedPtr<FJsonValue>> Visemes = PoseTable->GetArrayField("visemes");
+    
+    // Poses are indexed by viseme ID
+    VisemePoses.Empty();
+    VisemePoses.SetNum(Visemes.Num());
+    for (const TSharedPtr<FJsonValue>& VisemeValue : Visemes)
+    {
+        TSharedPtr<FJsonObject> VisemeObject = VisemeValue->AsObject();
+        const int32 Id = VisemeObject->GetIntegerField("id");
+        if (VisemePoses.IsValidIndex(Id))
+        {
+            ParseChannels(VisemeObject->GetObjectField("pose"), VisemePoses[Id]);
+        }
+    }
+    PoseTableVersion = PoseTable->GetStringField("version");
+    UE_LOG(LogTemp, Display, TEXT("Loaded %d viseme poses (table %s)"), VisemePoses.Num(), *PoseTableVersion);
+}
+
+void UMyClass::LoadVisemeRecords(const TSharedPtr<FJsonObject>& JsonObject)
+{
+    if (VisemePoses.Num() == 0)
+    {
+        UE_LOG(LogTemp, Warning, TEXT("Viseme records received before the pose table was loaded"));
+        return;
+    }
+    if (JsonObject->HasField("pose_table") && JsonObject->GetStringField("pose_table") != PoseTableVersion)
+    {
+        // The server's poses changed: the records still play, against the table we hold
+        UE_LOG(LogTemp, Warning, TEXT("Viseme records are for pose table %s, have %s"),
+            *JsonObject->GetStringField("pose_table"), *PoseTableVersion);
+        FetchPoseTable();
+    }
+    
+    // Records are [time, viseme, weight, jaw], in time order
+    const FJawKeyframe& Rest = VisemePoses[0];
+    TArray<TSharedPtr<FJsonValue>> Records = JsonObject->GetArrayField("visemes");
+    for (const TSharedPtr<FJsonValue>& RecordValue : Records)
+    {
+        const TArray<TSharedPtr<FJsonValue>>& Record = RecordValue->AsArray();
+        if (Record.Num() < 4)
+        {
+            continue;
+        }
+        const int32 Viseme = FMath::Clamp(static_cast<int32>(Record[1]->AsNumber()), 0, VisemePoses.Num() - 1);
+        
+        FJawKeyframe Keyframe = BlendPose(Rest, VisemePoses[Viseme], Record[2]->AsNumber());
+        Keyframe.Time = Record[0]->AsNumber();
+        Keyframe.JawValue = FVector(0.0f, Record[3]->AsNumber(), 0.0f);
+        JawKeyframes.Add(Keyframe);
+    }
+    
+    UE_LOG(LogTemp, Display, TEXT("Expanded %d viseme records into keyframes"), JawKeyframes.Num());
+}
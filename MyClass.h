@@ -74,6 +74,8 @@ public:
     UPROPERTY(EditAnywhere, BlueprintReadWrite, Category = "Animation") FString JsonFilePath = "/Users/mohammedriyan/Desktop/sofia_server/output/response_keyframes.json";
     UPROPERTY(EditAnywhere, BlueprintReadWrite, Category = "Server") float PollInterval = 0.1f;
     UPROPERTY(EditAnywhere, BlueprintReadWrite, Category = "Server") FString ServerURL = "http://127.0.0.1:5050/start_animation";
+    UPROPERTY(EditAnywhere, BlueprintReadWrite, Category = "Server") bool bUseVisemes = false; // Ask for compact viseme records
+    UPROPERTY(EditAnywhere, BlueprintReadWrite, Category = "Server") FString PoseTableURL = "http://127.0.0.1:5050/visemes/poses";
 
 private:
     float ElapsedTime = 0.0f;
@@ -82,11 +84,17 @@ private:
     bool bAnimationCompleted = false;
     bool bJsonHasSpeechEndTime = false;
     float JsonSpeechEndTime = 0.0f;
+    float FrameRate = 0.0f; // > 0 when keyframes are on a fixed grid (frame i at i / FrameRate)
 
     TArray<FJawKeyframe> JawKeyframes;
+    TArray<FJawKeyframe> VisemePoses; // Pose per viseme ID (index 0 is rest); jaw comes from the records
+    FString PoseTableVersion;
 
     void CheckServer();
     void OnServerResponse(FHttpRequestPtr Request, FHttpResponsePtr Response, bool bWasSuccessful);
     void LoadJawAnimationData();
+    void FetchPoseTable();
+    void OnPoseTableResponse(FHttpRequestPtr Request, FHttpResponsePtr Response, bool bWasSuccessful);
+    void LoadVisemeRecords(const TSharedPtr<FJsonObject>& JsonObject);
     void ResetAnimationValues();
 };
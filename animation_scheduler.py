@@ -0,0 +1,158 @@
+import logging
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class AnimationScheduler:
+    """
+    Starts and stops avatar animations for every session from a single thread.
+
+    Events live in one time-ordered heap, so the number of threads stays
+    constant however many animations are in flight. Rescheduling or cancelling
+    a session invalidates its queued events lazily through a per-session
+    generation number. Generation numbers are never reused, so a session's
+    state can be dropped as soon as its animation stops or is cancelled.
+    """
+
+    def __init__(self, clock=time.monotonic, drift_window=1000):
+        self.clock = clock
+        self._heap = []
+        self._sequence = itertools.count()
+        self._generations = {}    # session_id -> generation of its live schedule (sessions with one only)
+        self._sessions = {}       # session_id -> {"active", "pending_start", "started_at", "duration"}
+        self._condition = threading.Condition()
+        self._stopped = False
+
+        self._drift = deque(maxlen=drift_window)
+        self.events_fired = 0
+        self.events_cancelled = 0
+
+        self._thread = threading.Thread(target=self._run, name="animation-scheduler", daemon=True)
+        self._thread.start()
+
+    def schedule(self, session_id, duration, delay=0.0, on_start=None, on_stop=None):
+        """
+        Schedule an animation, replacing any animation already scheduled for the session.
+
+        Args:
+            session_id (str): Session (avatar) the animation belongs to
+            duration (float): Seconds the animation stays active (the measured audio length)
+            delay (float): Seconds from now until the animation starts
+            on_start (callable): Optional callback(session_id) run when it starts
+            on_stop (callable): Optional callback(session_id) run when it stops
+        """
+        start_at = self.clock() + max(0.0, delay)
+        with self._condition:
+            generation = next(self._sequence)
+            self._generations[session_id] = generation
+            self._sessions.setdefault(session_id, {"active": False, "pending_start": False,
+                                                   "started_at": None, "duration": 0.0})
+            heapq.heappush(self._heap, (start_at, next(self._sequence), "start", session_id, generation, duration, on_start))
+            heapq.heappush(self._heap, (start_at + duration, next(self._sequence), "stop", session_id, generation, duration, on_stop))
+            self._condition.notify()
+
+    def cancel(self, session_id):
+        """Cancel a session's scheduled animation and stop it if it is running"""
+        with self._condition:
+            # Queued events no longer match any generation and are skipped when due
+            if self._generations.pop(session_id, None) is not None:
+                self.events_cancelled += 1
+            self._sessions.pop(session_id, None)
+            self._condition.notify()
+
+    def consume_start(self, session_id):
+        """
+        Report whether the session's animation has started since the last call.
+        The flag is reset by this call, so each animation is reported once.
+        """
+        with self._condition:
+            state = self._sessions.get(session_id)
+            if not state or not state["pending_start"]:
+                return False
+            state["pending_start"] = False
+            return True
+
+    def is_active(self, session_id):
+        with self._condition:
+            state = self._sessions.get(session_id)
+            return bool(state and state["active"])
+
+    def elapsed(self, session_id):
+        """Seconds since the session's animation started (0 if it is not running)"""
+        with self._condition:
+            state = self._sessions.get(session_id)
+            if not state or not state["active"]:
+                return 0.0
+            return self.clock() - state["started_at"]
+
+    def get_stats(self):
+        with self._condition:
+            drift = sorted(self._drift)
+            active = sum(1 for state in self._sessions.values() if state["active"])
+            pending = len(self._heap)
+
+        def percentile(p):
+            return round(drift[min(len(drift) - 1, int(p * len(drift)))] * 1000, 3) if drift else 0.0
+
+        return {
+            "active_animations": active,
+            "queued_events": pending,
+            "events_fired": self.events_fired,
+            "events_cancelled": self.events_cancelled,
+            "drift_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": round(drift[-1] * 1000, 3) if drift else 0.0
+            },
+            "scheduler_threads": 1
+        }
+
+    def shutdown(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    wait = self._heap[0][0] - self.clock()
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                if self._stopped:
+                    return
+
+                due, _, kind, session_id, generation, duration, callback = heapq.heappop(self._heap)
+                if generation != self._generations.get(session_id):
+                    # Superseded by a newer schedule or cancelled
+                    continue
+
+                now = self.clock()
+                self._drift.append(now - due)
+                self.events_fired += 1
+
+                if kind == "start":
+                    self._sessions[session_id].update(active=True, pending_start=True, started_at=now, duration=duration)
+                else:
+                    # Finished: nothing is left to report for the session
+                    del self._generations[session_id]
+                    del self._sessions[session_id]
+
+            # Run callbacks outside the lock so they cannot stall the scheduler's bookkeeping
+            if callback:
+                try:
+                    callback(session_id)
+                except Exception as e:
+                    logger.error("Animation %s callback failed for session %s: %s", kind, session_id, e)
+            if kind == "stop":
+                logger.info("Animation automatically deactivated after %.2f seconds (session %s)", duration, session_id)
@@ -0,0 +1,214 @@
+import logging
+import os
+import json
+import time
+import hashlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash_name(data, prefix="responsekeyframes"):
+    """
+    Name a JSON artefact after its content, so identical outputs share one
+    file and different outputs can never collide.
+
+    Returns:
+        tuple: (file name, serialized bytes)
+    """
+    payload = json.dumps(data, indent=2).encode("utf-8")
+    digest = hashlib.sha256(payload).hexdigest()[:20]
+    return f"{prefix}-{digest}.json", payload
+
+
+class ArtifactStore:
+    """
+    Content-addressed store for generated artefacts in the output directory.
+
+    Every file is tracked with its size and last use. A background collector
+    removes files past max_age_seconds, then evicts the least recently used
+    ones until the directory is under max_bytes. Files pinned by an active
+    session are never removed.
+
+    Last use is the file's mtime and pins are files in PIN_DIR, so processes
+    sharing the directory (forked server workers) see each other's uses and
+    pins. Only one of them needs to run the collector.
+    """
+
+    PIN_DIR = ".pins"
+
+    def __init__(self, root, max_bytes=200 * 1024 * 1024, max_age_seconds=6 * 3600, pin_ttl_seconds=3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.pin_ttl_seconds = pin_ttl_seconds
+        self.pin_dir = os.path.join(root, self.PIN_DIR)
+
+        self.entries = {}   # name -> {"size", "last_used"}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._collector = None
+
+        os.makedirs(self.pin_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Rebuild the entries from the directory, including files other processes wrote"""
+        entries = {}
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith(".json") and not name.startswith(".") and os.path.isfile(path):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries[name] = {"size": stat.st_size, "last_used": stat.st_mtime}
+        self.entries = entries
+
+    def _mark_used(self, name, now):
+        try:
+            os.utime(os.path.join(self.root, name), (now, now))
+        except FileNotFoundError:
+            return False
+        self.entries.setdefault(name, {"size": 0})["last_used"] = now
+        return True
+
+    def _pin_path(self, session_id):
+        return os.path.join(self.pin_dir, hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:16])
+
+    def _read_pins(self, now):
+        """
+        Names pinned by any process. Pins older than pin_ttl_seconds are removed.
+
+        Returns:
+            set: Pinned file names
+        """
+        pinned = set()
+        for pin_name in os.listdir(self.pin_dir):
+            if pin_name.endswith(".tmp"):
+                continue
+            pin_path = os.path.join(self.pin_dir, pin_name)
+            try:
+                if now - os.stat(pin_path).st_mtime >= self.pin_ttl_seconds:
+                    os.remove(pin_path)
+                    continue
+                with open(pin_path, 'r') as f:
+                    pinned.add(f.read().strip())
+            except FileNotFoundError:
+                continue
+        return pinned
+
+    def put_json(self, data, prefix="responsekeyframes"):
+        """
+        Store a JSON document under its content hash.
+
+        Returns:
+            str: Path of the stored file
+        """
+        name, payload = content_hash_name(data, prefix)
+        path = os.path.join(self.root, name)
+        now = time.time()
+
+        with self._lock:
+            if not self._mark_used(name, now):
+                # Per-process temp name: forked server workers share the output directory
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(payload)
+                os.replace(temp_path, path)
+                self.entries[name] = {"size": len(payload), "last_used": now}
+        return path
+
+    def touch(self, path):
+        """Mark an artefact as used now"""
+        with self._lock:
+            self._mark_used(os.path.basename(path), time.time())
+
+    def pin(self, session_id, path):
+        """Protect an artefact while a session is using it (replaces the session's previous pin)"""
+        name = os.path.basename(path) if path else None
+        with self._lock:
+            if name and self._mark_used(name, time.time()):
+                temp_path = f"{self._pin_path(session_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, 'w') as f:
+                    f.write(name)
+                os.replace(temp_path, self._pin_path(session_id))
+            else:
+                self.unpin(session_id)
+
+    def unpin(self, session_id):
+        try:
+            os.remove(self._pin_path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def collect(self):
+        """
+        Evict expired and least-recently-used artefacts.
+
+        Returns:
+            list: Names of the evicted files
+        """
+        now = time.time()
+        evicted = []
+
+        with self._lock:
+            # Sessions that have gone quiet release their pins
+            self._scan()
+            pinned = self._read_pins(now)
+
+            candidates = sorted(
+                (name for name in self.entries if name not in pinned),
+                key=lambda name: self.entries[name]["last_used"]
+            )
+            total_bytes = sum(entry["size"] for entry in self.entries.values())
+
+            for name in candidates:
+                expired = now - self.entries[name]["last_used"] > self.max_age_seconds
+                if not expired and total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning("Error deleting %s: %s", name, e)
+                    continue
+                total_bytes -= self.entries.pop(name)["size"]
+                evicted.append(name)
+
+        if evicted:
+            logger.info("Evicted %s artefacts from %s", len(evicted), self.root)
+        return evicted
+
+    def get_stats(self):
+        with self._lock:
+            self._scan()
+            return {
+                "files": len(self.entries),
+                "bytes": sum(entry["size"] for entry in self.entries.values()),
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age_seconds,
+                "pinned_sessions": sum(1 for name in os.listdir(self.pin_dir) if not name.endswith(".tmp"))
+            }
+
+    def start_collector(self, interval_seconds=60):
+        """Run collect() periodically on a daemon thread"""
+        def run():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.collect()
+                except Exception as e:
+                    logger.error("Error during artefact collection: %s", e)
+
+        self._stop.clear()
+        self._collector = threading.Thread(target=run, name="artifact-gc", daemon=True)
+        self._collector.start()
+        return self._collector
+
+    def stop_collector(self):
+        """Stop the collector thread; start_collector can start it again (e.g. after a fork)"""
+        self._stop.set()
+        if self._collector is not None:
+            self._collector.join()
+            self._collector = None
@@ -0,0 +1,186 @@
+"""
+Whisper inference profiles for CPU-only nodes.
+
+A profile bundles how a model is loaded (dynamic int8 quantisation of the
+linear layers, torch thread count) with how it decodes (greedy or beam search,
+temperature fallback, FP16 off). Every call site picks its own profile, so the
+server's turn transcription and the keyframe word alignment can be tuned
+independently. Call sites that pass no profile get Whisper's unquantised
+defaults; the server opts in to 'cpu' for turn transcription only.
+
+Compare profiles on a local test set with:
+    python asr_benchmark.py <dir-or-manifest> --profiles default cpu
+"""
+import logging
+import os
+import wave
+import threading
+
+from memory_stats import track
+
+logger = logging.getLogger(__name__)
+
+# Whisper's fallback schedule when a decode looks unreliable
+FALLBACK_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+
+ASR_PROFILES = {
+    # Whisper's own defaults: FP32 on CPU (after the FP16 warning), temperature fallback,
+    # conditioning on previous text
+    "default": {
+        "quantize": False,
+        "options": {}
+    },
+
+    # int8 linear layers, greedy decoding for short utterances, no temperature fallback
+    "cpu": {
+        "quantize": True,
+        "greedy_below_seconds": 30.0,
+        "beam_size": 5,
+        "temperature_fallback": False,
+        "options": {"fp16": False, "condition_on_previous_text": False}
+    },
+
+    # As "cpu", but retries unreliable decodes at higher temperatures
+    "cpu_fallback": {
+        "quantize": True,
+        "greedy_below_seconds": 30.0,
+        "beam_size": 5,
+        "temperature_fallback": True,
+        "options": {"fp16": False, "condition_on_previous_text": False}
+    }
+}
+
+DEFAULT_ASR_PROFILE = os.environ.get("LIPRA_ASR_PROFILE", "default")
+
+# Loaded models are shared per (model name, quantised) within the process
+_models = {}
+_models_lock = threading.Lock()
+
+# A Whisper model is not safe to run from two threads at once (decoding
+# installs key/value cache hooks on the shared modules), so every inference
+# on a model goes through transcribe() and holds that model's lock
+_inference_locks = {}
+
+
+def get_asr_profile(name=None):
+    """Look up a profile by name (defaults to LIPRA_ASR_PROFILE, then 'default')"""
+    name = name or DEFAULT_ASR_PROFILE
+    if name not in ASR_PROFILES:
+        raise ValueError(f"Unknown ASR profile: {name}")
+    return ASR_PROFILES[name]
+
+
+def configure_threads():
+    """Apply LIPRA_ASR_THREADS to torch, if set"""
+    threads = os.environ.get("LIPRA_ASR_THREADS")
+    if threads:
+        import torch
+        torch.set_num_threads(int(threads))
+        torch.set_num_interop_threads(1)
+
+
+def quantize_model(model):
+    """
+    Dynamically quantise a Whisper model's linear layers to int8.
+
+    Whisper uses its own nn.Linear subclass (only to cast weights to the input
+    dtype), and quantize_dynamic matches exact module types, so those layers
+    are turned back into plain nn.Linear first. Inputs stay FP32 on CPU, so
+    the cast is not needed.
+    """
+    import torch
+
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_asr_model(name="tiny", profile=None):
+    """
+    Load a Whisper model once per process for the given profile.
+
+    Args:
+        name (str): Whisper model name, e.g. 'tiny' or 'tiny.en'
+        profile (str): ASR profile name (decides whether the model is quantised)
+
+    Returns:
+        whisper.Whisper: The (possibly quantised) model
+    """
+    quantize = get_asr_profile(profile).get("quantize", False)
+    key = (name, quantize)
+
+    with _models_lock:
+        if key not in _models:
+            import whisper
+            configure_threads()
+            logger.info("Loading Whisper model '%s'%s...", name, ' (int8 quantised)' if quantize else '')
+            with track(f"load:whisper:{name}{':int8' if quantize else ''}"):
+                model = whisper.load_model(name, device="cpu" if quantize else None)
+                if quantize:
+                    model = quantize_model(model.eval())
+            _models[key] = model
+        return _models[key]
+
+
+def audio_seconds(audio_path):
+    """Duration of a WAV file, or None if it cannot be read"""
+    try:
+        with wave.open(audio_path, 'rb') as f:
+            return f.getnframes() / float(f.getframerate())
+    except Exception:
+        return None
+
+
+def transcribe_options(profile=None, duration=None):
+    """
+    Decoding options for model.transcribe under a profile.
+
+    Args:
+        profile (str): ASR profile name
+        duration (float): Utterance length in seconds, if known
+
+    Returns:
+        dict: Keyword arguments for model.transcribe
+    """
+    settings = get_asr_profile(profile)
+    options = dict(settings["options"])
+
+    greedy_below = settings.get("greedy_below_seconds")
+    if greedy_below is not None:
+        if duration is None or duration <= greedy_below:
+            options.update(beam_size=None, best_of=None)
+        else:
+            options.update(beam_size=settings.get("beam_size", 5), best_of=None)
+
+    if "temperature_fallback" in settings:
+        options["temperature"] = FALLBACK_TEMPERATURES if settings["temperature_fallback"] else 0.0
+
+    return options
+
+
+def inference_lock(model):
+    """The lock serialising inference on a model"""
+    with _models_lock:
+        return _inference_locks.setdefault(id(model), threading.Lock())
+
+
+def transcribe(model, audio, profile=None, **overrides):
+    """
+    Run model.transcribe with a profile's decoding options, one call per model at a time.
+
+    Args:
+        model: Whisper model from load_asr_model
+        audio: Path of a WAV file, or float32 samples at 16 kHz
+        profile (str): ASR profile name
+        **overrides: Extra or replacement model.transcribe options
+
+    Returns:
+        dict: Whisper's transcription result
+    """
+    duration = audio_seconds(audio) if isinstance(audio, str) else len(audio) / 16000
+    options = transcribe_options(profile, duration)
+    options.update(overrides)
+    with inference_lock(model):
+        return model.transcribe(audio, **options)
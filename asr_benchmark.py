@@ -0,0 +1,145 @@
+"""
+Latency versus word error rate for the Whisper inference profiles.
+
+Runs every file of a local test set through each profile and reports load
+time, per-utterance latency, real-time factor and WER against the reference
+transcripts, plus the memory the model load and transcription cost (RSS
+growth, and tracemalloc peaks with --trace-memory).
+
+Usage:
+    python asr_benchmark.py <dir-or-manifest> [--model tiny.en] [--profiles default cpu]
+
+The test set uses the same layout as prebake.py: WAV files with sibling
+<name>.txt transcripts, or a JSON Lines manifest of {"audio", "transcript"}.
+Files without a transcript are skipped.
+"""
+import re
+import sys
+import json
+import time
+import argparse
+
+from asr import ASR_PROFILES, get_asr_profile, load_asr_model, transcribe, audio_seconds
+from memory_stats import track, memory_tracker
+from logging_setup import setup_logging
+from prebake import load_jobs
+
+
+def normalize_words(text):
+    """Lowercase words without punctuation, for WER scoring"""
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance (substitutions + insertions + deletions)"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current[j] = min(
+                previous[j] + 1,                              # deletion
+                current[j - 1] + 1,                           # insertion
+                previous[j - 1] + (ref_word != hyp_word)      # substitution
+            )
+        previous = current
+    return previous[-1]
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+def benchmark_profile(model_name, profile, jobs):
+    """
+    Transcribe every job with one profile.
+
+    Returns:
+        dict: Latency, real-time factor and WER summary for the profile
+    """
+    started = time.perf_counter()
+    model = load_asr_model(model_name, profile)
+    load_seconds = time.perf_counter() - started
+
+    # The first call pays one-off allocation costs; keep it out of the numbers
+    transcribe(model, jobs[0]["audio"], profile)
+
+    latencies = []
+    audio_total = 0.0
+    errors = 0
+    reference_words = 0
+    for job in jobs:
+        started = time.perf_counter()
+        with track(f"transcribe:{profile}"):
+            result = transcribe(model, job["audio"], profile)
+        latencies.append(time.perf_counter() - started)
+
+        audio_total += audio_seconds(job["audio"]) or 0.0
+        reference = normalize_words(job["transcript"])
+        errors += word_errors(reference, normalize_words(result["text"]))
+        reference_words += len(reference)
+
+    stats = memory_tracker.get_stats()
+    quantized = get_asr_profile(profile).get("quantize", False)
+    load = stats["components"].get(f"whisper:{model_name}{':int8' if quantized else ''}", {})
+    stage = stats["stages"].get(f"transcribe:{profile}", {})
+
+    return {
+        "profile": profile,
+        "files": len(jobs),
+        "load_seconds": round(load_seconds, 3),
+        "load_rss_mb": load.get("rss_delta_mb"),
+        "load_peak_alloc_mb": load.get("peak_alloc_mb"),
+        "transcribe_rss_delta_max_mb": stage.get("rss_delta_max_mb"),
+        "transcribe_peak_alloc_max_mb": stage.get("peak_alloc_max_mb"),
+        "latency_mean": round(sum(latencies) / len(latencies), 3),
+        "latency_p50": round(percentile(latencies, 0.50), 3),
+        "latency_p95": round(percentile(latencies, 0.95), 3),
+        "real_time_factor": round(sum(latencies) / audio_total, 3) if audio_total else 0.0,
+        "wer": round(errors / reference_words, 4) if reference_words else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Whisper inference profiles on a local test set")
+    parser.add_argument("source", help="Directory of WAV files with .txt transcripts, or a JSON Lines manifest")
+    parser.add_argument("--model", default="tiny.en", help="Whisper model name")
+    parser.add_argument("--profiles", nargs="+", default=list(ASR_PROFILES), help="Profiles to compare")
+    parser.add_argument("--report", default=None, help="Optional path for a JSON summary")
+    parser.add_argument("--trace-memory", action="store_true", help="Record tracemalloc allocation peaks (slower)")
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.trace_memory:
+        memory_tracker.start_tracing()
+
+    jobs = [job for job in load_jobs(args.source) if job["transcript"]]
+    if not jobs:
+        print(f"[ERROR] No transcribed audio files found in {args.source}")
+        return 1
+
+    results = []
+    for profile in args.profiles:
+        print(f"[INFO] Benchmarking profile '{profile}' on {len(jobs)} files...")
+        results.append(benchmark_profile(args.model, profile, jobs))
+
+    print(f"{'profile':<14}{'load s':>8}{'mean s':>9}{'p50 s':>8}{'p95 s':>8}{'RTF':>8}{'WER':>8}")
+    for r in results:
+        print(f"{r['profile']:<14}{r['load_seconds']:>8}{r['latency_mean']:>9}{r['latency_p50']:>8}"
+              f"{r['latency_p95']:>8}{r['real_time_factor']:>8}{r['wer']:>8}")
+
+    print(f"\n{'profile':<14}{'load RSS MB':>13}{'load peak MB':>14}{'run RSS MB':>12}{'run peak MB':>13}")
+    for r in results:
+        print(f"{r['profile']:<14}{str(r['load_rss_mb']):>13}{str(r['load_peak_alloc_mb']):>14}"
+              f"{str(r['transcribe_rss_delta_max_mb']):>12}{str(r['transcribe_peak_alloc_max_mb']):>13}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"model": args.model, "results": results, "memory": memory_tracker.get_stats()}, f, indent=2)
+        print(f"[INFO] Report saved to: {args.report}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import logging
+import os
+import time
+import struct
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# RIFF/data sizes used for a WAV whose final length is not known yet.
+# Players treat this as "read until the stream ends".
+STREAMING_SIZE = 0xFFFFFFFF
+
+
+def find_wav_data_offset(header):
+    """
+    Locate the data chunk in the first bytes of a WAV file.
+
+    Returns:
+        tuple: (offset of the data chunk's size field, offset of the first sample)
+               or None if the header is not complete yet
+    """
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+
+    offset = 12
+    while offset + 8 <= len(header):
+        chunk_id = header[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", header, offset + 4)[0]
+        if chunk_id == b"data":
+            return offset + 4, offset + 8
+        # Chunks are word aligned
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def streaming_wav_header(header):
+    """
+    Rewrite a WAV header so the RIFF and data sizes mark an open-ended stream.
+
+    Args:
+        header (bytes): The file's bytes up to (and including) the data chunk header
+
+    Returns:
+        bytes: Patched header
+    """
+    offsets = find_wav_data_offset(header)
+    if offsets is None:
+        return header
+    data_size_offset, _ = offsets
+
+    patched = bytearray(header)
+    struct.pack_into("<I", patched, 4, STREAMING_SIZE)
+    struct.pack_into("<I", patched, data_size_offset, STREAMING_SIZE)
+    return bytes(patched)
+
+
+def open_wav(path, completed_path=None):
+    """Open path, or completed_path if the finished file has already been moved there"""
+    for candidate in (path, completed_path):
+        if candidate:
+            try:
+                return open(candidate, "rb")
+            except FileNotFoundError:
+                pass
+    return None
+
+
+def iter_growing_wav(path, is_complete, chunk_size=16384, poll_interval=0.02, timeout=60.0, completed_path=None):
+    """
+    Stream a WAV file that is still being written.
+
+    The header is sent with open-ended sizes, then samples are sent as they
+    are appended, until is_complete() reports that the writer has finished
+    and everything on disk has been sent. The file is read through one open
+    handle, so it may be renamed once complete.
+
+    Args:
+        path (str): WAV file being written
+        is_complete (callable): Returns True once the writer has finished
+        chunk_size (int): Maximum bytes per chunk
+        poll_interval (float): Seconds to wait for more data
+        timeout (float): Give up if the file stops growing for this long
+        completed_path (str): Where the writer renames the file when it is done,
+            read instead if the file is gone before it was opened
+
+    Yields:
+        bytes: WAV data
+    """
+    # Wait for the file and a complete header to appear
+    deadline = time.time() + timeout
+    f = None
+    try:
+        while True:
+            # Checked before reading, as below: a header written just before completion is still found
+            finished = is_complete()
+            if f is None:
+                f = open_wav(path, completed_path if finished else None)
+            if f is not None:
+                f.seek(0)
+                header = f.read(4096)
+                offsets = find_wav_data_offset(header)
+                if offsets is not None:
+                    break
+            if finished:
+                # The writer is done and there is no valid WAV to send
+                return
+            if time.time() > deadline:
+                return
+            time.sleep(poll_interval)
+
+        _, data_start = offsets
+        yield streaming_wav_header(header[:data_start])
+
+        position = data_start
+        last_growth = time.time()
+        while True:
+            # Check completion before reading so the final bytes are never missed
+            finished = is_complete()
+            f.seek(position)
+            chunk = f.read(chunk_size)
+            if chunk:
+                # Keep whole 16-bit samples together
+                usable = len(chunk) - (len(chunk) % 2) if not finished else len(chunk)
+                if usable:
+                    position += usable
+                    last_growth = time.time()
+                    yield chunk[:usable]
+                    continue
+            if finished:
+                return
+            if time.time() - last_growth > timeout:
+                logger.warning("%s stopped growing, ending stream", path)
+                return
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+class WriteTracker:
+    """
+    Tracks which files are still being written, so a reader can tell a
+    growing file from a finished one. Each file has its own state: finishing
+    one reply does not mark another reply's file as complete.
+
+    A file may be written under a partial name and renamed onto its path
+    when complete; partial_path() tells readers which file is growing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._writers = {}   # path -> [number of open writes, partial path]
+
+    def begin(self, path, partial_path=None):
+        """Mark a file as being written (nested begins need as many ends)"""
+        path = os.path.abspath(path)
+        with self._lock:
+            writer = self._writers.setdefault(path, [0, path])
+            writer[0] += 1
+            if partial_path:
+                writer[1] = os.path.abspath(partial_path)
+
+    def end(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            writer = self._writers.get(path)
+            if writer:
+                writer[0] -= 1
+                if writer[0] <= 0:
+                    del self._writers[path]
+                    self._lock.notify_all()
+
+    @contextmanager
+    def writing(self, path, partial_path=None):
+        self.begin(path, partial_path)
+        try:
+            yield
+        finally:
+            self.end(path)
+
+    def is_writing(self, path):
+        with self._lock:
+            return os.path.abspath(path) in self._writers
+
+    def wait(self, path, timeout=None):
+        """
+        Block until nothing is writing path.
+
+        Returns:
+            bool: True once the file is complete, False on timeout
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            return self._lock.wait_for(lambda: path not in self._writers, timeout)
+
+    def partial_path(self, path):
+        """The file being written for path (path itself once nothing is being written)"""
+        path = os.path.abspath(path)
+        with self._lock:
+            writer = self._writers.get(path)
+            return writer[1] if writer else path
+
+    def completion(self, path):
+        """is_complete callable for iter_growing_wav"""
+        return lambda: not self.is_writing(path)
@@ -0,0 +1,130 @@
+import logging
+import os
+import re
+import json
+import hashlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Replies generate_response produces verbatim, rendered ahead of time by default
+DEFAULT_CANNED_PHRASES = [
+    "I'm sorry, I didn't catch that. Could you please repeat?",
+    "You don't have any reminders set up at the moment.",
+    "Sorry, I couldn't generate a response."
+]
+
+
+def normalize_phrase(text):
+    """Normalise text so trivially different replies share one rendering"""
+    return re.sub(r"\s+", " ", text.strip())
+
+
+def load_canned_phrases(path):
+    """
+    Load the phrase list from a JSON file (a list of strings), falling back
+    to DEFAULT_CANNED_PHRASES if the file does not exist.
+    """
+    if not path or not os.path.exists(path):
+        return list(DEFAULT_CANNED_PHRASES)
+    try:
+        with open(path, 'r') as f:
+            phrases = json.load(f)
+        return [p for p in phrases if isinstance(p, str) and p.strip()]
+    except Exception as e:
+        logger.error("Failed to load canned phrases from %s: %s", path, e)
+        return list(DEFAULT_CANNED_PHRASES)
+
+
+class CannedResponseCache:
+    """
+    Audio and keyframes for fixed replies, rendered once in the background
+    at startup and served without any synthesis at request time.
+    """
+
+    def __init__(self, cache_dir, render_audio, render_keyframes, get_duration, voice="en-com.au", keyframe_variant=""):
+        """
+        Args:
+            cache_dir (str): Where rendered assets are kept (persists across restarts)
+            render_audio (callable): (text, wav_path) -> wav_path or None
+            render_keyframes (callable): (wav_path, output_dir, output_name) -> json path or None
+            get_duration (callable): wav_path -> seconds
+            voice (str): Part of the cache key so a TTS voice change re-renders
+            keyframe_variant (str): Everything the keyframes depend on besides the audio
+                (frame rate, rig profile, generator version); a change re-renders them
+        """
+        self.cache_dir = cache_dir
+        self.render_audio = render_audio
+        self.render_keyframes = render_keyframes
+        self.get_duration = get_duration
+        self.voice = voice
+        self.keyframe_variant = keyframe_variant
+
+        self.entries = {}
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, text):
+        digest = hashlib.sha1(f"{self.voice}\n{normalize_phrase(text)}".encode("utf-8")).hexdigest()
+        return digest[:16]
+
+    def _keyframes_name(self, key):
+        digest = hashlib.sha1(self.keyframe_variant.encode("utf-8")).hexdigest()
+        return f"{key}-{digest[:8]}.json"
+
+    def get(self, text):
+        """
+        Return the prepared assets for a reply.
+
+        Returns:
+            dict: {'audio', 'keyframes', 'duration'} or None if the reply is not prepared
+        """
+        with self._lock:
+            return self.entries.get(self._key(text))
+
+    def render(self, text):
+        """Render one phrase, reusing assets left on disk by an earlier run"""
+        key = self._key(text)
+        audio_path = os.path.join(self.cache_dir, f"{key}.wav")
+        keyframes_name = self._keyframes_name(key)
+        keyframes_path = os.path.join(self.cache_dir, keyframes_name)
+
+        if not os.path.exists(keyframes_path):
+            # The audio depends only on voice and text, so it is kept across keyframe changes
+            if not os.path.exists(audio_path) and not self.render_audio(text, audio_path):
+                logger.warning("Could not render canned audio for: %s", text[:50])
+                return None
+            keyframes_path = self.render_keyframes(audio_path, self.cache_dir, keyframes_name)
+            if not keyframes_path:
+                logger.warning("Could not render canned keyframes for: %s", text[:50])
+                return None
+
+        entry = {
+            "audio": audio_path,
+            "keyframes": keyframes_path,
+            "duration": self.get_duration(audio_path)
+        }
+        with self._lock:
+            self.entries[key] = entry
+        return entry
+
+    def warm_up(self, phrases):
+        """Render every phrase; safe to call from a background thread"""
+        rendered = 0
+        for text in phrases:
+            try:
+                if self.render(text):
+                    rendered += 1
+            except Exception as e:
+                logger.error("Failed to warm up canned response '%s': %s", text[:50], e)
+        logger.info("Canned responses ready: %s/%s", rendered, len(phrases))
+        self.ready.set()
+        return rendered
+
+    def warm_up_async(self, phrases):
+        """Start warm_up on a daemon thread so server startup is not delayed"""
+        thread = threading.Thread(target=self.warm_up, args=(phrases,), name="canned-warmup", daemon=True)
+        thread.start()
+        return thread
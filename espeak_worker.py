@@ -0,0 +1,437 @@
+"""
+Persistent espeak phonemiser.
+
+Spawning espeak (and `which` to find it) for every phonemisation costs tens of
+milliseconds per call. Instead a small pool of long-lived `espeak --ipa -q`
+processes is fed words over pipes, one per line, so a batch is one write and
+one read per worker. Results are memoised per word, and the binary path is
+resolved once per process.
+
+Every item is followed by a sentinel word whose IPA the worker learns when it
+starts, and answers are read up to the next sentinel. An item that espeak
+answers with no line, or with several, therefore cannot shift later items
+onto the wrong IPA; a worker whose output stops making sense is restarted.
+
+espeak is run under `stdbuf -oL` where available so it flushes every line
+into the pipe. If the calibration sentinel still does not come back within
+CALIBRATION_TIMEOUT_SECONDS (espeak block-buffers its output), the pool stops
+starting workers for the rest of the process and runs one espeak per batch.
+
+Check the pool against the installed espeak with: python espeak_worker.py
+"""
+import logging
+import os
+import re
+import sys
+import time
+import queue
+import shutil
+import select
+import threading
+import subprocess
+from functools import lru_cache
+
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+ESPEAK_SEARCH_PATHS = [
+    "/opt/homebrew/bin/espeak",
+    "/usr/bin/espeak",
+    "/usr/local/bin/espeak",
+    "/usr/bin/espeak-ng",
+    "/usr/local/bin/espeak-ng"
+]
+
+# Words per pipe round-trip, small enough that espeak's stdout never fills the pipe
+BATCH_SIZE = 32
+
+# Sent after every item to delimit the answers (spelled out by espeak, so its
+# IPA cannot be mistaken for a real word's)
+SENTINEL_WORD = "zqxjk"
+
+# A worker that does not echo the sentinel this fast is not line buffered
+CALIBRATION_TIMEOUT_SECONDS = 0.5
+
+# IPA symbols that should stay together, longest first
+IPA_MULTI_CHAR = ['tʃ', 'dʒ', 'aɪ', 'eɪ', 'oʊ', 'əʊ', 'aʊ', 'ɔɪ', 'eə', 'ɪə', 'ʊə', 'ɜː', 'ər']
+
+IPA_VOWELS = set('aeiouəɑæɛɪɔʊʌɐɒɜɚ') | {'aɪ', 'eɪ', 'oʊ', 'əʊ', 'aʊ', 'ɔɪ', 'eə', 'ɪə', 'ʊə', 'ɜː', 'ər'}
+
+# espeak IPA -> the phoneme set produced by the CMU lexicon
+IPA_TO_PHONEME = {
+    'aɪ': 'ay', 'aʊ': 'aw', 'əʊ': 'oʊ', 'ɜː': 'ər', 'ɜ': 'ər', 'ɚ': 'ər',
+    'ʌ': 'ə', 'ɐ': 'ə', 'ɑ': 'a', 'ɒ': 'a', 'ɹ': 'r', 'ɡ': 'g', 'ɾ': 't',
+    'ɬ': 'l', 'ʔ': 't'
+}
+
+# Stress, length and tie marks that carry no mouth shape of their own
+IPA_MARKS = re.compile(r"[ˈˌːˑ‿͡.]")
+
+
+@lru_cache(maxsize=1)
+def resolve_espeak_path():
+    """Find the espeak binary once per process, without spawning `which`"""
+    for name in ("espeak", "espeak-ng"):
+        path = shutil.which(name)
+        if path:
+            return path
+
+    for path in ESPEAK_SEARCH_PATHS:
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+@lru_cache(maxsize=1)
+def resolve_stdbuf_path():
+    """coreutils stdbuf, used to make espeak line buffered (None if not installed)"""
+    return shutil.which("stdbuf")
+
+
+def clean_word(word):
+    """Strip a word down to what espeak should read (letters and apostrophes)"""
+    return re.sub(r"[^a-z']", "", word.lower().encode("ascii", "ignore").decode())
+
+
+def ipa_to_syllables(ipa):
+    """
+    Split an espeak IPA transcription of one word into syllables of mapped phonemes,
+    using the same vowel-nucleus rule as the CMU lexicon.
+    """
+    ipa = ipa.strip()
+    phonemes = []
+    i = 0
+    while i < len(ipa):
+        for symbol in IPA_MULTI_CHAR:
+            if ipa.startswith(symbol, i):
+                phonemes.append(symbol)
+                i += len(symbol)
+                break
+        else:
+            char = ipa[i]
+            i += 1
+            if IPA_MARKS.match(char) or char.isspace() or char == '-':
+                continue
+            phonemes.append(char)
+
+    syllables = []
+    current_syllable = []
+    for phoneme in phonemes:
+        bare = IPA_MARKS.sub("", phoneme)
+        if not bare:
+            continue
+        current_syllable.append(IPA_TO_PHONEME.get(bare, bare))
+        if bare in IPA_VOWELS and len(current_syllable) > 1:
+            syllables.append(current_syllable)
+            current_syllable = []
+
+    if current_syllable:
+        if syllables:
+            syllables[-1].extend(current_syllable)
+        else:
+            syllables.append(current_syllable)
+
+    return syllables
+
+
+class EspeakProtocolError(RuntimeError):
+    """espeak's output no longer lines up with what was sent"""
+
+
+def split_answers(lines, sentinel_ipa, count):
+    """
+    Group espeak output lines into one answer per item.
+
+    Args:
+        lines (list): Non-empty output lines, starting after the calibration sentinel
+        sentinel_ipa (str): espeak's IPA for SENTINEL_WORD
+        count (int): Number of items sent
+
+    Returns:
+        list: IPA string per item ('' if espeak printed nothing for it)
+    """
+    answers = []
+    current = []
+    for line in lines:
+        if line == sentinel_ipa or line.endswith(" " + sentinel_ipa):
+            # A sentinel on the same line as the item's answer is tolerated
+            current.append(line[:-len(sentinel_ipa)].strip())
+            answers.append(" ".join(part for part in current if part))
+            current = []
+        else:
+            current.append(line)
+    if len(answers) != count or current:
+        raise EspeakProtocolError(f"expected {count} answers, got {len(answers)} (+{len(current)} stray lines)")
+    return answers
+
+
+class EspeakWorker:
+    """A single long-lived espeak process reading words line by line."""
+
+    def __init__(self, espeak_path, timeout=2.0):
+        self.espeak_path = espeak_path
+        self.timeout = timeout
+        self.process = None
+        self.sentinel_ipa = None
+        self._buffer = b""
+
+    def start(self):
+        """
+        Start espeak and learn its sentinel IPA.
+
+        Raises:
+            TimeoutError: If the sentinel does not come back within CALIBRATION_TIMEOUT_SECONDS
+        """
+        command = [self.espeak_path, "--ipa", "-q"]
+        stdbuf_path = resolve_stdbuf_path()
+        if stdbuf_path:
+            command = [stdbuf_path, "-oL"] + command
+        self.process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0
+        )
+        self._buffer = b""
+
+        # Learn how this espeak writes the sentinel
+        self.process.stdin.write(f"{SENTINEL_WORD}.\n".encode("ascii"))
+        self.process.stdin.flush()
+        try:
+            self.sentinel_ipa = self._readline(CALIBRATION_TIMEOUT_SECONDS)
+        except (TimeoutError, EOFError):
+            self.stop()
+            raise
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1.0)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.process = None
+
+    def _readline(self, timeout=None):
+        """Read one non-empty output line, or raise TimeoutError"""
+        fd = self.process.stdout.fileno()
+        while True:
+            newline = self._buffer.find(b"\n")
+            if newline >= 0:
+                line, self._buffer = self._buffer[:newline], self._buffer[newline + 1:]
+                line = line.decode("utf-8", "replace").strip()
+                if line:
+                    return line
+                continue
+
+            ready, _, _ = select.select([fd], [], [], self.timeout if timeout is None else timeout)
+            if not ready:
+                raise TimeoutError("espeak did not answer in time")
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                raise EOFError("espeak exited")
+            self._buffer += chunk
+
+    def phonemise(self, items):
+        """
+        Phonemise a batch of clean words (or single-line sentences).
+
+        Returns:
+            list: IPA string per item, in order
+
+        Raises:
+            EspeakProtocolError: If the output does not line up with the sentinels
+        """
+        if not self.alive():
+            self.start()
+
+        # The trailing full stop makes espeak finish the clause for each line
+        payload = "".join(f"{item}.\n{SENTINEL_WORD}.\n" for item in items).encode("ascii")
+        self.process.stdin.write(payload)
+        self.process.stdin.flush()
+
+        lines = []
+        sentinels = 0
+        while sentinels < len(items):
+            line = self._readline()
+            lines.append(line)
+            if line == self.sentinel_ipa or line.endswith(" " + self.sentinel_ipa):
+                sentinels += 1
+        if self._buffer.strip():
+            raise EspeakProtocolError("espeak printed more than was asked for")
+        return split_answers(lines, self.sentinel_ipa, len(items))
+
+
+class EspeakPool:
+    """Small pool of espeak workers with a per-word memo shared by all of them."""
+
+    def __init__(self, size=2, espeak_path=None, timeout=2.0, max_cache_size=50000):
+        self.espeak_path = espeak_path or resolve_espeak_path()
+        self.max_cache_size = max_cache_size
+        self.cache = {}
+        self._cache_lock = threading.Lock()
+
+        # Cleared when espeak turns out not to answer line by line
+        self.persistent = True
+        self._workers = queue.Queue()
+        if self.espeak_path:
+            for _ in range(size):
+                self._workers.put(EspeakWorker(self.espeak_path, timeout=timeout))
+
+    @property
+    def available(self):
+        return self.espeak_path is not None
+
+    def _one_shot(self, items):
+        """Fallback: phonemise a whole batch with a single espeak invocation"""
+        result = subprocess.run(
+            [self.espeak_path, "--ipa", "-q", "--stdin"],
+            input=f"{SENTINEL_WORD}.\n" + "".join(f"{item}.\n{SENTINEL_WORD}.\n" for item in items),
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+        lines = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+        if result.returncode != 0 or not lines:
+            raise RuntimeError(f"espeak batch failed: {result.stderr.strip()}")
+        return split_answers(lines[1:], lines[0], len(items))
+
+    def _run_batch(self, worker, batch):
+        """Phonemise one batch on a worker, restarting it and falling back to one-shot on failure"""
+        if self.persistent and not worker.alive():
+            try:
+                worker.start()
+            except (OSError, TimeoutError, EOFError) as e:
+                # Waiting out the timeout on every call would be slower than one-shot
+                logger.warning("espeak does not answer line by line (%s), using one espeak per batch", e)
+                self.persistent = False
+        if self.persistent:
+            try:
+                return worker.phonemise(batch)
+            except (OSError, TimeoutError, EOFError, EspeakProtocolError) as e:
+                logger.warning("espeak worker failed (%s), restarting it", e)
+                worker.stop()
+        try:
+            return self._one_shot(batch)
+        except (OSError, RuntimeError, subprocess.TimeoutExpired) as e:
+            logger.error("espeak fallback failed: %s", e)
+            return None
+
+    def phonemise_text(self, text):
+        """
+        Phonemise running text in one piece, so espeak sees the sentence context
+        (stress, weak forms) it loses when words are sent one by one.
+
+        Returns:
+            str: IPA for the text, or None on failure
+        """
+        text = " ".join(text.split())
+        if not self.available or not text:
+            return None
+        worker = self._workers.get()
+        try:
+            ipa = self._run_batch(worker, [text])
+        finally:
+            self._workers.put(worker)
+        return ipa[0] if ipa else None
+
+    def phonemise(self, words):
+        """
+        Phonemise words, reusing memoised results.
+
+        Args:
+            words (list): Words in any case, punctuation is stripped
+
+        Returns:
+            dict: clean word -> IPA string (words espeak could not handle are omitted)
+        """
+        if not self.available:
+            return {}
+
+        cleaned = [clean_word(word) for word in words]
+        with self._cache_lock:
+            results = {word: self.cache[word] for word in cleaned if word in self.cache}
+        missing = list(dict.fromkeys(word for word in cleaned if word and word != SENTINEL_WORD and word not in results))
+        if not missing:
+            return results
+
+        worker = self._workers.get()
+        try:
+            for i in range(0, len(missing), BATCH_SIZE):
+                batch = missing[i:i + BATCH_SIZE]
+                ipa = self._run_batch(worker, batch)
+                if ipa is not None:
+                    results.update((word, answer) for word, answer in zip(batch, ipa) if answer)
+        finally:
+            self._workers.put(worker)
+
+        with self._cache_lock:
+            if len(self.cache) > self.max_cache_size:
+                self.cache.clear()
+            self.cache.update((word, results[word]) for word in missing if word in results)
+
+        return results
+
+    def close(self):
+        while not self._workers.empty():
+            self._workers.get_nowait().stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_espeak_pool():
+    """Return the process-wide espeak pool, starting workers lazily on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = EspeakPool(size=int(os.environ.get("LIPRA_ESPEAK_WORKERS", "2")))
+    return _pool
+
+
+def main():
+    """
+    Time the persistent pool against one-shot espeak on the installed binary.
+
+    The second call reuses a started worker, so it must beat spawning espeak;
+    if espeak is not line buffered the pool has fallen back and this fails.
+    """
+    setup_logging()
+    words = sys.argv[1:] or ["hello", "there", "how", "are", "you", "feeling", "today"]
+    pool = EspeakPool(size=1)
+    if not pool.available:
+        logger.error("espeak not found")
+        return 2
+
+    try:
+        timings = []
+        for attempt in range(2):
+            started = time.perf_counter()
+            # Fresh words each time, so the memo does not answer the second call
+            result = pool.phonemise([f"{word}{'s' * attempt}" for word in words])
+            timings.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        pool._one_shot([clean_word(word) for word in words])
+        one_shot = time.perf_counter() - started
+    finally:
+        pool.close()
+
+    print(f"first call {timings[0] * 1000:.1f} ms, second call {timings[1] * 1000:.1f} ms, "
+          f"one-shot {one_shot * 1000:.1f} ms ({len(result)}/{len(words)} words)")
+    if not pool.persistent or timings[1] >= one_shot:
+        logger.error("Persistent espeak workers are not faster than one-shot espeak")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
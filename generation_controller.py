@@ -0,0 +1,216 @@
+import logging
+import re
+import time
+import threading
+
+from jobs import JobCancelled, check_cancelled
+
+logger = logging.getLogger(__name__)
+
+# Sentence-final punctuation (optionally followed by closing quotes/brackets) and whitespace
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*(?=\s)')
+
+# Abbreviations whose trailing period does not end a sentence
+ABBREVIATIONS = {"dr", "mr", "mrs", "ms", "st", "vs", "e.g", "i.e", "approx"}
+
+# Empty reasoning block; as an assistant prefill it makes deepseek-r1 answer directly
+THINK_PREFILL = "<think>\n\n</think>\n\n"
+
+# Stops for the answer phase (the model only needs a couple of sentences)
+DEFAULT_STOP = ["\n\n", "\nUser:", "\nPatient:"]
+
+
+def split_complete_sentences(text):
+    """
+    Split text into the sentences that are already complete.
+
+    Returns:
+        tuple: (list of complete sentences, remaining incomplete text)
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        words = text[start:match.start()].split()
+        if match.group().startswith('.') and words and words[-1].lower().strip('(') in ABBREVIATIONS:
+            continue
+        sentences.append(text[start:match.end()].strip())
+        start = match.end()
+    return [s for s in sentences if s], text[start:]
+
+
+class GenerationController:
+    """
+    Streams a reply from the LLM and stops as soon as it is usable.
+
+    deepseek-r1 would otherwise spend most of its tokens on a <think> block
+    that is thrown away. By default reasoning is switched off (Ollama's think
+    option, or an empty <think></think> prefill on backends without it). With
+    think_budget_tokens > 0 the model may reason for that many tokens before
+    the block is closed for it. The answer is capped with num_predict and stop
+    sequences, and the stream is closed once max_sentences sentences are
+    complete, which makes the backend stop generating.
+    """
+
+    def __init__(self, backend, max_sentences=2, num_predict=120, stop=None, think_budget_tokens=0, temperature=None):
+        """
+        Args:
+            backend (LLMBackend): Client used for the chat calls
+            max_sentences (int): Complete sentences after which generation is aborted
+            num_predict (int): Token limit for the answer
+            stop (list): Stop sequences for the answer (defaults to DEFAULT_STOP)
+            think_budget_tokens (int): Reasoning tokens allowed (0 suppresses reasoning)
+            temperature (float): Optional sampling temperature
+        """
+        self.backend = backend
+        self.max_sentences = max_sentences
+        self.num_predict = num_predict
+        self.stop = DEFAULT_STOP if stop is None else stop
+        self.think_budget_tokens = think_budget_tokens
+        self.temperature = temperature
+
+        # Whether the backend understands the think option (None until known)
+        self.think_option_supported = None
+
+        self._lock = threading.Lock()
+        self.stats = {"replies": 0, "early_stops": 0, "think_cutoffs": 0,
+                      "tokens": 0, "seconds": 0.0}
+
+    def options(self, answer_only=True, num_predict=None):
+        options = {"num_predict": num_predict or self.num_predict}
+        if answer_only and self.stop:
+            options["stop"] = list(self.stop)
+        if self.temperature is not None:
+            options["temperature"] = self.temperature
+        return options
+
+    def generate(self, messages):
+        """
+        Generate a reply of at most max_sentences sentences.
+
+        Args:
+            messages (list): Chat messages (system + user)
+
+        Returns:
+            str: The reply text
+        """
+        started = time.perf_counter()
+        reasoning = self.think_budget_tokens > 0
+
+        if self.think_option_supported is not False:
+            try:
+                reply, tokens, early = self._run(
+                    messages, think=reasoning,
+                    options=self.options(answer_only=not reasoning, num_predict=self.num_predict + self.think_budget_tokens)
+                )
+                self.think_option_supported = True
+                return self._record(reply, tokens, early, started)
+            except JobCancelled:
+                raise
+            except _InlineThinking:
+                # Backend ignored the option and is reasoning inline; don't offer it again
+                self.think_option_supported = False
+            except Exception as e:
+                if not isinstance(e, TypeError) and "think" not in str(e).lower():
+                    raise
+                logger.warning("LLM backend does not support the think option (%s), using a prefill instead", e)
+                self.think_option_supported = False
+
+        if reasoning:
+            reply, tokens, early = self._run(messages, options=self.options(answer_only=False, num_predict=self.num_predict + self.think_budget_tokens))
+        else:
+            reply, tokens, early = self._run(messages, prefill=THINK_PREFILL, options=self.options())
+        return self._record(reply, tokens, early, started)
+
+    def _run(self, messages, prefill=None, think=None, options=None):
+        """
+        Stream one reply, enforcing the reasoning budget and the sentence limit.
+
+        Returns:
+            tuple: (reply, chunks received, whether generation was cut short)
+        """
+        request = list(messages)
+        if prefill:
+            request.append({"role": "assistant", "content": prefill})
+
+        kwargs = {"stream": True, "options": options or self.options()}
+        if think is not None:
+            kwargs["think"] = think
+
+        stream = self.backend.chat(request, **kwargs)
+        thinking = []
+        answer = ""
+        tokens = 0
+        in_think = False
+        try:
+            for chunk in stream:
+                # A barge-in aborts here, and closing the stream stops the backend
+                check_cancelled("llm")
+                message = chunk.get("message") or {}
+                tokens += 1
+
+                # Reasoning reported separately by backends that support the think option
+                if message.get("thinking"):
+                    thinking.append(message["thinking"])
+                    if len(thinking) > self.think_budget_tokens:
+                        return self._close_thinking(messages, thinking, tokens)
+                    continue
+
+                text = message.get("content") or ""
+                # Reasoning inline in the content (prefill-less fallback or older backends)
+                if "<think>" in text:
+                    if think is False:
+                        raise _InlineThinking()
+                    in_think = True
+                    text = text.split("<think>", 1)[1]
+                if in_think:
+                    if "</think>" not in text:
+                        thinking.append(text)
+                        if len(thinking) > self.think_budget_tokens:
+                            return self._close_thinking(messages, thinking, tokens)
+                        continue
+                    in_think = False
+                    before, text = text.split("</think>", 1)
+                    thinking.append(before)
+                    answer = ""
+
+                answer += text
+                sentences, _ = split_complete_sentences(answer)
+                if len(sentences) >= self.max_sentences:
+                    return " ".join(sentences[:self.max_sentences]), tokens, True
+        finally:
+            # Closing the stream drops the connection, which stops generation on the backend
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+        return answer.strip(), tokens, False
+
+    def _close_thinking(self, messages, thinking, tokens):
+        """Reasoning budget spent: close the <think> block and ask for the answer"""
+        with self._lock:
+            self.stats["think_cutoffs"] += 1
+        prefill = "<think>\n" + "".join(thinking).strip() + "\n</think>\n\n"
+        reply, answer_tokens, early = self._run(messages, prefill=prefill, options=self.options())
+        return reply, tokens + answer_tokens, True
+
+    def _record(self, reply, tokens, early, started):
+        with self._lock:
+            self.stats["replies"] += 1
+            self.stats["tokens"] += tokens
+            self.stats["seconds"] += time.perf_counter() - started
+            if early:
+                self.stats["early_stops"] += 1
+        return reply
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        replies = stats["replies"] or 1
+        stats["mean_tokens"] = round(stats["tokens"] / replies, 1)
+        stats["mean_seconds"] = round(stats.pop("seconds") / replies, 3)
+        stats["think_option_supported"] = self.think_option_supported
+        return stats
+
+
+class _InlineThinking(Exception):
+    """The backend produced a <think> block although reasoning was switched off"""
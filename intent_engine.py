@@ -0,0 +1,282 @@
+import logging
+import re
+import threading
+import datetime
+
+logger = logging.getLogger(__name__)
+
+# Phrases that turn a structured question into one that needs medical judgement
+# (e.g. "can I stop taking my medications?", "my allergy is flaring up"). These
+# always go to the LLM. "can you tell me ..." is a request, not a judgement call.
+JUDGEMENT_PATTERN = re.compile(
+    r"\b(?:should|(?:can|could|may)\s+(?:i|we)|is\s+it\s+(?:ok|okay|safe|normal)|why|side\s+effects?|"
+    r"stop|skip|miss(?:ed)?|double|instead|interact|mix|pain|hurt|worse|dizzy|bleed|"
+    r"feel(?:s|ing)?|tired|sick|nause(?:a|ous)|heal(?:s|ing)?|flar(?:e|es|ed|ing)|swell(?:ing)?|swollen|"
+    r"itch(?:y|ing)?|rash|fever|sore|ache|aching|recover(?:y|ing)?)\b",
+    re.IGNORECASE
+)
+
+# Requests to change the record ("can you move my appointment?") need the LLM
+# just like judgement calls: a template can only read the data back
+CHANGE_REQUEST_PATTERN = re.compile(
+    r"\b(?:move|cancel|change|reschedul(?:e|ed|ing)|postpone|push\s+back|book|add|remove|update|stop)\b",
+    re.IGNORECASE
+)
+
+# Utterances that ask for the data ("what ...", "tell me ...", "can you list ...")
+QUESTION_PATTERN = re.compile(
+    r"^(?:(?:can|could|would)\s+you\s+)?(?:please\s+)?"
+    r"(?:what|which|when|who|list|tell\s+me|show\s+me|remind\s+me|read\s+(?:me\s+)?|"
+    r"do\s+i|did\s+i|have\s+i|am\s+i|is\s+there|are\s+there)\b",
+    re.IGNORECASE
+)
+
+# A keyword alone ("... my medications ...") is below the default threshold;
+# it is only answered from a template when the utterance asks for the data
+KEYWORD_CONFIDENCE = 0.6
+KEYWORD_QUESTION_CONFIDENCE = 0.85
+
+# Intent name -> list of (pattern, base confidence).
+# Patterns anchored to the whole utterance score higher than keyword matches.
+INTENT_PATTERNS = {
+    "medications": [
+        (r"^(?:what|which)\s+(?:medications?|meds|medicines?|pills|drugs)\s+(?:am\s+i|do\s+i|should\s+i\s+be)\s+(?:on|taking|take)\b.*$", 0.95),
+        (r"^(?:what\s+are|list|tell\s+me|show\s+me)\s+(?:all\s+)?(?:my|the)\s+(?:current\s+)?(?:medications?|meds|medicines?|prescriptions?)\b.*$", 0.95),
+        (r"\b(?:my|current)\s+(?:medications?|meds|medicines?|prescriptions?)\b", KEYWORD_CONFIDENCE),
+    ],
+    "allergies": [
+        (r"^(?:what\s+are|list|tell\s+me)\s+(?:all\s+)?(?:my|the)\s+allerg(?:y|ies)\b.*$", 0.95),
+        (r"^(?:what\s+am\s+i|am\s+i)\s+allergic\s+to\b.*$", 0.95),
+        (r"^(?:do\s+i\s+have\s+(?:any\s+)?allerg(?:y|ies))\b.*$", 0.95),
+        (r"\bmy\s+allerg(?:y|ies)\b", KEYWORD_CONFIDENCE),
+    ],
+    "next_appointment": [
+        (r"^(?:when|what\s+day|what\s+date)\s+(?:is|'s)\s+my\s+next\s+(?:appointment|visit|check\s*-?up)\b.*$", 0.95),
+        (r"^(?:do\s+i\s+have\s+(?:an?\s+)?(?:upcoming|next)\s+(?:appointment|visit))\b.*$", 0.9),
+        (r"\bnext\s+(?:appointment|visit)\b", KEYWORD_CONFIDENCE),
+    ],
+    "last_checkup": [
+        (r"^(?:when|what\s+day|what\s+date)\s+(?:was|is)\s+my\s+last\s+(?:check\s*-?up|appointment|visit)\b.*$", 0.95),
+        (r"\blast\s+(?:check\s*-?up|appointment|visit)\b", KEYWORD_CONFIDENCE),
+    ],
+    "conditions": [
+        (r"^(?:what\s+(?:are|were)|list|tell\s+me)\s+(?:all\s+)?(?:my|the)\s+(?:medical\s+)?(?:conditions|diagnos[ie]s|health\s+problems)\b.*$", 0.95),
+        (r"^what\s+(?:conditions|health\s+problems)\s+do\s+i\s+have\b.*$", 0.95),
+        (r"\bmy\s+(?:medical\s+)?(?:conditions|diagnos[ie]s)\b", KEYWORD_CONFIDENCE),
+    ],
+    "procedures": [
+        (r"^(?:when|what)\s+(?:was|were|is)\s+my\s+(?:surgery|operation|procedure)\b.*$", 0.95),
+        (r"^who\s+(?:did|performed)\s+my\s+(?:surgery|operation|procedure)\b.*$", 0.95),
+        (r"\bmy\s+(?:recent\s+)?(?:surgery|operation|procedures?)\b", KEYWORD_CONFIDENCE),
+    ],
+}
+
+# Asking about the dose or timing of one medication by name ("when do I take my metformin?")
+MEDICATION_DETAIL_PATTERN = re.compile(
+    r"\b(?:when|what\s+time|how\s+(?:much|often|many)|dos(?:e|es|age))\b",
+    re.IGNORECASE
+)
+
+# Asking what one medication is for ("what is metformin for?", "what does aspirin do?")
+MEDICATION_PURPOSE_PATTERN = re.compile(
+    r"\bwhat\s+(?:is|'s|are)\b.*\bfor\b|\bwhat\s+(?:does|do)\b.*\bdo\b",
+    re.IGNORECASE
+)
+
+
+def format_date(value):
+    """Turn an ISO date from the patient history into something Sophia can say"""
+    try:
+        date = datetime.date.fromisoformat(value)
+        return f"{date.strftime('%B')} {date.day}, {date.year}"
+    except (TypeError, ValueError):
+        return value
+
+
+def join_items(items):
+    """Join items into a spoken list: 'a', 'a and b', 'a, b and c'"""
+    items = list(items)
+    if not items:
+        return ""
+    if len(items) == 1:
+        return items[0]
+    return f"{', '.join(items[:-1])} and {items[-1]}"
+
+
+class IntentEngine:
+    """
+    Answers structured questions about the patient directly from
+    patient_history.json, so generate_response can skip the LLM for them.
+    """
+
+    def __init__(self, min_confidence=0.75):
+        self.min_confidence = min_confidence
+
+        # Compile every pattern once up front
+        self.intents = {
+            name: [(re.compile(pattern, re.IGNORECASE), confidence) for pattern, confidence in patterns]
+            for name, patterns in INTENT_PATTERNS.items()
+        }
+
+        self.templates = {
+            "medications": self._answer_medications,
+            "medication_detail": self._answer_medication_detail,
+            "medication_purpose": self._answer_medication_purpose,
+            "allergies": self._answer_allergies,
+            "next_appointment": self._answer_next_appointment,
+            "last_checkup": self._answer_last_checkup,
+            "conditions": self._answer_conditions,
+            "procedures": self._answer_procedures,
+        }
+
+        # Hit-rate statistics
+        self._lock = threading.Lock()
+        self.total_queries = 0
+        self.hits = 0
+        self.low_confidence = 0
+        self.intent_hits = {name: 0 for name in self.templates}
+
+    def match(self, transcript, patient_history=None):
+        """
+        Classify a transcript.
+
+        Returns:
+            tuple: (intent_name, confidence) or (None, 0.0) if nothing matched
+        """
+        text = transcript.strip().rstrip(".?!").strip()
+        if not text:
+            return None, 0.0
+
+        best_intent, best_confidence = None, 0.0
+
+        # A named medication beats the generic medication list
+        if patient_history:
+            medication = self._find_medication(text, patient_history)
+            if medication and MEDICATION_DETAIL_PATTERN.search(text):
+                best_intent, best_confidence = "medication_detail", 0.9
+            elif medication and MEDICATION_PURPOSE_PATTERN.search(text):
+                best_intent, best_confidence = "medication_purpose", 0.9
+
+        for name, patterns in self.intents.items():
+            for pattern, confidence in patterns:
+                if confidence > best_confidence and pattern.search(text):
+                    best_intent, best_confidence = name, confidence
+
+        # Keyword matches only count when the user is asking for the data (a
+        # trailing "?" is not enough: "my appointment is Friday, can you move it?")
+        if best_confidence == KEYWORD_CONFIDENCE and QUESTION_PATTERN.search(text):
+            best_confidence = KEYWORD_QUESTION_CONFIDENCE
+
+        # Questions that need judgement, and requests to change the record,
+        # should not be answered from a template
+        if best_intent and (JUDGEMENT_PATTERN.search(text) or CHANGE_REQUEST_PATTERN.search(text)):
+            best_confidence *= 0.5
+
+        # Long utterances usually carry more than the structured question
+        if best_intent and len(text.split()) > 10:
+            best_confidence *= 0.85
+
+        return best_intent, best_confidence
+
+    def answer(self, transcript, patient_history):
+        """
+        Answer a transcript from templates if it is a confident structured query.
+
+        Returns:
+            str: The response text, or None if the LLM should handle it
+        """
+        intent, confidence = self.match(transcript, patient_history)
+
+        response = None
+        if intent and confidence >= self.min_confidence and patient_history:
+            try:
+                response = self.templates[intent](transcript, patient_history)
+            except (KeyError, IndexError, TypeError) as e:
+                logger.warning("Intent template '%s' failed: %s", intent, e)
+                response = None
+
+        with self._lock:
+            self.total_queries += 1
+            if response:
+                self.hits += 1
+                self.intent_hits[intent] += 1
+            elif intent:
+                self.low_confidence += 1
+
+        if response:
+            logger.info("Answered '%s' from patient history (confidence %.2f)", intent, confidence)
+        return response
+
+    def get_stats(self):
+        """Return a snapshot of the hit-rate statistics"""
+        with self._lock:
+            return {
+                "total_queries": self.total_queries,
+                "hits": self.hits,
+                "misses": self.total_queries - self.hits,
+                "low_confidence": self.low_confidence,
+                "hit_rate": round(self.hits / self.total_queries, 3) if self.total_queries else 0.0,
+                "intent_hits": dict(self.intent_hits),
+                "min_confidence": self.min_confidence
+            }
+
+    def _find_medication(self, text, patient_history):
+        lowered = text.lower()
+        for medication in patient_history.get("medications", []):
+            name = medication.get("name", "")
+            if name and re.search(rf"\b{re.escape(name.lower())}\b", lowered):
+                return medication
+        return None
+
+    def _answer_medications(self, transcript, patient_history):
+        medications = patient_history.get("medications", [])
+        if not medications:
+            return "You don't have any medications on record at the moment."
+        items = [f"{m['name']} {m['dosage']} {m['frequency']}" for m in medications]
+        return f"You're currently taking {join_items(items)}."
+
+    def _answer_medication_detail(self, transcript, patient_history):
+        medication = self._find_medication(transcript, patient_history)
+        if not medication:
+            return None
+        return f"You take {medication['name']} {medication['dosage']} {medication['frequency']}, {medication['schedule']}."
+
+    def _answer_medication_purpose(self, transcript, patient_history):
+        medication = self._find_medication(transcript, patient_history)
+        # Without a recorded purpose the LLM answers
+        if not medication or not medication.get("purpose"):
+            return None
+        purpose = medication["purpose"][0].lower() + medication["purpose"][1:]
+        return f"Your records list the purpose of {medication['name']} as {purpose}."
+
+    def _answer_allergies(self, transcript, patient_history):
+        allergies = patient_history.get("allergies", [])
+        if not allergies:
+            return "You don't have any allergies on record."
+        return f"You're allergic to {join_items(allergies)}, so we'll always steer clear of that."
+
+    def _answer_next_appointment(self, transcript, patient_history):
+        appointment = patient_history.get("next_appointment")
+        if not appointment:
+            return "You don't have an upcoming appointment on record at the moment."
+        return f"Your next appointment is on {format_date(appointment)}."
+
+    def _answer_last_checkup(self, transcript, patient_history):
+        checkup = patient_history.get("last_checkup")
+        if not checkup:
+            return "I don't have a record of your last checkup."
+        return f"Your last checkup was on {format_date(checkup)}."
+
+    def _answer_conditions(self, transcript, patient_history):
+        conditions = patient_history.get("medical_history", {}).get("conditions", [])
+        if not conditions:
+            return "You don't have any conditions on record."
+        return f"Your records list {join_items(c.lower() for c in conditions)}."
+
+    def _answer_procedures(self, transcript, patient_history):
+        procedures = patient_history.get("medical_history", {}).get("procedures", [])
+        if not procedures:
+            return "You don't have any procedures on record."
+        procedure = procedures[0]
+        return (f"You had {procedure['type']} on {format_date(procedure['date'])} with {procedure['doctor']}, "
+                f"a {procedure['details']}.")
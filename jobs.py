@@ -0,0 +1,198 @@
+"""
+Cancellable response jobs.
+
+Each reply runs as a Job owned by its session. Starting a new job for a
+session (the user spoke again) or cancelling it explicitly marks the old job
+cancelled: its child processes are terminated straight away, and the code
+running it stops at the next stage boundary by calling check_cancelled(),
+which raises JobCancelled. Files registered as partial artefacts are removed
+when a cancelled job is cleaned up.
+
+Pipeline code does not pass the job around: the running job is activated for
+the current thread (job.activate()) and looked up with current_job().
+"""
+import logging
+import os
+import time
+import uuid
+import threading
+import subprocess
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class JobCancelled(Exception):
+    """Raised at a stage boundary once the running job has been cancelled"""
+
+
+class Job:
+    def __init__(self, session_id):
+        self.id = uuid.uuid4().hex[:12]
+        self.session_id = session_id
+        self.created = time.time()
+        self.stage = "queued"
+        self.cancel_reason = None
+        self.handed_off = False  # Set when a background thread takes over finishing the job
+        self.profile = None      # profiling.ProfileSession when the request asked to be profiled
+
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._artifacts = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self, stage=None):
+        """Record the stage being entered and raise JobCancelled if the job was cancelled"""
+        if stage:
+            self.stage = stage
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Job {self.id} cancelled ({self.cancel_reason}) at {self.stage}")
+
+    def cancel(self, reason="cancelled"):
+        """Cancel the job and terminate its child processes"""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self.cancel_reason = reason
+            self._cancelled.set()
+            processes = list(self._processes)
+
+        for process in processes:
+            try:
+                process.terminate()
+            except OSError:
+                pass
+        logger.info("Cancelled job %s for session %s at %s (%s)", self.id, self.session_id, self.stage, reason)
+
+    def add_process(self, process):
+        with self._lock:
+            self._processes.add(process)
+            cancelled = self._cancelled.is_set()
+        if cancelled:
+            process.terminate()
+
+    def remove_process(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+    def add_artifact(self, path):
+        """Register a file that should be removed if the job is cancelled"""
+        with self._lock:
+            self._artifacts.append(path)
+
+    def cleanup(self):
+        """Remove the partial artefacts of a cancelled job"""
+        with self._lock:
+            artifacts, self._artifacts = self._artifacts, []
+        for path in artifacts:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                    logger.info("Removed partial artefact %s", path)
+            except OSError as e:
+                logger.warning("Error deleting %s: %s", path, e)
+
+    @contextmanager
+    def activate(self):
+        """Make this the current job for the calling thread"""
+        token = _current_job.set(self)
+        try:
+            yield self
+        finally:
+            _current_job.reset(token)
+
+
+def current_job():
+    """The job running on this thread, or None"""
+    return _current_job.get()
+
+
+def check_cancelled(stage=None):
+    """Stage boundary: raise JobCancelled if the current job (if any) was cancelled"""
+    job = _current_job.get()
+    if job is not None:
+        job.check(stage)
+
+
+def run_process(args, **kwargs):
+    """
+    subprocess.run replacement whose child is terminated when the current job
+    is cancelled. Accepts the same arguments as subprocess.run.
+    """
+    job = _current_job.get()
+    if job is None:
+        return subprocess.run(args, **kwargs)
+
+    job.check()
+    check = kwargs.pop("check", False)
+    if kwargs.pop("capture_output", False):
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+
+    process = subprocess.Popen(args, **kwargs)
+    job.add_process(process)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        job.remove_process(process)
+
+    job.check()
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+
+class JobRegistry:
+    """The in-flight job of every session."""
+
+    def __init__(self):
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.cancelled = 0
+
+    def start(self, session_id):
+        """Start a job for the session, cancelling the one already in flight"""
+        job = Job(session_id)
+        with self._lock:
+            previous = self.jobs.get(session_id)
+            self.jobs[session_id] = job
+            self.started += 1
+        if previous:
+            self._cancel(previous, "superseded by a new utterance")
+        return job
+
+    def cancel(self, session_id, reason="cancelled by client"):
+        """Cancel the session's in-flight job. Returns the job, or None if there was none."""
+        with self._lock:
+            job = self.jobs.pop(session_id, None)
+        if job:
+            self._cancel(job, reason)
+        return job
+
+    def _cancel(self, job, reason):
+        if not job.cancelled:
+            with self._lock:
+                self.cancelled += 1
+            job.cancel(reason)
+
+    def finish(self, job):
+        """Forget a job that has completed (or been cleaned up after cancellation)"""
+        with self._lock:
+            if self.jobs.get(job.session_id) is job:
+                del self.jobs[job.session_id]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "in_flight": {sid: {"job_id": job.id, "stage": job.stage} for sid, job in self.jobs.items()},
+                "started": self.started,
+                "cancelled": self.cancelled
+            }
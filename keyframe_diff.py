@@ -0,0 +1,423 @@
+"""
+Differential harness for keyframe engines.
+
+Runs a reference and a candidate EnhancedPhonemeGenerator over the same word
+timings and reports how much faster the candidate is and how far its
+animation drifts from the reference, per channel. The exit code is 1 when
+any channel exceeds its tolerance, so the harness can gate performance work
+on generate_keyframes, generate_intermediate_keyframes and the smoothers.
+
+Whisper is not involved: both engines get identical word timings, fed in
+through a stand-in word extractor. Timings come from a corpus directory of
+JSON files ({"duration": ..., "word_timings": [...]}), from WAV files
+aligned once with Whisper (--save-corpus keeps the result for later runs),
+or from --synthetic utterances.
+
+--reference-rev checks the whole revision out into a temporary directory
+(git archive) and imports the reference from there, so the helper modules
+it imports (lexicon, rig_profiles, visemes, ...) are the revision's too.
+Build artefacts that are not in git, such as lexicon.bin, are taken from
+the working tree.
+
+Usage:
+    # Compare the working tree against the last commit
+    python keyframe_diff.py --reference-rev HEAD --synthetic 50
+
+    # Compare two files on a saved corpus, with a looser jaw tolerance
+    python keyframe_diff.py corpus/ --reference old_phonememapping.py \\
+        --candidate phonememapping.py --channel-tol jawValue.y=0.01
+
+    # How far the 'fast' quality tier drifts from full quality
+    python keyframe_diff.py --reference phonememapping --candidate-tier fast --synthetic 50
+
+Both engines' keyframes are sampled on a common grid (--grid-rate) with the
+same linear interpolation the engine uses, so candidates that emit a
+different number of keyframes are still compared on the animation they
+produce.
+"""
+import io
+import os
+import sys
+import copy
+import json
+import time
+import logging
+import random
+import shutil
+import tarfile
+import argparse
+import tempfile
+import subprocess
+import importlib
+import importlib.util
+
+from logging_setup import setup_logging
+
+logger = logging.getLogger("keyframe_diff")
+
+# Keys of a keyframe that are not animation channels
+NON_CHANNEL_KEYS = {"time", "word", "syllable", "phoneme", "phonemes"}
+
+SYNTHETIC_WORDS = [
+    "hello", "how", "are", "you", "feeling", "today", "please", "take", "your", "medication",
+    "with", "breakfast", "and", "drink", "plenty", "of", "water", "the", "doctor", "will",
+    "see", "you", "next", "week", "remember", "to", "rest", "after", "walking", "heart",
+    "surgery", "recovery", "is", "going", "well", "call", "me", "if", "anything", "changes"
+]
+
+
+class FixedWordTimings:
+    """Stands in for WordTimingExtractor: returns preset timings instead of running Whisper"""
+
+    timings = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def extract_word_timings(self, audio_file=None, transcript=None):
+        return copy.deepcopy(FixedWordTimings.timings)
+
+    def get_word_phonemes(self, word):
+        for timing in FixedWordTimings.timings:
+            if timing["word"] == word:
+                return list(timing["phonemes"])
+        return [word]
+
+
+def load_engine_module(source, label):
+    """
+    Import a phonememapping implementation.
+
+    Args:
+        source (str): Module name (e.g. 'phonememapping') or path to a .py file
+        label (str): Unique module name for file imports
+
+    Returns:
+        module
+    """
+    if source.endswith(".py"):
+        spec = importlib.util.spec_from_file_location(f"keyframe_engine_{label}", source)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return importlib.import_module(source)
+
+
+def module_from_revision(revision, name="phonememapping"):
+    """
+    Import a module as of a git revision, along with the local modules it imports.
+
+    The revision is extracted with git archive into a temporary directory,
+    which is put first on sys.path while the module is imported. Local
+    modules already imported from the working tree are set aside meanwhile
+    and restored afterwards, so the candidate still gets the working tree's.
+
+    Returns:
+        module
+    """
+    archive = subprocess.run(["git", "archive", "--format=tar", revision], check=True, capture_output=True).stdout
+    tree = tempfile.mkdtemp(prefix=f"keyframes_{revision.replace('/', '_')}_")
+    try:
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(tree)
+        local = {os.path.splitext(entry)[0] for entry in os.listdir(tree) if entry.endswith(".py")}
+
+        # The revision's lexicon module would otherwise look for lexicon.bin in the temp tree
+        from lexicon import LEXICON_FILE
+        lexicon_env = os.environ.get("LIPRA_LEXICON")
+        os.environ["LIPRA_LEXICON"] = LEXICON_FILE
+
+        saved = {n: sys.modules.pop(n) for n in list(sys.modules) if n in local}
+        sys.path.insert(0, tree)
+        try:
+            return importlib.import_module(name)
+        finally:
+            sys.path.remove(tree)
+            for n in local:
+                sys.modules.pop(n, None)
+            sys.modules.update(saved)
+            if lexicon_env is None:
+                os.environ.pop("LIPRA_LEXICON", None)
+            else:
+                os.environ["LIPRA_LEXICON"] = lexicon_env
+    finally:
+        shutil.rmtree(tree, ignore_errors=True)
+
+
+def build_engine(module, rig_profile=None):
+    """EnhancedPhonemeGenerator from a module, with Whisper replaced by FixedWordTimings"""
+    original = module.WordTimingExtractor
+    module.WordTimingExtractor = FixedWordTimings
+    try:
+        try:
+            return module.EnhancedPhonemeGenerator(rig_profile=rig_profile)
+        except TypeError:
+            # Implementations that predate rig profiles
+            return module.EnhancedPhonemeGenerator()
+    finally:
+        module.WordTimingExtractor = original
+
+
+def run_engine(engine, item, repeat, quality_tier=None):
+    """
+    Generate keyframes for one utterance.
+
+    Args:
+        quality_tier (str): Quality tier to generate at (engines without tiers: leave None)
+
+    Returns:
+        tuple: (keyframes, fastest run in seconds)
+    """
+    FixedWordTimings.timings = item["word_timings"]
+    kwargs = {}
+    if quality_tier:
+        # The 'fast' tier aligns the transcript itself instead of using word timings
+        kwargs = {"quality_tier": quality_tier, "transcript": " ".join(w["word"] for w in item["word_timings"])}
+    best = None
+    keyframes = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        keyframes = engine.generate_keyframes(None, item["duration"], **kwargs)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return keyframes or [], best
+
+
+def channel_tracks(keyframes):
+    """
+    Split keyframes into per-channel (times, values) tracks; vector channels
+    become one track per coordinate, e.g. 'jawValue.y'.
+    """
+    tracks = {}
+    for keyframe in sorted(keyframes, key=lambda k: k["time"]):
+        for key, value in keyframe.items():
+            if key in NON_CHANNEL_KEYS:
+                continue
+            if isinstance(value, dict):
+                for coord, v in value.items():
+                    if isinstance(v, (int, float)):
+                        tracks.setdefault(f"{key}.{coord}", ([], []))
+                        tracks[f"{key}.{coord}"][0].append(keyframe["time"])
+                        tracks[f"{key}.{coord}"][1].append(float(v))
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                tracks.setdefault(key, ([], []))
+                tracks[key][0].append(keyframe["time"])
+                tracks[key][1].append(float(value))
+    return tracks
+
+
+def compare_keyframes(reference, candidate, duration, grid_rate):
+    """
+    Per-channel differences between two keyframe lists, sampled on a grid.
+
+    Returns:
+        dict: channel -> {"max": ..., "sum_sq": ..., "samples": ...}, with
+        "missing" set for channels only one side produces
+    """
+    import numpy as np
+
+    grid = np.arange(0.0, duration + 1e-9, 1.0 / grid_rate)
+    ref_tracks = channel_tracks(reference)
+    cand_tracks = channel_tracks(candidate)
+
+    result = {}
+    for channel in sorted(set(ref_tracks) | set(cand_tracks)):
+        if channel not in ref_tracks or channel not in cand_tracks:
+            result[channel] = {"missing": "candidate" if channel in ref_tracks else "reference"}
+            continue
+        ref = np.interp(grid, *map(np.asarray, ref_tracks[channel]))
+        cand = np.interp(grid, *map(np.asarray, cand_tracks[channel]))
+        diff = np.abs(ref - cand)
+        result[channel] = {"max": float(diff.max()) if len(diff) else 0.0,
+                           "sum_sq": float(np.sum(diff ** 2)), "samples": len(diff)}
+    return result
+
+
+def synthetic_corpus(count, seed=0):
+    """Random utterances of 3-25 words with plausible, slightly irregular timings"""
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(count):
+        t = rng.uniform(0.05, 0.3)
+        timings = []
+        for _ in range(rng.randint(3, 25)):
+            word = rng.choice(SYNTHETIC_WORDS)
+            length = rng.uniform(0.12, 0.25) + 0.05 * len(word) / 4
+            timings.append({"word": word, "start": round(t, 3), "end": round(t + length, 3), "phonemes": [word]})
+            t += length + rng.choice([0.0, 0.0, 0.02, 0.08, 0.3])
+        corpus.append({"name": f"synthetic_{n:04d}", "duration": round(t + 0.2, 3), "word_timings": timings})
+    return corpus
+
+
+def load_corpus(source, module, save_dir=None):
+    """
+    Corpus items from a directory of timing JSON files and/or WAV files.
+    WAV files are aligned with the module's Whisper word extractor.
+    """
+    corpus = []
+    extractor = None
+    for name in sorted(os.listdir(source)):
+        path = os.path.join(source, name)
+        stem, ext = os.path.splitext(name)
+        if ext == ".json":
+            with open(path) as f:
+                item = json.load(f)
+            item.setdefault("name", stem)
+            corpus.append(item)
+        elif ext == ".wav" and not os.path.exists(os.path.join(source, stem + ".json")):
+            if extractor is None:
+                extractor = module.WordTimingExtractor()
+            timings = extractor.extract_word_timings(path)
+            if not timings:
+                logger.warning("No word timings for %s, skipping", path)
+                continue
+            item = {"name": stem, "duration": module.get_audio_duration(path), "word_timings": timings}
+            corpus.append(item)
+            if save_dir:
+                os.makedirs(save_dir, exist_ok=True)
+                with open(os.path.join(save_dir, stem + ".json"), "w") as f:
+                    json.dump(item, f, indent=2)
+    return corpus
+
+
+def parse_channel_tolerances(specs):
+    """['jawValue.y=0.01,0.002', ...] -> {'jawValue.y': (0.01, 0.002)}"""
+    tolerances = {}
+    for spec in specs or []:
+        channel, _, values = spec.partition("=")
+        parts = [float(v) for v in values.split(",")]
+        tolerances[channel] = (parts[0], parts[1] if len(parts) > 1 else parts[0])
+    return tolerances
+
+
+def run_diff(reference, candidate, corpus, grid_rate=120, repeat=3, max_abs=1e-3, max_rms=1e-4, channel_tol=None,
+             candidate_tier=None):
+    """
+    Compare two engines over a corpus.
+
+    Returns:
+        dict: Timing, speedup, per-channel drift and the list of failures
+    """
+    channel_tol = channel_tol or {}
+    totals = {}
+    ref_seconds = cand_seconds = 0.0
+    count_mismatches = []
+
+    # Fill lookup caches and import lazy dependencies before anything is timed
+    for engine, tier in ((reference, None), (candidate, candidate_tier)):
+        for item in corpus:
+            run_engine(engine, item, 1, tier)
+
+    for item in corpus:
+        ref_keyframes, ref_time = run_engine(reference, item, repeat)
+        cand_keyframes, cand_time = run_engine(candidate, item, repeat, candidate_tier)
+        ref_seconds += ref_time
+        cand_seconds += cand_time
+        if len(ref_keyframes) != len(cand_keyframes):
+            count_mismatches.append({"name": item["name"], "reference": len(ref_keyframes), "candidate": len(cand_keyframes)})
+
+        for channel, diff in compare_keyframes(ref_keyframes, cand_keyframes, item["duration"], grid_rate).items():
+            total = totals.setdefault(channel, {"max": 0.0, "sum_sq": 0.0, "samples": 0, "worst": None, "missing": None})
+            if "missing" in diff:
+                total["missing"] = diff["missing"]
+                continue
+            if diff["max"] >= total["max"]:
+                total["max"], total["worst"] = diff["max"], item["name"]
+            total["sum_sq"] += diff["sum_sq"]
+            total["samples"] += diff["samples"]
+
+    channels = {}
+    failures = []
+    for channel, total in sorted(totals.items()):
+        tol_max, tol_rms = channel_tol.get(channel, channel_tol.get(channel.split(".")[0], (max_abs, max_rms)))
+        rms = (total["sum_sq"] / total["samples"]) ** 0.5 if total["samples"] else 0.0
+        ok = total["missing"] is None and total["max"] <= tol_max and rms <= tol_rms
+        channels[channel] = {"max": total["max"], "rms": rms, "tol_max": tol_max, "tol_rms": tol_rms,
+                             "worst": total["worst"], "missing_in": total["missing"], "ok": ok}
+        if not ok:
+            failures.append(channel)
+
+    return {
+        "utterances": len(corpus),
+        "reference_seconds": round(ref_seconds, 4),
+        "candidate_seconds": round(cand_seconds, 4),
+        "speedup": round(ref_seconds / cand_seconds, 3) if cand_seconds else None,
+        "keyframe_count_mismatches": count_mismatches,
+        "channels": channels,
+        "failures": failures
+    }
+
+
+def print_report(report):
+    print(f"{'channel':<20}{'max diff':>12}{'rms diff':>12}{'tol max':>10}{'tol rms':>10}  status")
+    for channel, c in report["channels"].items():
+        status = "ok" if c["ok"] else (f"MISSING in {c['missing_in']}" if c["missing_in"] else f"DRIFT (worst: {c['worst']})")
+        print(f"{channel:<20}{c['max']:>12.2e}{c['rms']:>12.2e}{c['tol_max']:>10.0e}{c['tol_rms']:>10.0e}  {status}")
+
+    print(f"\n{report['utterances']} utterances: reference {report['reference_seconds']:.3f}s, "
+          f"candidate {report['candidate_seconds']:.3f}s, speedup {report['speedup']}x")
+    if report["keyframe_count_mismatches"]:
+        print(f"Keyframe counts differ on {len(report['keyframe_count_mismatches'])} utterances "
+              f"(compared on the sampled animation)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two keyframe engines for speed and output drift")
+    parser.add_argument("corpus", nargs="?", help="Directory of word-timing JSON and/or WAV files")
+    parser.add_argument("--reference", default=None, help="Reference module name or .py file")
+    parser.add_argument("--reference-rev", default=None, help="Use phonememapping (and its modules) from this git revision as the reference")
+    parser.add_argument("--candidate", default="phonememapping", help="Candidate module name or .py file")
+    parser.add_argument("--candidate-tier", default=None, help="Run the candidate at this quality tier (full, balanced, fast)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Add this many synthetic utterances")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic utterances")
+    parser.add_argument("--save-corpus", default=None, help="Save Whisper-aligned WAV timings here as JSON")
+    parser.add_argument("--rig-profile", default=None, help="Rig profile for both engines")
+    parser.add_argument("--grid-rate", type=float, default=120.0, help="Samples per second for the comparison")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per utterance (fastest is timed)")
+    parser.add_argument("--max-abs", type=float, default=1e-3, help="Default per-channel max difference")
+    parser.add_argument("--max-rms", type=float, default=1e-4, help="Default per-channel RMS difference")
+    parser.add_argument("--channel-tol", action="append", help="CHANNEL=MAX[,RMS] override, e.g. jawValue.y=0.01")
+    parser.add_argument("--report", default=None, help="Optional path for a JSON report")
+    args = parser.parse_args()
+    setup_logging(level="WARNING")
+
+    if bool(args.reference) == bool(args.reference_rev):
+        parser.error("give exactly one of --reference or --reference-rev")
+    if args.reference_rev:
+        reference_module = module_from_revision(args.reference_rev)
+    else:
+        reference_module = load_engine_module(args.reference, "reference")
+    candidate_module = load_engine_module(args.candidate, "candidate")
+
+    corpus = load_corpus(args.corpus, candidate_module, args.save_corpus) if args.corpus else []
+    corpus += synthetic_corpus(args.synthetic, args.seed)
+    if not corpus:
+        logger.error("Empty corpus: pass a corpus directory and/or --synthetic N")
+        return 2
+
+    report = run_diff(
+        build_engine(reference_module, args.rig_profile),
+        build_engine(candidate_module, args.rig_profile),
+        corpus,
+        grid_rate=args.grid_rate,
+        repeat=args.repeat,
+        max_abs=args.max_abs,
+        max_rms=args.max_rms,
+        channel_tol=parse_channel_tolerances(args.channel_tol),
+        candidate_tier=args.candidate_tier
+    )
+    print_report(report)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to: {args.report}")
+
+    if report["failures"]:
+        logger.error("Drift beyond tolerance on: %s", ", ".join(report["failures"]))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
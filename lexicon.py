@@ -0,0 +1,307 @@
+"""
+Precompiled syllabified lexicon built from the CMU pronouncing dictionary.
+
+Parsing cmudict with nltk takes seconds and tens of MB per copy, so the
+dictionary is compiled once into a compact binary file with the syllable
+splits, mapped phonemes and syllable counts already worked out. The file is
+memory mapped and shared by every phoneme component in the process.
+
+Build it with:
+    python lexicon.py build [--output lexicon.bin] [--download]
+
+nltk is only needed for the build step and is never imported (or allowed to
+hit the network) as a side effect of importing this module.
+
+File layout (little endian):
+    header   8s magic, uint32 entry count
+    offsets  (count + 1) x uint32, byte offsets of each record in the data block
+    data     utf-8 records sorted by word: word \\x1f syllables \\x1f phones \\x1f syllable count
+             syllables are separated by '|' and phonemes by ' '
+"""
+import logging
+import os
+import re
+import sys
+import mmap
+import struct
+import threading
+from functools import lru_cache
+
+from memory_stats import track
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+LEXICON_FILE = os.environ.get(
+    "LIPRA_LEXICON",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicon.bin")
+)
+
+MAGIC = b"LIPRALX1"
+HEADER = struct.Struct("<8sI")
+OFFSET = struct.Struct("<I")
+FIELD_SEP = "\x1f"
+
+# Vowel phonemes (used for syllable detection)
+CMU_VOWELS = frozenset(['AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH',
+                        'ER', 'EY', 'IH', 'IY', 'OW', 'OY', 'UH', 'UW'])
+
+# Mapping from CMU phonemes to our phoneme set
+CMU_TO_PHONEME = {
+    'AA': 'a', 'AE': 'æ', 'AH': 'ə', 'AO': 'ɔ',
+    'AW': 'aw', 'AY': 'ay', 'EH': 'ɛ', 'ER': 'ər',
+    'EY': 'eɪ', 'IH': 'ɪ', 'IY': 'i', 'OW': 'oʊ',
+    'OY': 'ɔɪ', 'UH': 'ʊ', 'UW': 'u',
+    'B': 'b', 'CH': 'tʃ', 'D': 'd', 'DH': 'ð',
+    'F': 'f', 'G': 'g', 'HH': 'h', 'JH': 'dʒ',
+    'K': 'k', 'L': 'l', 'M': 'm', 'N': 'n',
+    'NG': 'ŋ', 'P': 'p', 'R': 'r', 'S': 's',
+    'SH': 'ʃ', 'T': 't', 'TH': 'θ', 'V': 'v',
+    'W': 'w', 'Y': 'y', 'Z': 'z', 'ZH': 'ʒ'
+}
+
+
+def syllabify_phones(phones):
+    """
+    Split a stress-stripped CMU phone sequence into syllables.
+
+    Each vowel closes the syllable it ends, and trailing consonants are
+    attached to the last syllable.
+    """
+    syllables = []
+    current_syllable = []
+
+    for phoneme in phones:
+        current_syllable.append(phoneme)
+        # If this is a vowel phoneme, it's the nucleus of a syllable
+        if phoneme in CMU_VOWELS:
+            if len(current_syllable) > 1:
+                syllables.append(current_syllable)
+                current_syllable = []
+
+    # Add any remaining phonemes to the last syllable
+    if current_syllable:
+        if syllables:
+            syllables[-1].extend(current_syllable)
+        else:
+            syllables.append(current_syllable)
+
+    return syllables
+
+
+def compile_entry(word, pronunciation):
+    """Compile one CMU pronunciation into a lexicon record"""
+    phones = [re.sub(r'\d+', '', p) for p in pronunciation]
+    syllable_count = len([p for p in pronunciation if p[-1].isdigit()])
+    syllables = [[CMU_TO_PHONEME.get(p, p) for p in syllable] for syllable in syllabify_phones(phones)]
+
+    return FIELD_SEP.join([
+        word,
+        "|".join(" ".join(syllable) for syllable in syllables),
+        " ".join(phones),
+        str(syllable_count)
+    ]).encode("utf-8")
+
+
+def ensure_cmudict(download=False):
+    """
+    Check that nltk and its cmudict corpus are installed.
+
+    Args:
+        download (bool): Fetch the corpus with nltk.download if it is missing
+
+    Returns:
+        bool: True if cmudict can be loaded
+    """
+    try:
+        import nltk
+    except ImportError:
+        logger.warning("nltk not found. Cannot build the lexicon.")
+        return False
+
+    try:
+        nltk.data.find('corpora/cmudict')
+        return True
+    except LookupError:
+        if not download:
+            logger.warning("NLTK cmudict resource missing. Run: python lexicon.py build --download")
+            return False
+
+    logger.info("Downloading NLTK cmudict resource...")
+    return bool(nltk.download('cmudict', quiet=True))
+
+
+def build_lexicon(output_path=LEXICON_FILE, cmu_dict=None):
+    """
+    Compile the CMU dictionary into the binary lexicon file.
+
+    Args:
+        output_path (str): Where to write the lexicon
+        cmu_dict (dict): Optional word -> pronunciations mapping, defaults to nltk's cmudict
+
+    Returns:
+        int: Number of words written
+    """
+    if cmu_dict is None:
+        if not ensure_cmudict():
+            raise LookupError("cmudict is not available")
+        from nltk.corpus import cmudict
+        cmu_dict = cmudict.dict()
+
+    # Sort by the encoded key so lookups can binary search the raw bytes
+    words = sorted(cmu_dict, key=lambda w: w.encode("utf-8"))
+    records = [compile_entry(word, cmu_dict[word][0]) for word in words if cmu_dict[word]]
+
+    offsets = [0]
+    for record in records:
+        offsets.append(offsets[-1] + len(record))
+
+    # Write atomically so concurrent workers never map a half-written file
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        for record in records:
+            f.write(record)
+    os.replace(temp_path, output_path)
+
+    logger.info("Built lexicon with %s words at %s", len(records), output_path)
+    return len(records)
+
+
+class Lexicon:
+    """Read-only, memory-mapped view of a compiled lexicon file."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._map = None
+
+        if path and os.path.exists(path):
+            self._file = open(path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.count = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a compiled lexicon")
+            self._offsets_start = HEADER.size
+            self._data_start = HEADER.size + (self.count + 1) * OFFSET.size
+
+        # Per-process cache of decoded entries, shared by every caller of this lexicon
+        self._lookup = lru_cache(maxsize=16384)(self._decode)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, word):
+        return self.lookup(word) is not None
+
+    def _record(self, index):
+        start, end = struct.unpack_from("<II", self._map, self._offsets_start + index * OFFSET.size)
+        return self._map[self._data_start + start:self._data_start + end]
+
+    def _decode(self, word):
+        if not self.count:
+            return None
+
+        key = word.encode("utf-8") + FIELD_SEP.encode()
+        low, high = 0, self.count - 1
+        while low <= high:
+            mid = (low + high) // 2
+            record = self._record(mid)
+            record_key = record[:record.index(b"\x1f") + 1]
+            if record_key == key:
+                _, syllables, phones, syllable_count = record.decode("utf-8").split(FIELD_SEP)
+                return {
+                    'syllables': [syllable.split(" ") for syllable in syllables.split("|")],
+                    'phones': phones.split(" "),
+                    'syllable_count': int(syllable_count)
+                }
+            if record_key < key:
+                low = mid + 1
+            else:
+                high = mid - 1
+        return None
+
+    def lookup(self, word):
+        """Return the compiled entry for a word, or None if it is not in the dictionary"""
+        return self._lookup(word.lower().strip())
+
+    def syllables(self, word):
+        """Syllables of a word as lists of mapped phonemes"""
+        entry = self.lookup(word)
+        return entry['syllables'] if entry else None
+
+    def phones(self, word):
+        """Stress-stripped CMU phones of a word"""
+        entry = self.lookup(word)
+        return entry['phones'] if entry else None
+
+    def syllable_count(self, word):
+        """Number of syllables (stressed vowels) in a word"""
+        entry = self.lookup(word)
+        return entry['syllable_count'] if entry else None
+
+
+_lexicon = None
+_lexicon_lock = threading.Lock()
+
+
+def get_lexicon(path=LEXICON_FILE):
+    """
+    Return the process-wide lexicon, building it from cmudict on first use
+    if the compiled file is missing. Falls back to an empty lexicon when
+    neither the file nor nltk's cmudict is available.
+    """
+    global _lexicon
+    if _lexicon is not None:
+        return _lexicon
+
+    with _lexicon_lock:
+        if _lexicon is not None:
+            return _lexicon
+        with track("load:lexicon"):
+            if not os.path.exists(path):
+                logger.info("Compiled lexicon not found at %s, building it from cmudict...", path)
+                try:
+                    build_lexicon(path)
+                except (ImportError, LookupError, OSError) as e:
+                    logger.warning("Could not build lexicon: %s. Syllable-aware phoneme mapping disabled.", e)
+            try:
+                _lexicon = Lexicon(path)
+            except (OSError, ValueError, struct.error) as e:
+                logger.warning("Could not load lexicon %s: %s", path, e)
+                _lexicon = Lexicon()
+    return _lexicon
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile the CMU dictionary into a syllabified lexicon")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build the lexicon file")
+    build_parser.add_argument("--output", default=LEXICON_FILE, help="Output path")
+    build_parser.add_argument("--download", action="store_true", help="Download cmudict with nltk if missing")
+
+    lookup_parser = subparsers.add_parser("lookup", help="Look up words in a built lexicon")
+    lookup_parser.add_argument("words", nargs="+")
+    lookup_parser.add_argument("--lexicon", default=LEXICON_FILE, help="Lexicon path")
+
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.command == "build":
+        if not ensure_cmudict(download=args.download):
+            return 1
+        build_lexicon(args.output)
+    elif args.command == "lookup":
+        lexicon = Lexicon(args.lexicon)
+        for word in args.words:
+            print(f"{word}: {lexicon.lookup(word)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
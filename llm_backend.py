@@ -0,0 +1,135 @@
+import logging
+import os
+import time
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend:
+    """
+    Persistent Ollama client that keeps the model resident.
+
+    One HTTP client is reused for every call. The model is loaded at startup
+    with a tiny prompt, every request asks Ollama to keep it loaded for
+    keep_alive_seconds, and a keeper thread pre-loads it again shortly before
+    an idle period would reach that threshold (or as soon as it notices the
+    model is no longer loaded), so the first turn after a quiet spell does not
+    pay for a model load.
+
+    A forked child gets a fresh client, so it never shares the parent's
+    pooled keep-alive connections, and must start its own keeper.
+    """
+
+    def __init__(self, model, host=None, keep_alive_seconds=30 * 60, refresh_margin_seconds=60, check_interval_seconds=30):
+        import ollama
+
+        self.model = model
+        self.host = host
+        self.client = ollama.Client(host=host)
+        self.keep_alive_seconds = keep_alive_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.check_interval_seconds = check_interval_seconds
+
+        self.last_used = 0.0
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keeper = None
+
+        self.requests = 0
+        self.preloads = 0
+        self.last_preload_seconds = None
+
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        import ollama
+
+        # The keeper thread does not exist in the child, and locks may have been held at fork time
+        self.client = ollama.Client(host=self.host)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keeper = None
+
+    def chat(self, messages, **kwargs):
+        """ollama chat on the persistent client, keeping the model loaded afterwards"""
+        kwargs.setdefault("keep_alive", self.keep_alive_seconds)
+        try:
+            return self.client.chat(model=self.model, messages=messages, **kwargs)
+        finally:
+            with self._lock:
+                self.requests += 1
+                self.last_used = time.time()
+
+    def preload(self, prompt=""):
+        """
+        Load the model (an empty prompt only loads it, a short one also runs a
+        forward pass) and reset its keep-alive timer.
+
+        Returns:
+            bool: True if the backend answered
+        """
+        started = time.perf_counter()
+        try:
+            self.client.generate(
+                model=self.model,
+                prompt=prompt,
+                keep_alive=self.keep_alive_seconds,
+                options={"num_predict": 1}
+            )
+        except Exception as e:
+            logger.warning("Could not pre-load %s: %s", self.model, e)
+            return False
+
+        with self._lock:
+            self.preloads += 1
+            self.last_used = time.time()
+            self.last_preload_seconds = round(time.perf_counter() - started, 3)
+        return True
+
+    def warm_up(self):
+        """Load the model at startup with a tiny prompt"""
+        logger.info("Warming up LLM backend (%s)...", self.model)
+        if self.preload("Hi"):
+            logger.info("LLM backend ready in %.2f seconds", self.last_preload_seconds)
+        self.ready.set()
+
+    def is_loaded(self):
+        """Ask Ollama whether the model is currently in memory (None if unknown)"""
+        try:
+            running = self.client.ps()
+            # Older clients return plain dicts, newer ones subscriptable models
+            names = {m.get("model") or m.get("name") for m in running.get("models") or []}
+            return self.model in names
+        except Exception:
+            return None
+
+    def start_keeper(self):
+        """Warm the model (unless already warmed) and keep it resident from a daemon thread"""
+        def run():
+            if not self.ready.is_set():
+                self.warm_up()
+            while not self._stop.wait(self.check_interval_seconds):
+                idle = time.time() - self.last_used
+                if idle >= self.keep_alive_seconds - self.refresh_margin_seconds or self.is_loaded() is False:
+                    self.preload()
+
+        self._keeper = threading.Thread(target=run, name="llm-keeper", daemon=True)
+        self._keeper.start()
+        return self._keeper
+
+    def stop_keeper(self):
+        self._stop.set()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "model": self.model,
+                "requests": self.requests,
+                "preloads": self.preloads,
+                "last_preload_seconds": self.last_preload_seconds,
+                "idle_seconds": round(time.time() - self.last_used, 1) if self.last_used else None,
+                "keep_alive_seconds": self.keep_alive_seconds,
+                "ready": self.ready.is_set()
+            }
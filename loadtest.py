@@ -0,0 +1,257 @@
+"""
+Load generator emulating many Unreal Engine clients against a local server.
+
+Each emulated engine has its own session and polls /start_animation at
+--poll-hz, like MyClass.cpp does. A subset of them ("talkers") also write
+uploads/trail.wav, POST / every --talk-interval seconds and then fetch the
+reply audio from /audio. Latency (p50/p95/p99) and error rate are recorded
+per endpoint, and the run can sweep several engine counts to find where the
+server saturates. The server's per-stage memory report (/memory) is
+captured after each level.
+
+Start the server with stubbed backends so the numbers reflect the server
+itself rather than Whisper/Ollama/gTTS (see stub_backends.py):
+    LIPRA_STUB_BACKENDS=1 python serversetup.py
+
+Then, from the same directory:
+    python loadtest.py --engines 1 4 8 16 32 --talkers 0.25 --duration 30
+
+Only the standard library is used, so it can also run on a separate machine
+(pass --upload-dir pointing at the server's uploads directory, or '' if it
+is not reachable and trail.wav already exists there).
+"""
+import os
+import sys
+import json
+import time
+import wave
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+class Recorder:
+    """Latencies and failures per endpoint, shared by all client threads"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            self.statuses.setdefault(endpoint, {}).setdefault(status, 0)
+            self.statuses[endpoint][status] += 1
+            if status == "error" or status >= 400:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, elapsed):
+        """Per-endpoint request count, throughput, latency percentiles (ms) and error rate"""
+        with self._lock:
+            result = {}
+            for endpoint, latencies in sorted(self.latencies.items()):
+                result[endpoint] = {
+                    "requests": len(latencies),
+                    "rps": round(len(latencies) / elapsed, 1),
+                    "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+                    "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+                    "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+                    "error_rate": round(self.errors.get(endpoint, 0) / len(latencies), 4),
+                    "statuses": {str(k): v for k, v in self.statuses[endpoint].items()}
+                }
+            return result
+
+
+def request(base_url, method, path, session_id, recorder, timeout, endpoint=None):
+    """
+    Send one request and record its latency under endpoint (defaults to path).
+
+    Returns:
+        bytes: Response body, or None on failure
+    """
+    req = urllib.request.Request(base_url + path, method=method, data=b"" if method == "POST" else None,
+                                 headers={"X-Session-ID": session_id})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        body, status = None, e.code
+    except Exception:
+        body, status = None, "error"
+    recorder.record(endpoint or path, time.perf_counter() - started, status)
+    return body
+
+
+def poll_loop(base_url, session_id, poll_hz, stop, recorder, timeout):
+    """Poll /start_animation at a fixed rate, as the engine's tick does"""
+    interval = 1.0 / poll_hz
+    # Engines do not start in lockstep
+    next_poll = time.perf_counter() + random.uniform(0, interval)
+    while not stop.is_set():
+        delay = next_poll - time.perf_counter()
+        if delay > 0 and stop.wait(delay):
+            break
+        request(base_url, "GET", "/start_animation", session_id, recorder, timeout)
+        # A slow server lowers the achieved rate rather than queueing polls
+        next_poll = max(next_poll + interval, time.perf_counter())
+
+
+def talk_loop(base_url, session_id, talk_interval, stop, recorder, timeout):
+    """POST an utterance, fetch the reply audio, pause, repeat"""
+    if stop.wait(random.uniform(0, talk_interval)):
+        return
+    while not stop.is_set():
+        body = request(base_url, "POST", "/", session_id, recorder, timeout)
+        if body is not None:
+            request(base_url, "GET", "/audio", session_id, recorder, timeout)
+        if stop.wait(talk_interval):
+            break
+
+
+def ensure_trail_wav(upload_dir, seconds=2.0):
+    """The server transcribes uploads/trail.wav; write a silent one if there is none"""
+    path = os.path.join(upload_dir, "trail.wav")
+    if not os.path.exists(path):
+        os.makedirs(upload_dir, exist_ok=True)
+        with wave.open(path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            f.writeframes(b"\x00\x00" * int(seconds * 16000))
+        print(f"[INFO] Wrote silent test utterance to {path}")
+    return path
+
+
+def run_level(base_url, engines, talkers, duration, poll_hz, talk_interval, timeout):
+    """
+    Run one concurrency level.
+
+    Returns:
+        dict: Engine/talker counts, achieved poll rate and per-endpoint summary
+    """
+    recorder = Recorder()
+    stop = threading.Event()
+    run_id = f"{os.getpid()}-{int(time.time())}"
+    threads = []
+    for i in range(engines):
+        session_id = f"loadtest-{run_id}-{i}"
+        threads.append(threading.Thread(target=poll_loop, args=(base_url, session_id, poll_hz, stop, recorder, timeout), daemon=True))
+        if i < talkers:
+            threads.append(threading.Thread(target=talk_loop, args=(base_url, session_id, talk_interval, stop, recorder, timeout), daemon=True))
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout + 1)
+    elapsed = time.perf_counter() - started
+
+    endpoints = recorder.summary(elapsed)
+    polls = endpoints.get("/start_animation", {}).get("rps", 0.0)
+    return {
+        "engines": engines,
+        "talkers": talkers,
+        "seconds": round(elapsed, 1),
+        "poll_rate_achieved": round(polls / (engines * poll_hz), 3) if engines else 0.0,
+        "endpoints": endpoints,
+        "memory": fetch_memory_stats(base_url, timeout)
+    }
+
+
+def fetch_memory_stats(base_url, timeout):
+    """The server's /memory report, or None if it is unavailable"""
+    try:
+        with urllib.request.urlopen(base_url + "/memory", timeout=timeout) as response:
+            return json.loads(response.read()).get("memory_stats")
+    except Exception:
+        return None
+
+
+def find_saturation(levels, max_p95_ms, min_poll_rate):
+    """First level whose polls fall behind, whose p95 exceeds the budget or that has errors"""
+    for level in levels:
+        polls = level["endpoints"].get("/start_animation", {})
+        reasons = []
+        if level["poll_rate_achieved"] < min_poll_rate:
+            reasons.append(f"polls at {level['poll_rate_achieved']:.0%} of target rate")
+        if polls.get("p95_ms", 0) > max_p95_ms:
+            reasons.append(f"/start_animation p95 {polls['p95_ms']} ms")
+        errors = [endpoint for endpoint, s in level["endpoints"].items() if s["error_rate"] > 0]
+        if errors:
+            reasons.append(f"errors on {', '.join(errors)}")
+        if reasons:
+            return {"engines": level["engines"], "reasons": reasons}
+    return None
+
+
+def print_level(level):
+    print(f"\n{level['engines']} engines, {level['talkers']} talking, "
+          f"{level['poll_rate_achieved']:.0%} of target poll rate")
+    print(f"{'endpoint':<18}{'reqs':>7}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for endpoint, s in level["endpoints"].items():
+        print(f"{endpoint:<18}{s['requests']:>7}{s['rps']:>8}{s['p50_ms']:>9}{s['p95_ms']:>9}"
+              f"{s['p99_ms']:>9}{s['error_rate']:>8.1%}")
+    memory = level.get("memory")
+    if memory:
+        print(f"server RSS {memory['rss_mb']} MB; " + ", ".join(
+            f"{name} +{s['rss_delta_max_mb']} MB max" for name, s in memory["stages"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate many engine clients against the server")
+    parser.add_argument("--url", default="http://127.0.0.1:5050", help="Server base URL")
+    parser.add_argument("--engines", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="Engine counts to sweep")
+    parser.add_argument("--talkers", type=float, default=0.25,
+                        help="Engines that also talk: a fraction (<1) or an absolute count")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per level")
+    parser.add_argument("--poll-hz", type=float, default=10.0, help="/start_animation polls per engine per second")
+    parser.add_argument("--talk-interval", type=float, default=5.0, help="Pause between a talker's utterances")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--max-p95-ms", type=float, default=50.0, help="/start_animation p95 budget")
+    parser.add_argument("--min-poll-rate", type=float, default=0.95, help="Fraction of the target poll rate required")
+    parser.add_argument("--upload-dir", default="uploads", help="Server uploads directory ('' to skip)")
+    parser.add_argument("--report", default=None, help="Optional path for a JSON report")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    if args.upload_dir:
+        ensure_trail_wav(args.upload_dir)
+
+    levels = []
+    for engines in args.engines:
+        talkers = int(round(engines * args.talkers)) if args.talkers < 1 else min(engines, int(args.talkers))
+        print(f"[INFO] Running {engines} engines ({talkers} talking) for {args.duration:.0f}s...")
+        level = run_level(base_url, engines, talkers, args.duration, args.poll_hz, args.talk_interval, args.timeout)
+        print_level(level)
+        levels.append(level)
+
+    saturation = find_saturation(levels, args.max_p95_ms, args.min_poll_rate)
+    if saturation:
+        print(f"\n[INFO] Saturated at {saturation['engines']} engines: {'; '.join(saturation['reasons'])}")
+    else:
+        print(f"\n[INFO] No saturation up to {args.engines[-1]} engines")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"url": base_url, "poll_hz": args.poll_hz, "levels": levels, "saturation": saturation}, f, indent=2)
+        print(f"[INFO] Report saved to: {args.report}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
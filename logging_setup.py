@@ -0,0 +1,126 @@
+"""
+Non-blocking, structured logging for the server and the pipeline.
+
+Request threads only put records on a queue (QueueHandler); a single
+listener thread formats them and writes them out, so slow stdout/stderr
+never shows up in request latency. Every record carries the request and
+session IDs of the context it was logged from (see log_context()).
+
+Modules log with logging.getLogger(__name__) and %-style arguments, so a
+message is only formatted if its level is enabled:
+    logger.debug("Extracted %d phonemes: %s", len(phonemes), phonemes)
+
+Configuration:
+    LIPRA_LOG_LEVEL   DEBUG, INFO (default), WARNING, ...
+    LIPRA_LOG_FORMAT  'text' (default) or 'json' (one object per line)
+    LIPRA_ACCESS_LOG  1 to keep werkzeug's per-request access lines
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+session_id_var = contextvars.ContextVar("session_id", default="-")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s [req=%(request_id)s session=%(session_id)s] %(message)s"
+
+_listener = None
+_listener_pid = None
+
+
+class ContextFilter(logging.Filter):
+    """Stamp records with the request/session IDs of the logging context"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.session_id = session_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "session_id": getattr(record, "session_id", "-"),
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+@contextmanager
+def log_context(request_id=None, session_id=None):
+    """Tag records logged inside the block with these IDs"""
+    tokens = []
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    if session_id is not None:
+        tokens.append((session_id_var, session_id_var.set(session_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """
+    Route all logging through a queue drained by one background thread.
+    Safe to call more than once; later calls only change the level. A forked
+    child has no listener thread, so calling it there sets up a new one.
+
+    Args:
+        level (str): Log level (defaults to LIPRA_LOG_LEVEL, then INFO)
+        fmt (str): 'text' or 'json' (defaults to LIPRA_LOG_FORMAT, then text)
+        stream: Output stream for the listener (defaults to stderr)
+    """
+    global _listener, _listener_pid
+
+    level = (level or os.environ.get("LIPRA_LOG_LEVEL", "INFO")).upper()
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None and _listener_pid == os.getpid():
+        return _listener
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    if (fmt or os.environ.get("LIPRA_LOG_FORMAT", "text")) == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    records = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(ContextFilter())
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    # werkzeug logs one line per request, i.e. 10 per second per polling avatar
+    if os.environ.get("LIPRA_ACCESS_LOG", "").lower() not in ("1", "true", "yes"):
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener = None
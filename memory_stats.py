@@ -0,0 +1,181 @@
+"""
+Memory accounting per pipeline stage and per loaded component.
+
+track(name) wraps a stage or a model/lexicon load and records how the
+process RSS changed across it and, while tracemalloc is running, the peak
+of Python allocations above the level at entry. One-off loads (names
+starting with 'load:') are reported as components, everything else is
+aggregated per stage.
+
+tracemalloc slows allocation-heavy code down noticeably, so it is off
+unless LIPRA_TRACEMALLOC=1 is set or start_tracing() is called. RSS is
+always recorded. Peaks are process-wide: with several requests in flight
+a stage's peak is an upper bound on what the stage itself allocated.
+"""
+import logging
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def rss_bytes():
+    """Current resident set size of this process, or None if unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def deep_sizeof(obj, _seen=None):
+    """Approximate size in bytes of a tree of dicts/lists/tuples and their contents"""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+class _Stage:
+    __slots__ = ('name', 'rss', 'traced', 'peak', 'started')
+
+    def __init__(self, name, rss, traced):
+        self.name = name
+        self.rss = rss
+        self.traced = traced
+        self.peak = traced
+        self.started = time.perf_counter()
+
+
+class MemoryTracker:
+    """Records RSS and tracemalloc peak deltas around named stages."""
+
+    def __init__(self, trace=False):
+        self._lock = threading.Lock()
+        self._open = []       # Stages currently running (any thread)
+        self.stages = {}      # name -> aggregate
+        self.components = {}  # name -> last load
+        self.sizes = {}       # name -> last measured object size
+        if trace:
+            self.start_tracing()
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start_tracing(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            logger.info("tracemalloc started; per-stage allocation peaks are being recorded")
+
+    def stop_tracing(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _fold_peak(self):
+        """Credit the peak since the last reset to every open stage, then reset it"""
+        if not tracemalloc.is_tracing():
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        for stage in self._open:
+            if stage.traced is not None:
+                stage.peak = max(stage.peak, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    @contextmanager
+    def track(self, name):
+        """Record the memory cost of the block under name"""
+        with self._lock:
+            current = self._fold_peak()
+            stage = _Stage(name, rss_bytes(), current)
+            self._open.append(stage)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._fold_peak()
+                self._open.remove(stage)
+                rss = rss_bytes()
+                self._record(stage, rss)
+
+    def _record(self, stage, rss):
+        rss_delta = rss - stage.rss if rss is not None and stage.rss is not None else None
+        peak_delta = stage.peak - stage.traced if stage.traced is not None else None
+        seconds = time.perf_counter() - stage.started
+
+        if stage.name.startswith('load:'):
+            self.components[stage.name[5:]] = {
+                "rss_delta_mb": _mb(rss_delta),
+                "peak_alloc_mb": _mb(peak_delta),
+                "seconds": round(seconds, 3),
+                "loaded_at": time.time()
+            }
+            return
+
+        entry = self.stages.setdefault(stage.name, {
+            "count": 0, "rss_delta_total": 0, "rss_delta_max": None,
+            "peak_count": 0, "peak_total": 0, "peak_max": None
+        })
+        entry["count"] += 1
+        if rss_delta is not None:
+            entry["rss_delta_total"] += rss_delta
+            entry["rss_delta_max"] = rss_delta if entry["rss_delta_max"] is None else max(entry["rss_delta_max"], rss_delta)
+        if peak_delta is not None:
+            entry["peak_count"] += 1
+            entry["peak_total"] += peak_delta
+            entry["peak_max"] = peak_delta if entry["peak_max"] is None else max(entry["peak_max"], peak_delta)
+
+    def record_size(self, name, obj):
+        """Remember the in-memory size of a result (e.g. a keyframe list)"""
+        size = deep_sizeof(obj)
+        with self._lock:
+            self.sizes[name] = {"mb": _mb(size), "items": len(obj) if hasattr(obj, '__len__') else None}
+        return size
+
+    def get_stats(self):
+        with self._lock:
+            stages = {}
+            for name, e in sorted(self.stages.items()):
+                stages[name] = {
+                    "count": e["count"],
+                    "rss_delta_mean_mb": _mb(e["rss_delta_total"] / e["count"]),
+                    "rss_delta_max_mb": _mb(e["rss_delta_max"]),
+                    "peak_alloc_mean_mb": _mb(e["peak_total"] / e["peak_count"]) if e["peak_count"] else None,
+                    "peak_alloc_max_mb": _mb(e["peak_max"])
+                }
+            traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+            return {
+                "rss_mb": _mb(rss_bytes()),
+                "tracing": tracemalloc.is_tracing(),
+                "traced_mb": _mb(traced),
+                "components": dict(self.components),
+                "stages": stages,
+                "sizes": dict(self.sizes)
+            }
+
+
+def _mb(value):
+    return round(value / MB, 2) if value is not None else None
+
+
+# Process-wide tracker shared by the server, the phoneme pipeline and the loaders
+memory_tracker = MemoryTracker(trace=os.environ.get('LIPRA_TRACEMALLOC', '').lower() in ('1', 'true', 'yes'))
+track = memory_tracker.track
@@ -1,39 +1,49 @@
-import speech_recognition as sr
-import whisper
-import numpy as np
+# Heavy dependencies (whisper, numpy) are imported on first use so importing this
+# module stays cheap for callers that only need PhonemeMapper or the smoothers.
+# Check the cold-start cost with: python -X importtime -c "import phonememapping"
+import logging
 import tempfile
 import os
 import re
-import subprocess
 import json
 import wave
+import itertools
+import threading
 import contextlib
-import traceback
-from gtts import gTTS
-from pathlib import Path
-import random
+from artifact_store import content_hash_name
+from lexicon import get_lexicon, CMU_VOWELS, CMU_TO_PHONEME
+from espeak_worker import get_espeak_pool, resolve_espeak_path, ipa_to_syllables, clean_word
+from rig_profiles import get_rig_profile
+from asr import load_asr_model, transcribe
+from jobs import JobCancelled, check_cancelled, run_process
+from memory_stats import track, memory_tracker
+from quality_tiers import get_quality_tier
+from visemes import REST_VISEME, build_pose_table, syllable_visemes
 
-try:
-    import nltk
-    from nltk.corpus import cmudict
+logger = logging.getLogger(__name__)
+
+# Bump whenever keyframe output changes, so renders cached on disk (canned replies) are redone
+KEYFRAME_GENERATOR_VERSION = 1
+
+def load_whisper_model(name="tiny", asr_profile=None):
+    """Load a Whisper model once per process and reuse it (shared by every component)"""
+    return load_asr_model(name, asr_profile)
+
+# Generator used by callers that do not pass their own, built on first use
+_generator = None
+_generator_lock = threading.Lock()
+
+def get_phoneme_generator():
+    """Return the process-wide EnhancedPhonemeGenerator (default rig and ASR profile)"""
+    global _generator
+    if _generator is not None:
+        return _generator
     
-    # Download required NLTK resources if not already present
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        print("Downloading NLTK punkt resource...")
-        nltk.download('punkt', quiet=True)
-        
-    try:
-        nltk.data.find('corpora/cmudict')
-    except LookupError:
-        print("Downloading NLTK cmudict resource...")
-        nltk.download('cmudict', quiet=True)
-        
-    NLTK_AVAILABLE = True
-except ImportError:
-    print("[WARNING] nltk not found. Syllable-aware phoneme mapping disabled.")
-    NLTK_AVAILABLE = False
+    with _generator_lock:
+        if _generator is None:
+            with track("load:phoneme_generator"):
+                _generator = EnhancedPhonemeGenerator()
+    return _generator
 
 class PhonemeMapper:
     def __init__(self):
@@ -523,33 +533,21 @@ class SyllablePhonemeMapper:
         # Initialize the base phoneme mapper
         self.phoneme_mapper = PhonemeMapper()
         
-        # Load CMU dictionary for syllable decomposition
-        self.cmu_dict = cmudict.dict() if cmudict.dict() else {}
+        # Shared precompiled lexicon (syllable splits are already worked out)
+        self.lexicon = get_lexicon()
         
-        # Cache for syllabified words
-        self.syllable_cache = {}
+        # Persistent espeak workers for out-of-vocabulary words
+        self.espeak_pool = get_espeak_pool()
         
         # Vowel phonemes (used for syllable detection)
-        self.vowel_phonemes = set(['AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH', 
-                                  'ER', 'EY', 'IH', 'IY', 'OW', 'OY', 'UH', 'UW'])
+        self.vowel_phonemes = CMU_VOWELS
         
         # Mapping from CMU phonemes to our phoneme set
-        self.cmu_to_phoneme = {
-            'AA': 'a', 'AE': 'æ', 'AH': 'ə', 'AO': 'ɔ',
-            'AW': 'aw', 'AY': 'ay', 'EH': 'ɛ', 'ER': 'ər',
-            'EY': 'eɪ', 'IH': 'ɪ', 'IY': 'i', 'OW': 'oʊ',
-            'OY': 'ɔɪ', 'UH': 'ʊ', 'UW': 'u',
-            'B': 'b', 'CH': 'tʃ', 'D': 'd', 'DH': 'ð',
-            'F': 'f', 'G': 'g', 'HH': 'h', 'JH': 'dʒ',
-            'K': 'k', 'L': 'l', 'M': 'm', 'N': 'n',
-            'NG': 'ŋ', 'P': 'p', 'R': 'r', 'S': 's',
-            'SH': 'ʃ', 'T': 't', 'TH': 'θ', 'V': 'v',
-            'W': 'w', 'Y': 'y', 'Z': 'z', 'ZH': 'ʒ'
-        }
+        self.cmu_to_phoneme = CMU_TO_PHONEME
     
     def word_to_syllables(self, word):
         """
-        Split a word into syllables using CMU dictionary.
+        Split a word into syllables using the precompiled CMU lexicon.
         
         Args:
             word (str): The word to syllabify
@@ -557,51 +555,23 @@ class SyllablePhonemeMapper:
         Returns:
             list: List of syllables with their phoneme sequences
         """
-        # Check cache first
         word = word.lower().strip()
-        if word in self.syllable_cache:
-            return self.syllable_cache[word]
-            
-        # Not in cache, process it
-        if word in self.cmu_dict:
-            # Get the first pronunciation (most common)
-            phonemes = self.cmu_dict[word][0]
-            
-            # Remove stress markers (numbers) from phonemes
-            clean_phonemes = [re.sub(r'\d+', '', p) for p in phonemes]
-            
-            # Identify syllables based on vowel sounds
-            syllables = []
-            current_syllable = []
-            
-            for phoneme in clean_phonemes:
-                current_syllable.append(phoneme)
-                # If this is a vowel phoneme, it's the nucleus of a syllable
-                if phoneme in self.vowel_phonemes:
-                    # Look ahead to decide where to break the syllable
-                    if len(current_syllable) > 1:
-                        syllables.append(current_syllable)
-                        current_syllable = []
-            
-            # Add any remaining phonemes to the last syllable
-            if current_syllable:
-                if syllables:
-                    syllables[-1].extend(current_syllable)
-                else:
-                    syllables.append(current_syllable)
-            
-            # Map CMU phonemes to our phoneme set
-            mapped_syllables = []
-            for syllable in syllables:
-                mapped = [self.cmu_to_phoneme.get(p, p) for p in syllable]
-                mapped_syllables.append(mapped)
-            
-            self.syllable_cache[word] = mapped_syllables
-            return mapped_syllables
-        else:
-            # Fallback: just treat each character as a potential phoneme
-            # This is a very naive approach but serves as a fallback
-            return [[char] for char in word if char.isalpha()]
+        
+        # Syllable splits and mapped phonemes are precomputed in the lexicon
+        syllables = self.lexicon.syllables(word)
+        if syllables is not None:
+            return syllables
+        
+        # Out of vocabulary: use real IPA from the espeak workers (memoised per word)
+        ipa = self.espeak_pool.phonemise([word]).get(clean_word(word))
+        if ipa:
+            syllables = ipa_to_syllables(ipa)
+            if syllables:
+                return syllables
+        
+        # Fallback: just treat each character as a potential phoneme
+        # This is a very naive approach but serves as a fallback
+        return [[char] for char in word if char.isalpha()]
     
     def text_to_syllable_phonemes(self, text):
         """
@@ -622,6 +592,11 @@ class SyllablePhonemeMapper:
             if clean_word:
                 words.append(clean_word)
         
+        # Phonemise all out-of-vocabulary words in one espeak round-trip
+        oov_words = [word for word in words if word.isalpha() and word.lower() not in self.lexicon]
+        if oov_words:
+            self.espeak_pool.phonemise(oov_words)
+        
         # Process each word into syllables
         word_syllables = []
         for word in words:
@@ -977,45 +952,27 @@ class SyllablePhonemeMapper:
         return keyframes
 
 def find_espeak_path():
-    """Find the espeak binary path"""
-    try:
-        paths = [
-            "/opt/homebrew/bin/espeak",
-            "/usr/bin/espeak",
-            "/usr/local/bin/espeak"
-        ]
-        
-        result = subprocess.run(['which', 'espeak'], capture_output=True, text=True)
-        if result.returncode == 0:
-            return result.stdout.strip()
-        
-        for path in paths:
-            if os.path.exists(path):
-                return path
-                
-        return None
-    except Exception as e:
-        print(f"Error finding espeak: {e}")
-        return None
+    """Find the espeak binary path (resolved once per process)"""
+    return resolve_espeak_path()
 
 def transcribe_audio(audio_file_path):
     """Transcribe audio using Whisper"""
     try:
-        print(f"Transcribing audio file: {audio_file_path}")
-        model = whisper.load_model("tiny")
-        result = model.transcribe(audio_file_path)
+        logger.info("Transcribing audio file: %s", audio_file_path)
+        model = load_whisper_model("tiny")
+        result = transcribe(model, audio_file_path)
         transcript = result["text"]
-        print(f"Transcription complete: {transcript}")
+        logger.info("Transcription complete: %s", transcript)
         return transcript
     except Exception as e:
-        print(f"Error transcribing audio: {e}")
+        logger.error("Error transcribing audio: %s", e)
         return "This is a test sentence for phoneme extraction."
 
 def extract_phonemes_with_espeak(text):
     """Extract phonemes using espeak"""
     espeak_path = find_espeak_path()
     if not espeak_path:
-        print("[ERROR] espeak not found")
+        logger.error("espeak not found")
         return None
         
     try:
@@ -1023,22 +980,12 @@ def extract_phonemes_with_espeak(text):
         clean_text = re.sub(r'[^\w\s.,?!-]', '', text)
         clean_text = clean_text.encode('ascii', 'ignore').decode()
         
-        # Create temp file for text
-        temp_text_path = tempfile.NamedTemporaryFile(mode='w', suffix=".txt", delete=False).name
-        with open(temp_text_path, 'w') as f:
-            f.write(clean_text)
-        
-        # Get phonemes from espeak
-        cmd = [espeak_path, "--ipa", "-q", "-f", temp_text_path]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            print(f"[ERROR] espeak command failed: {result.stderr}")
+        # Phonemise the whole text on a persistent espeak worker, keeping sentence context
+        raw_phonemes = get_espeak_pool().phonemise_text(clean_text)
+        if raw_phonemes is None:
+            logger.error("espeak phonemisation failed")
             return None
-        
-        # Process phonemes
-        raw_phonemes = result.stdout.strip()
-        print(f"[INFO] Raw espeak output: {raw_phonemes}")
+        logger.debug("Raw espeak output: %s", raw_phonemes)
         
         # Split into individual phonemes
         phonemes = []
@@ -1052,15 +999,11 @@ def extract_phonemes_with_espeak(text):
         if current:
             phonemes.append(current)
         
-        # Clean up
-        os.remove(temp_text_path)
-        
-        print(f"[INFO] Extracted {len(phonemes)} phonemes: {phonemes}")
+        logger.debug("Extracted %d phonemes: %s", len(phonemes), phonemes)
         return phonemes
         
     except Exception as e:
-        print(f"[ERROR] Failed to extract phonemes: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Failed to extract phonemes: %s", e)
         return None
 
 def get_audio_duration(audio_file):
@@ -1072,7 +1015,7 @@ def get_audio_duration(audio_file):
             duration = frames / float(rate)
         return duration
     except Exception as e:
-        print(f"Error getting audio duration: {e}")
+        logger.error("Error getting audio duration: %s", e)
         return 3.0  # Default duration for testing
 
 def normalize_audio(input_file):
@@ -1080,8 +1023,8 @@ def normalize_audio(input_file):
     try:
         output_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False).name
         
-        # Run ffmpeg normalization
-        subprocess.run([
+        # Run ffmpeg normalization (terminated if the reply is cancelled)
+        run_process([
             'ffmpeg',
             '-y',  # Overwrite output file
             '-i', input_file,
@@ -1093,145 +1036,363 @@ def normalize_audio(input_file):
         ], check=True, capture_output=True)
         
         return output_file
+    except JobCancelled:
+        os.remove(output_file)
+        raise
     except Exception as e:
-        print(f"[ERROR] Audio normalization failed: {e}")
+        logger.error("Audio normalization failed: %s", e)
         return None
 
-def process_audio_to_phonemes(audio_file_path, output_dir=None):
-    """Process audio file to generate accurate phoneme keyframes"""
+def frame_rms(audio_file, frame_seconds=0.02):
+    """
+    RMS level of each frame of a 16-bit WAV file.
+    
+    Returns:
+        tuple: (rms array, frame length in seconds), or None if the file
+        cannot be read or is shorter than one frame
+    """
+    import numpy as np
+    
     try:
-        print(f"[INFO] Processing audio file: {audio_file_path}")
+        with wave.open(audio_file, 'rb') as wav_file:
+            rate = wav_file.getframerate()
+            channels = wav_file.getnchannels()
+            samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')[::channels]
+    except Exception as e:
+        logger.warning("Could not read %s for level analysis: %s", audio_file, e)
+        return None
+    
+    frame = max(1, int(rate * frame_seconds))
+    count = len(samples) // frame
+    if count == 0:
+        return None
+    frames = samples[:count * frame].astype(np.float32).reshape(count, frame)
+    return np.sqrt(np.mean(frames ** 2, axis=1)), frame / rate
+
+def voiced_span(audio_file, frame_seconds=0.02, threshold_ratio=0.1):
+    """
+    Start and end (seconds) of the part of a WAV file that is not silence.
+    
+    A frame is voiced when its RMS exceeds threshold_ratio of the loudest
+    frame's RMS. Returns None if the file cannot be read or is silent.
+    """
+    import numpy as np
+    
+    levels = frame_rms(audio_file, frame_seconds)
+    if levels is None:
+        return None
+    rms, frame_length = levels
+    if rms.max() == 0:
+        return None
+    voiced = np.nonzero(rms > rms.max() * threshold_ratio)[0]
+    return float(voiced[0] * frame_length), float((voiced[-1] + 1) * frame_length)
+
+def split_at_pauses(audio_file, chunk_seconds, search_seconds=1.0, frame_seconds=0.02):
+    """
+    Cut a WAV file into pieces of about chunk_seconds, each cut placed at the
+    quietest frame within search_seconds of the target, so cuts fall between
+    words rather than inside them.
+    
+    Returns:
+        list: (start, end) spans in seconds covering the whole file
+    """
+    import numpy as np
+    
+    levels = frame_rms(audio_file, frame_seconds)
+    if levels is None:
+        return []
+    rms, frame_length = levels
+    duration = len(rms) * frame_length
+    
+    cuts = [0.0]
+    while duration - cuts[-1] > chunk_seconds + search_seconds:
+        target = cuts[-1] + chunk_seconds
+        low = int((target - search_seconds) / frame_length)
+        high = int((target + search_seconds) / frame_length) + 1
+        cuts.append(float((low + int(np.argmin(rms[low:high]))) * frame_length))
+    cuts.append(get_audio_duration(audio_file))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+def slice_wav(audio_file, start, end):
+    """Copy [start, end) seconds of a WAV file into a temporary WAV file and return its path"""
+    with wave.open(audio_file, 'rb') as source:
+        rate = source.getframerate()
+        source.setpos(int(start * rate))
+        frames = source.readframes(int((end - start) * rate))
+        params = source.getparams()
+    
+    output_file = tempfile.NamedTemporaryFile(suffix=".wav", delete=False).name
+    with wave.open(output_file, 'wb') as target:
+        target.setparams(params)
+        target.writeframes(frames)
+    return output_file
+
+# Keyframe fields that label a keyframe rather than animate the face
+NON_CHANNEL_KEYS = ('time', 'word', 'syllable', 'phoneme')
+
+def resample_keyframes(keyframes, duration, frame_rate=60):
+    """
+    Resample keyframes onto a fixed frame grid.
+    
+    Frame i is at i / frame_rate, so the engine can fetch the pose for any
+    time by direct index instead of searching for the bracketing keyframes.
+    Values between source keyframes use the same ease-in-out curve the engine
+    applies, so playback looks the same as with the irregular keyframes.
+    
+    Args:
+        keyframes (list): Time-sorted keyframes
+        duration (float): Audio duration in seconds (the grid covers 0..duration)
+        frame_rate (int): Frames per second
+        
+    Returns:
+        list: One keyframe per frame, with the same channels as the input
+    """
+    if not keyframes:
+        return []
+    import numpy as np
+    
+    # Flatten every channel (vector coordinates included) into one column
+    columns = []
+    for key, value in keyframes[0].items():
+        if key in NON_CHANNEL_KEYS:
+            continue
+        if isinstance(value, dict):
+            columns.extend((key, coord) for coord in value)
+        else:
+            columns.append((key, None))
+    
+    times = np.array([kf['time'] for kf in keyframes], dtype=np.float64)
+    values = np.array([
+        [kf.get(key, {}).get(coord, 0.0) if coord else kf.get(key, 0.0) for key, coord in columns]
+        for kf in keyframes
+    ], dtype=np.float64)
+    
+    frame_count = int(np.floor(max(duration, times[-1]) * frame_rate)) + 1
+    frame_times = np.arange(frame_count, dtype=np.float64) / frame_rate
+    
+    # Bracketing source keyframes for every frame at once
+    if len(times) > 1:
+        upper = np.clip(np.searchsorted(times, frame_times, side='right'), 1, len(times) - 1)
+    else:
+        upper = np.zeros(frame_count, dtype=np.intp)
+    lower = np.maximum(upper - 1, 0)
+    span = times[upper] - times[lower]
+    alpha = np.divide(frame_times - times[lower], span, out=np.zeros(frame_count), where=span > 0)
+    alpha = np.clip(alpha, 0.0, 1.0)
+    alpha = alpha * alpha * (3 - 2 * alpha)
+    
+    frames = values[lower] + (values[upper] - values[lower]) * alpha[:, None]
+    frames = np.round(frames, 3)
+    
+    resampled = []
+    for i in range(frame_count):
+        frame = {'time': round(float(frame_times[i]), 4)}
+        for column, (key, coord) in enumerate(columns):
+            value = float(frames[i, column])
+            if coord:
+                frame.setdefault(key, {})[coord] = value
+            else:
+                frame[key] = value
+        resampled.append(frame)
+    
+    return resampled
+
+def process_audio_to_phonemes(audio_file_path, output_dir=None, generator=None, output_name=None, transcript=None, store=None, frame_rate=None, quality_tier=None,
+                              output_format='keyframes'):
+    """
+    Process audio file to generate accurate phoneme keyframes
+    
+    Args:
+        audio_file_path (str): Path to the WAV file
+        output_dir (str): Directory for the keyframes JSON
+        generator (EnhancedPhonemeGenerator): Reuse an existing generator instead of building one
+        output_name (str): Fixed output file name (defaults to one derived from the content hash)
+        transcript (str): Known transcript used to guide Whisper's word alignment
+        store (ArtifactStore): Save into this store instead of output_dir
+        frame_rate (int): Resample onto a fixed grid at this many frames per second
+        quality_tier (str): Quality tier from quality_tiers.py (defaults to 'full')
+        output_format (str): 'keyframes', or 'visemes' for compact records against
+            the generator's pose table (see visemes.py; frame_rate does not apply)
+        
+    Returns:
+        str: Path of the keyframes JSON, or None on failure
+    """
+    normalized_audio = None
+    try:
+        logger.info("Processing audio file: %s", audio_file_path)
         
         # First normalize audio using ffmpeg
-        normalized_audio = normalize_audio(audio_file_path)
+        with track("keyframes:normalize"):
+            normalized_audio = normalize_audio(audio_file_path)
         if not normalized_audio:
-            print("[ERROR] Failed to normalize audio")
+            logger.error("Failed to normalize audio")
             return None
             
         # Get audio duration
         with wave.open(normalized_audio, 'rb') as wav_file:
             duration = wav_file.getnframes() / float(wav_file.getframerate())
         
-        print(f"[INFO] Audio duration: {duration} seconds")
+        logger.info("Audio duration: %s seconds", duration)
         
-        # Initialize enhanced phoneme generator
-        generator = EnhancedPhonemeGenerator()
+        # Shared enhanced phoneme generator unless the caller brings its own
+        if generator is None:
+            generator = get_phoneme_generator()
         
+        check_cancelled("keyframes")
         # Generate keyframes using the enhanced system
-        keyframes = generator.generate_keyframes(normalized_audio, duration)
-        
-        if not keyframes:
-            print("[ERROR] Failed to generate keyframes")
-            return None
-            
-        # Package the result
-        result = {
-            "keyframes": keyframes,
-            "duration": duration
-        }
+        tier = get_quality_tier(quality_tier)
+        if output_format == 'visemes':
+            records = generator.generate_visemes(normalized_audio, duration, transcript=transcript, quality_tier=tier["name"])
+            if not records:
+                logger.error("Failed to generate visemes")
+                return None
+            memory_tracker.record_size("visemes", records)
+            
+            result = {
+                "format": "visemes",
+                "visemes": records,
+                "pose_table": generator.pose_table()["version"],
+                "duration": duration,
+                "rig_profile": generator.rig.name,
+                "quality_tier": tier["name"]
+            }
+        else:
+            keyframes = generator.generate_keyframes(normalized_audio, duration, transcript=transcript, quality_tier=tier["name"])
+            
+            if not keyframes:
+                logger.error("Failed to generate keyframes")
+                return None
+            memory_tracker.record_size("keyframes", keyframes)
+            
+            # Package the result
+            result = {
+                "keyframes": keyframes,
+                "duration": duration,
+                "rig_profile": generator.rig.name,
+                "quality_tier": tier["name"]
+            }
         
-        # Save output with random number to avoid conflicts
-        random_num = random.randint(1000, 9999)
-        output_file = os.path.join(output_dir, f"responsekeyframes{random_num}.json")
+        # Fixed-rate output lets the engine index frames directly
+        if frame_rate and output_format != 'visemes':
+            result["keyframes"] = resample_keyframes(keyframes, duration, frame_rate)
+            result["frame_rate"] = frame_rate
         
-        with open(output_file, 'w') as f:
-            json.dump(result, f, indent=2)
+        # Save output named by its content hash so names never collide
+        if store is not None and output_name is None:
+            output_file = store.put_json(result)
+        else:
+            if output_name is None:
+                output_name, _ = content_hash_name(result)
+            output_file = os.path.join(output_dir, output_name)
+            
+            with open(output_file, 'w') as f:
+                json.dump(result, f, indent=2)
             
-        print(f"[INFO] Successfully generated {len(keyframes)} keyframes")
-        print(f"[INFO] Output saved to: {output_file}")
+        logger.info("Successfully generated %s %s", len(result.get('keyframes', result.get('visemes'))), output_format)
+        logger.info("Output saved to: %s", output_file)
         
         return output_file
             
+    except JobCancelled:
+        raise
     except Exception as e:
-        print(f"[ERROR] Failed to process audio: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Failed to process audio: %s", e)
         return None
+    finally:
+        # Remove the normalized temp copy
+        if normalized_audio and os.path.exists(normalized_audio):
+            os.remove(normalized_audio)
+
+# When streaming, Whisper aligns the audio in pieces of about this length, so
+# the first keyframes wait for one piece rather than the whole file
+STREAM_CHUNK_SECONDS = 8.0
+
+def stream_audio_to_keyframe_blocks(audio_file_path, generator=None, transcript=None, quality_tier=None):
+    """
+    Incremental counterpart of process_audio_to_phonemes.
+    
+    Word timings are consumed as they are produced: Whisper alignment runs
+    one STREAM_CHUNK_SECONDS piece at a time (see iter_word_timings), and
+    keyframes for a piece's words are released before the next piece is
+    transcribed. Audio shorter than one piece is aligned in a single pass.
+    
+    Yields:
+        dict: {'duration': seconds} first, then {'keyframes': [...]} for each
+        block of finalised keyframes as soon as it is ready
+    """
+    normalized_audio = normalize_audio(audio_file_path)
+    if not normalized_audio:
+        logger.error("Failed to normalize audio")
+        return
+    
+    try:
+        with wave.open(normalized_audio, 'rb') as wav_file:
+            duration = wav_file.getnframes() / float(wav_file.getframerate())
+        yield {"duration": duration}
+        
+        if generator is None:
+            generator = get_phoneme_generator()
+        
+        tier = get_quality_tier(quality_tier)
+        words = iter(generator.iter_aligned_words(normalized_audio, duration, transcript, tier))
+        first = next(words, None)
+        if first is None:
+            logger.error("No word timings extracted")
+            return
+        
+        word_timings = itertools.chain([first], words)
+        for block in generator.iter_keyframe_blocks(word_timings, duration, num_intermediates=tier["num_intermediates"],
+                                                    sigma=tier["sigma"], window_size=tier["window_size"]):
+            yield {"keyframes": block}
+    finally:
+        os.remove(normalized_audio)
 
 class WordTimingExtractor:
     """Extracts precise word timing information from audio using Whisper."""
     
-    def __init__(self):
-        self.model = whisper.load_model("tiny")
-        if NLTK_AVAILABLE:
-            self.cmu_dict = cmudict.dict()
-        else:
-            self.cmu_dict = {}
+    def __init__(self, asr_profile=None):
+        self.asr_profile = asr_profile
+        self.model = load_whisper_model("tiny", asr_profile)
+        self.lexicon = get_lexicon()
             
     def get_word_phonemes(self, word):
         """Get the phoneme sequence for a word using CMU dictionary."""
         word = word.lower().strip()
-        if word in self.cmu_dict:
-            # Get first pronunciation from CMU dict
-            phones = self.cmu_dict[word][0]
-            # Convert CMU format to our phoneme format
-            phoneme_seq = []
-            for phone in phones:
-                # Remove stress markers
-                phone = ''.join([c for c in phone if not c.isdigit()])
-                phoneme_seq.append(phone)
-            return phoneme_seq
+        # Stress-stripped CMU phones are precomputed in the lexicon
+        phones = self.lexicon.phones(word)
+        if phones is not None:
+            return list(phones)
         return [word]  # Return word itself if not found
         
-    def extract_word_timings(self, audio_file):
+    def extract_word_timings(self, audio_file, transcript=None):
         """
         Extract word-level timing information from audio.
         
         Args:
             audio_file (str): Path to audio file
+            transcript (str): Optional known transcript, passed to Whisper as the
+                initial prompt. This only biases recognition; it is not forced
+                alignment, and Whisper may still emit different words.
             
         Returns:
             list: List of dictionaries containing word timing information
         """
         try:
-            print("[INFO] Transcribing with Whisper...")
+            logger.info("Transcribing with Whisper...")
             # Get the transcription with word timestamps
-            result = self.model.transcribe(
+            result = transcribe(
+                self.model,
                 audio_file,
+                self.asr_profile,
                 language="en",
-                word_timestamps=True
+                word_timestamps=True,
+                initial_prompt=transcript
             )
             
-            word_timings = []
-            audio_duration = 0.0
-            
-            # Process each segment
-            for segment in result["segments"]:
-                if "words" not in segment:
-                    continue
-                    
-                # Keep track of the total duration
-                if segment["end"] > audio_duration:
-                    audio_duration = segment["end"]
-                    
-                # Process each word in the segment
-                for word_data in segment["words"]:
-                    if not word_data.get("text"):
-                        continue
-                        
-                    # Clean the word text
-                    word = word_data["text"].strip()
-                    if not word:
-                        continue
-                        
-                    # Get timing information
-                    start = word_data["start"]
-                    end = word_data["end"]
-                    
-                    # Get phonemes for this word
-                    phonemes = self.get_word_phonemes(word)
-                    
-                    # Create word timing entry
-                    word_timing = {
-                        "word": word,
-                        "start": start,
-                        "end": end,
-                        "phonemes": phonemes
-                    }
-                    
-                    word_timings.append(word_timing)
+            word_timings = self._segment_words(result)
             
             if not word_timings:
-                print("[WARNING] No word timings found, using fallback...")
+                logger.warning("No word timings found, using fallback...")
                 # Get duration from audio file if available
                 try:
                     with contextlib.closing(wave.open(audio_file, 'r')) as f:
@@ -1239,18 +1400,92 @@ class WordTimingExtractor:
                         rate = f.getframerate()
                         audio_duration = frames / float(rate)
                 except Exception as e:
-                    print(f"[WARNING] Could not get audio duration: {e}")
+                    logger.warning("Could not get audio duration: %s", e)
                     audio_duration = 3.0  # Default fallback duration
                 
                 return self._fallback_word_timing(result["text"], audio_duration)
                 
-            print(f"[INFO] Extracted timing for {len(word_timings)} words")
+            logger.info("Extracted timing for %s words", len(word_timings))
             return word_timings
             
         except Exception as e:
-            print(f"[ERROR] Failed to extract word timings: {str(e)}")
-            traceback.print_exc()
+            logger.exception("Failed to extract word timings: %s", e)
             return None
+    
+    def iter_word_timings(self, audio_file, transcript=None, chunk_seconds=STREAM_CHUNK_SECONDS):
+        """
+        Word timings yielded a piece of audio at a time.
+        
+        The audio is cut at pauses into pieces of about chunk_seconds (see
+        split_at_pauses) and each piece is transcribed on its own, so the
+        first words are available after one piece instead of the whole file.
+        Audio no longer than one piece is a single extract_word_timings call.
+        
+        Args:
+            audio_file (str): Path to a 16-bit WAV file
+            transcript (str): Optional known transcript, passed to every piece
+                as the initial prompt (a recognition hint, as in extract_word_timings)
+            chunk_seconds (float): Target piece length
+            
+        Yields:
+            dict: Word timing entries ('word', 'start', 'end', 'phonemes') in time order
+        """
+        spans = split_at_pauses(audio_file, chunk_seconds)
+        if len(spans) <= 1:
+            yield from self.extract_word_timings(audio_file, transcript=transcript) or []
+            return
+        
+        texts = []
+        found = False
+        for start, end in spans:
+            piece = slice_wav(audio_file, start, end)
+            try:
+                result = transcribe(
+                    self.model,
+                    piece,
+                    self.asr_profile,
+                    language="en",
+                    word_timestamps=True,
+                    initial_prompt=transcript
+                )
+            except Exception as e:
+                logger.exception("Failed to extract word timings for %.1f-%.1fs: %s", start, end, e)
+                return
+            finally:
+                os.remove(piece)
+            
+            texts.append(result["text"])
+            for word_timing in self._segment_words(result, offset=start):
+                found = True
+                yield word_timing
+        
+        if not found:
+            logger.warning("No word timings found, using fallback...")
+            yield from self._fallback_word_timing(" ".join(texts), spans[-1][1]) or []
+    
+    def _segment_words(self, result, offset=0.0):
+        """Word timing entries from a Whisper result, shifted by offset seconds"""
+        word_timings = []
+        for segment in result["segments"]:
+            if "words" not in segment:
+                continue
+            
+            for word_data in segment["words"]:
+                if not word_data.get("text"):
+                    continue
+                
+                # Clean the word text
+                word = word_data["text"].strip()
+                if not word:
+                    continue
+                
+                word_timings.append({
+                    "word": word,
+                    "start": word_data["start"] + offset,
+                    "end": word_data["end"] + offset,
+                    "phonemes": self.get_word_phonemes(word)
+                })
+        return word_timings
             
     def _fallback_word_timing(self, text, duration):
         """Fallback method to generate approximate word timings."""
@@ -1278,16 +1513,16 @@ class SyllableAnalyzer:
     """Analyzes words for syllable count and timing."""
     
     def __init__(self):
-        self.cmu_dict = cmudict.dict() if NLTK_AVAILABLE else {}
+        self.lexicon = get_lexicon()
         
     def count_syllables(self, word):
         """Count syllables in a word using CMU dictionary."""
         word = word.lower().strip()
         
-        # Try CMU dictionary first
-        if word in self.cmu_dict:
-            phones = self.cmu_dict[word][0]  # Get first pronunciation
-            return len([ph for ph in phones if ph[-1].isdigit()])  # Count stress markers
+        # Try CMU dictionary first (counts are precomputed in the lexicon)
+        syllable_count = self.lexicon.syllable_count(word)
+        if syllable_count is not None:
+            return syllable_count
             
         # Fallback: count vowel sequences
         count = 0
@@ -1336,11 +1571,101 @@ class SyllableAnalyzer:
 class EnhancedPhonemeGenerator:
     """Generates enhanced phoneme-based facial animation."""
     
-    def __init__(self):
-        self.word_extractor = WordTimingExtractor()
+    def __init__(self, rig_profile=None, asr_profile=None):
+        self.word_extractor = WordTimingExtractor(asr_profile)
         self.syllable_analyzer = SyllableAnalyzer()
         self.phoneme_mapper = PhonemeMapper()
         
+        # Only the channels this rig drives are generated and shipped
+        self.rig = get_rig_profile(rig_profile)
+        self._pose_table = None
+    
+    def channel_values(self, phoneme):
+        """Facial channel values for a phoneme, limited to the rig's channels"""
+        return self.rig.select(self.phoneme_mapper.get_values(phoneme))
+        
+    def gaussian_kernel(self, sigma=1.5, window_size=5):
+        """Normalised Gaussian kernel used by the smoothers"""
+        import numpy as np
+        
+        x = np.linspace(-2, 2, window_size)
+        kernel = np.exp(-(x ** 2) / (2 * sigma ** 2))
+        return kernel / np.sum(kernel)
+    
+    def smooth_keyframe(self, window, center, kernel):
+        """
+        Gaussian-weighted average of one keyframe over its window.
+        
+        Args:
+            window (list): Unsmoothed keyframes around the one being smoothed
+            center (int): Index of the keyframe being smoothed within window
+            kernel (ndarray): Full Gaussian kernel from gaussian_kernel
+            
+        Returns:
+            dict: Smoothed keyframe
+        """
+        import numpy as np
+        
+        window_size = len(kernel)
+        kernel_half_size = window_size // 2
+        keyframe = window[center]
+        
+        # Adjust kernel size if window is smaller than expected
+        if len(window) < window_size:
+            # Create a subset of the kernel that matches the window size
+            kernel_subset = kernel[kernel_half_size - center:kernel_half_size + (len(window) - center)]
+            kernel_subset = kernel_subset / np.sum(kernel_subset)  # Renormalize
+        else:
+            kernel_subset = kernel
+            
+        # Create smoothed keyframe with metadata preserved
+        smoothed_kf = {
+            'time': keyframe['time'],
+            'word': keyframe.get('word', ''),
+            'syllable': keyframe.get('syllable', '')
+        }
+        
+        # For each parameter, apply Gaussian weighting
+        for param in keyframe:
+            if param in ['time', 'word', 'syllable', 'phoneme']:
+                continue
+                
+            if isinstance(keyframe[param], dict):
+                # Handle vector values (like jawValue)
+                smoothed_kf[param] = {}
+                for coord in keyframe[param]:
+                    # Extract values from all keyframes in window
+                    values = []
+                    for kf in window:
+                        if param in kf and coord in kf[param]:
+                            values.append(kf[param][coord])
+                        else:
+                            values.append(0.0)  # Default if missing
+                            
+                    # Apply weighted average using Gaussian kernel
+                    if len(values) == len(kernel_subset):
+                        smoothed_val = sum(v * k for v, k in zip(values, kernel_subset))
+                        smoothed_kf[param][coord] = round(smoothed_val, 3)
+                    else:
+                        smoothed_kf[param][coord] = keyframe[param][coord]
+            else:
+                # Handle scalar values
+                values = []
+                for kf in window:
+                    if param in kf:
+                        values.append(kf[param])
+                    else:
+                        values.append(0.0)  # Default if missing
+                        
+                # Apply weighted average using Gaussian kernel
+                if len(values) == len(kernel_subset):
+                    smoothed_val = sum(v * k for v, k in zip(values, kernel_subset))
+                    smoothed_kf[param] = round(smoothed_val, 3)
+                else:
+                    smoothed_kf[param] = keyframe[param]
+        
+        return smoothed_kf
+    
     def gaussian_smooth_keyframes(self, keyframes, sigma=1.5, window_size=5):
         """
         Apply Gaussian smoothing to keyframe values for smoother transitions.
@@ -1358,9 +1683,7 @@ class EnhancedPhonemeGenerator:
             
         # Generate Gaussian kernel
         kernel_half_size = window_size // 2
-        x = np.linspace(-2, 2, window_size)
-        kernel = np.exp(-(x ** 2) / (2 * sigma ** 2))
-        kernel = kernel / np.sum(kernel)
+        kernel = self.gaussian_kernel(sigma, window_size)
         
         smoothed = []
         # Keep first and last keyframes unchanged for proper start/end poses
@@ -1371,67 +1694,75 @@ class EnhancedPhonemeGenerator:
             # Get window of frames
             start_idx = max(0, i - kernel_half_size)
             end_idx = min(len(keyframes), i + kernel_half_size + 1)
-            window = keyframes[start_idx:end_idx]
+            smoothed.append(self.smooth_keyframe(keyframes[start_idx:end_idx], i - start_idx, kernel))
+        
+        # Add last keyframe unchanged
+        smoothed.append(keyframes[-1])
+        return smoothed
+    
+    def interpolate_keyframes(self, prev_kf, curr_kf, num_intermediates=1):
+        """
+        Eased intermediate keyframes between two keyframes.
+        
+        Returns:
+            list: Intermediate keyframes (empty if the keyframes are too close together)
+        """
+        # Calculate time step between keyframes
+        time_step = (curr_kf['time'] - prev_kf['time']) / (num_intermediates + 1)
+        
+        # Skip if keyframes are too close together
+        if time_step < 0.015:  # Less than 15ms apart
+            return []
             
-            # Adjust kernel size if window is smaller than expected
-            if len(window) < window_size:
-                # Create a subset of the kernel that matches the window size
-                kernel_subset = kernel[kernel_half_size - (i - start_idx):kernel_half_size + (end_idx - i)]
-                kernel_subset = kernel_subset / np.sum(kernel_subset)  # Renormalize
-            else:
-                kernel_subset = kernel
-                
-            # Create smoothed keyframe with metadata preserved
-            smoothed_kf = {
-                'time': keyframes[i]['time'],
-                'word': keyframes[i].get('word', ''),
-                'syllable': keyframes[i].get('syllable', '')
+        intermediates = []
+        
+        # Add intermediate keyframes with eased values
+        for j in range(1, num_intermediates + 1):
+            # Use cubic ease-in-out for more natural transitions
+            t = j / (num_intermediates + 1)
+            # Apply cubic easing: t^2 * (3 - 2t)
+            t_eased = t * t * (3 - 2 * t)
+            
+            intermediate_time = prev_kf['time'] + (time_step * j)
+            
+            # Create intermediate keyframe
+            intermediate_kf = {
+                'time': round(intermediate_time, 3),
+                'word': prev_kf.get('word', ''),
+                'syllable': prev_kf.get('syllable', '') + "_intermediate"
             }
             
-            # For each parameter, apply Gaussian weighting
-            for param in keyframes[i]:
+            # Interpolate values
+            for param in prev_kf:
                 if param in ['time', 'word', 'syllable', 'phoneme']:
                     continue
                     
-                if isinstance(keyframes[i][param], dict):
+                if param not in curr_kf:
+                    intermediate_kf[param] = prev_kf[param]
+                    continue
+                    
+                if isinstance(prev_kf[param], dict):
                     # Handle vector values (like jawValue)
-                    smoothed_kf[param] = {}
-                    for coord in keyframes[i][param]:
-                        # Extract values from all keyframes in window
-                        values = []
-                        for j, kf in enumerate(window):
-                            if param in kf and coord in kf[param]:
-                                values.append(kf[param][coord])
-                            else:
-                                values.append(0.0)  # Default if missing
-                                
-                        # Apply weighted average using Gaussian kernel
-                        if len(values) == len(kernel_subset):
-                            smoothed_val = sum(v * k for v, k in zip(values, kernel_subset))
-                            smoothed_kf[param][coord] = round(smoothed_val, 3)
+                    intermediate_kf[param] = {}
+                    for coord in prev_kf[param]:
+                        if coord in curr_kf[param]:
+                            # Linear interpolation between values
+                            start_val = prev_kf[param][coord]
+                            end_val = curr_kf[param][coord]
+                            interp_val = start_val + (end_val - start_val) * t_eased
+                            intermediate_kf[param][coord] = round(interp_val, 3)
                         else:
-                            smoothed_kf[param][coord] = keyframes[i][param][coord]
+                            intermediate_kf[param][coord] = prev_kf[param][coord]
                 else:
                     # Handle scalar values
-                    values = []
-                    for j, kf in enumerate(window):
-                        if param in kf:
-                            values.append(kf[param])
-                        else:
-                            values.append(0.0)  # Default if missing
-                            
-                    # Apply weighted average using Gaussian kernel
-                    if len(values) == len(kernel_subset):
-                        smoothed_val = sum(v * k for v, k in zip(values, kernel_subset))
-                        smoothed_kf[param] = round(smoothed_val, 3)
-                    else:
-                        smoothed_kf[param] = keyframes[i][param]
+                    start_val = prev_kf[param]
+                    end_val = curr_kf[param]
+                    interp_val = start_val + (end_val - start_val) * t_eased
+                    intermediate_kf[param] = round(interp_val, 3)
             
-            smoothed.append(smoothed_kf)
+            intermediates.append(intermediate_kf)
         
-        # Add last keyframe unchanged
-        smoothed.append(keyframes[-1])
-        return smoothed
+        return intermediates
     
     def generate_intermediate_keyframes(self, keyframes, num_intermediates=1):
         """
@@ -1450,200 +1781,308 @@ class EnhancedPhonemeGenerator:
         expanded_keyframes = [keyframes[0]]  # Start with first keyframe
         
         for i in range(1, len(keyframes)):
-            prev_kf = keyframes[i-1]
-            curr_kf = keyframes[i]
+            expanded_keyframes.extend(self.interpolate_keyframes(keyframes[i-1], keyframes[i], num_intermediates))
             
-            # Calculate time step between keyframes
-            time_step = (curr_kf['time'] - prev_kf['time']) / (num_intermediates + 1)
+            # Add current keyframe
+            expanded_keyframes.append(keyframes[i])
+        
+        return expanded_keyframes
+    
+    def rest_keyframe(self, time):
+        """Rest pose with the jaw closed"""
+        return {
+            'time': time,
+            **self.channel_values('rest'),
+            **self.rig.jaw(0.0)  # Closed jaw
+        }
+    
+    def word_beats(self, word_data, syllables):
+        """
+        Timing of one word's keyframes, shared by keyframe and viseme output.
+        
+        Returns:
+            list: (time, syllable label, jaw opening, syllable index) tuples
+        """
+        start_time = word_data['start']
+        end_time = word_data['end']
+        duration = end_time - start_time
+        
+        # Always add word start with open jaw
+        beats = [(start_time, 'start', 0.4, 0)]
+        
+        if syllables == 0 or syllables == 1:
+            # For words with no syllables or single syllable
+            beats.append((start_time + (duration * 0.1), 'syllable_1_start', 0.4, 0))  # Slightly after word start, open jaw
+            beats.append((end_time - (duration * 0.1), 'syllable_1_end', 0.2, 0))      # Slightly before word end, partial close
+            beats.append((end_time, 'end', 0.0, 0))                                    # Close jaw completely
+        else:
+            # Handle multi-syllable words
+            syllable_duration = duration / syllables
             
-            # Skip if keyframes are too close together
-            if time_step < 0.015:  # Less than 15ms apart
-                expanded_keyframes.append(curr_kf)
-                continue
+            for i in range(syllables):
+                syllable_start = start_time + (i * syllable_duration)
+                syllable_end = syllable_start + syllable_duration
                 
-            # Add intermediate keyframes with eased values
-            for j in range(1, num_intermediates + 1):
-                # Use cubic ease-in-out for more natural transitions
-                t = j / (num_intermediates + 1)
-                # Apply cubic easing: t^2 * (3 - 2t)
-                t_eased = t * t * (3 - 2 * t)
+                # Open jaw at each syllable start
+                beats.append((syllable_start, f"syllable_{i+1}_start", 0.4, i))
                 
-                intermediate_time = prev_kf['time'] + (time_step * j)
-                
-                # Create intermediate keyframe
-                intermediate_kf = {
-                    'time': round(intermediate_time, 3),
-                    'word': prev_kf.get('word', ''),
-                    'syllable': prev_kf.get('syllable', '') + "_intermediate"
-                }
-                
-                # Interpolate values
-                for param in prev_kf:
-                    if param in ['time', 'word', 'syllable', 'phoneme']:
-                        continue
-                        
-                    if param not in curr_kf:
-                        intermediate_kf[param] = prev_kf[param]
-                        continue
-                        
-                    if isinstance(prev_kf[param], dict):
-                        # Handle vector values (like jawValue)
-                        intermediate_kf[param] = {}
-                        for coord in prev_kf[param]:
-                            if coord in curr_kf[param]:
-                                # Linear interpolation between values
-                                start_val = prev_kf[param][coord]
-                                end_val = curr_kf[param][coord]
-                                interp_val = start_val + (end_val - start_val) * t_eased
-                                intermediate_kf[param][coord] = round(interp_val, 3)
-                            else:
-                                intermediate_kf[param][coord] = prev_kf[param][coord]
-                    else:
-                        # Handle scalar values
-                        start_val = prev_kf[param]
-                        end_val = curr_kf[param]
-                        interp_val = start_val + (end_val - start_val) * t_eased
-                        intermediate_kf[param] = round(interp_val, 3)
-                
-                expanded_keyframes.append(intermediate_kf)
+                # Close slightly before next syllable: partial close between syllables, full close at end
+                between_time = syllable_end - (syllable_duration * 0.2)
+                beats.append((between_time, f"syllable_{i+1}_end", 0.2 if i < syllables - 1 else 0.0, i))
             
-            # Add current keyframe
-            expanded_keyframes.append(curr_kf)
+            # Add final word end if not already added
+            if beats[-1][0] < end_time:
+                beats.append((end_time, 'end', 0.0, syllables - 1))
         
-        return expanded_keyframes
+        return beats
+    
+    def word_keyframes(self, word_data):
+        """Raw (unsorted, unsmoothed) keyframes for one timed word"""
+        word = word_data['word']
         
-    def generate_keyframes(self, audio_file, duration):
-        """Generate keyframes based on word timing and syllable analysis."""
-        # Extract word timings with phonemes
-        word_timings = self.word_extractor.extract_word_timings(audio_file)
+        # Get syllables for this word
+        syllables = self.syllable_analyzer.count_syllables(word)
+        
+        # The word's facial shape is the same for all of its keyframes
+        values = self.channel_values(word)
+        
+        return [{
+            'time': time,
+            'word': word,
+            'syllable': f"{word}_{label}",
+            **values,
+            **self.rig.jaw(jaw)
+        } for time, label, jaw, _ in self.word_beats(word_data, syllables)]
+    
+    def pose_table(self):
+        """Viseme pose table for this generator's rig (see visemes.py)"""
+        if self._pose_table is None:
+            self._pose_table = build_pose_table(self.phoneme_mapper, self.rig)
+        return self._pose_table
+    
+    def generate_visemes(self, audio_file, duration, transcript=None, quality_tier=None):
+        """
+        Compact counterpart of generate_keyframes.
+        
+        Records follow the same word and syllable timing, but carry a viseme ID
+        per syllable instead of a full pose, so no per-keyframe channel dicts
+        are built. Only jaw and weight are smoothed; intermediates are left to
+        the engine's interpolation between records.
+        
+        Returns:
+            list: [time, viseme_id, weight, jaw] records, in time order
+        """
+        import numpy as np
+        
+        tier = get_quality_tier(quality_tier)
+        word_timings = self.align_words(audio_file, duration, transcript, tier)
         if not word_timings:
-            print("[ERROR] No word timings extracted")
+            logger.error("No word timings extracted")
             return []
-            
-        keyframes = []
         
-        # Add initial rest position
-        rest_values = self.phoneme_mapper.get_values('rest')
-        rest_values['jawValue'] = {'x': 0.0, 'y': 0.0, 'z': 0.0}  # Start with closed jaw
-        keyframes.append({
-            'time': 0.0,
-            **rest_values
-        })
-        
-        # Process each word
+        raw = [(0.0, REST_VISEME, 0.0, 0.0)]
+        last_raw_time = 0.0
         for word_data in word_timings:
+            check_cancelled()
             word = word_data['word']
-            start_time = word_data['start']
-            end_time = word_data['end']
-            duration = end_time - start_time
-            
-            # Get syllables for this word
             syllables = self.syllable_analyzer.count_syllables(word)
+            visemes = syllable_visemes(word, word_data.get('phonemes'), syllables, self.phoneme_mapper)
+            beats = self.word_beats(word_data, syllables)
+            raw.extend((time, visemes[i], 1.0, jaw) for time, _, jaw, i in beats)
+            last_raw_time = beats[-1][0]
+        
+        # Final rest position, as for keyframes
+        if last_raw_time < duration:
+            raw.append((round(duration, 3), REST_VISEME, 0.0, 0.0))
+        
+        # Sort and drop records that land on an earlier time after rounding
+        records = []
+        for time, viseme, weight, jaw in sorted(raw, key=lambda r: r[0]):
+            time = round(time, 3)
+            if records and time <= records[-1][0]:
+                continue
+            records.append([time, viseme, weight, jaw])
+        
+        # Gaussian smoothing of the scalar columns, first and last records unchanged
+        if len(records) > tier["window_size"]:
+            kernel = self.gaussian_kernel(tier["sigma"], tier["window_size"])
+            columns = np.array([[r[2], r[3]] for r in records])
+            norm = np.convolve(np.ones(len(records)), kernel, mode='same')
+            smoothed = np.stack([np.convolve(columns[:, c], kernel, mode='same') / norm for c in (0, 1)], axis=1)
+            for record, (weight, jaw) in zip(records[1:-1], smoothed[1:-1]):
+                record[2] = round(float(weight), 3)
+                record[3] = round(float(jaw), 3)
+        
+        logger.info("Generated %s viseme records", len(records))
+        return records
+    
+    def iter_keyframe_blocks(self, word_timings, duration, num_intermediates=1, sigma=1.5, window_size=5):
+        """
+        Incrementally generate finalised keyframes from a stream of word timings.
+        
+        Keyframes are released once no later word can precede them, then
+        expanded with intermediates and Gaussian smoothed with only
+        window_size // 2 keyframes of lookahead. Concatenating the blocks gives
+        exactly what generate_keyframes returns for the same word timings.
+        
+        Args:
+            word_timings (iterable): Word timing dicts ('word', 'start', 'end') with
+                non-decreasing start times, e.g. consumed as an aligner produces them
+            duration (float): Total audio duration (for the final rest pose)
+            num_intermediates (int): Intermediate keyframes between each pair
+            sigma (float): Standard deviation for the Gaussian kernel
+            window_size (int): Size of the smoothing window
             
-            # Always add word start with open jaw
-            keyframes.append({
-                'time': start_time,
-                'word': word,
-                'syllable': f"{word}_start",
-                **self.phoneme_mapper.get_values(word),
-                'jawValue': {'x': 0.0, 'y': 0.4, 'z': 0.0}  # Open jaw at word start
-            })
+        Yields:
+            list: Block of finalised keyframes, in time order
+        """
+        kernel = self.gaussian_kernel(sigma, window_size)
+        kernel_half_size = window_size // 2
+        
+        pending = [self.rest_keyframe(0.0)]   # Raw keyframes not yet known to be in order
+        last_time = None                      # Last released (rounded) time
+        prev_kf = None                        # Last released keyframe, for intermediates
+        expanded = []                         # Expanded keyframes still needed by the smoother
+        expanded_offset = 0                   # Global index of expanded[0]
+        expanded_count = 0                    # Expanded keyframes seen so far
+        emitted = 0                           # Smoothed keyframes emitted so far
+        smoothing = False                     # Becomes True once the list is longer than the window
+        
+        def release(raw_keyframes):
+            """Sort/dedupe released keyframes and expand them with intermediates"""
+            nonlocal last_time, prev_kf, expanded_count
+            for kf in sorted(raw_keyframes, key=lambda k: k['time']):
+                time = round(kf['time'], 3)  # Round to 3 decimal places for comparison
+                if last_time is not None and time <= last_time:
+                    continue
+                kf['time'] = time  # Update the time to rounded value
+                last_time = time
+                if prev_kf is not None:
+                    for intermediate in self.interpolate_keyframes(prev_kf, kf, num_intermediates):
+                        expanded.append(intermediate)
+                        expanded_count += 1
+                expanded.append(kf)
+                expanded_count += 1
+                prev_kf = kf
+        
+        def drain(final):
+            """Smooth every expanded keyframe whose window is complete"""
+            nonlocal expanded, expanded_offset, emitted, smoothing
+            if not smoothing:
+                if expanded_count <= window_size and not final:
+                    return []
+                smoothing = expanded_count > window_size
+            
+            block = []
+            while emitted < expanded_count:
+                i = emitted
+                if not final and i + kernel_half_size >= expanded_count:
+                    break
+                local = i - expanded_offset
+                if not smoothing or i == 0 or (final and i == expanded_count - 1):
+                    # First and last keyframes (or a list too short to smooth) stay unchanged
+                    block.append(expanded[local])
+                else:
+                    start = max(0, local - kernel_half_size)
+                    end = min(len(expanded), local + kernel_half_size + 1)
+                    block.append(self.smooth_keyframe(expanded[start:end], local - start, kernel))
+                emitted += 1
+            
+            # Only the last half window is needed as left context from here on
+            keep_from = max(0, emitted - kernel_half_size - expanded_offset)
+            if keep_from:
+                expanded = expanded[keep_from:]
+                expanded_offset += keep_from
+            return block
+        
+        last_raw_time = 0.0
+        for word_data in word_timings:
+            check_cancelled()
+            word_kfs = self.word_keyframes(word_data)
             
-            if syllables == 0 or syllables == 1:
-                # For words with no syllables or single syllable
-                # Add syllable start
-                syllable_start_time = start_time + (duration * 0.1)  # Slightly after word start
-                keyframes.append({
-                    'time': syllable_start_time,
-                    'word': word,
-                    'syllable': f"{word}_syllable_1_start",
-                    **self.phoneme_mapper.get_values(word),
-                    'jawValue': {'x': 0.0, 'y': 0.4, 'z': 0.0}  # Open jaw
-                })
-                
-                # Add syllable end
-                syllable_end_time = end_time - (duration * 0.1)  # Slightly before word end
-                keyframes.append({
-                    'time': syllable_end_time,
-                    'word': word,
-                    'syllable': f"{word}_syllable_1_end",
-                    **self.phoneme_mapper.get_values(word),
-                    'jawValue': {'x': 0.0, 'y': 0.2, 'z': 0.0}  # Partial close
-                })
-                
-                # Add word end with closed jaw
-                keyframes.append({
-                    'time': end_time,
-                    'word': word,
-                    'syllable': f"{word}_end",
-                    **self.phoneme_mapper.get_values(word),
-                    'jawValue': {'x': 0.0, 'y': 0.0, 'z': 0.0}  # Close jaw completely
-                })
-            else:
-                # Handle multi-syllable words
-                syllable_duration = duration / syllables
-                
-                for i in range(syllables):
-                    syllable_start = start_time + (i * syllable_duration)
-                    syllable_end = syllable_start + syllable_duration
-                    
-                    # Add syllable start for each syllable
-                    keyframes.append({
-                        'time': syllable_start,
-                        'word': word,
-                        'syllable': f"{word}_syllable_{i+1}_start",
-                        **self.phoneme_mapper.get_values(word),
-                        'jawValue': {'x': 0.0, 'y': 0.4, 'z': 0.0}  # Open jaw
-                    })
-                    
-                    # Add syllable end
-                    between_time = syllable_end - (syllable_duration * 0.2)  # Close slightly before next syllable
-                    keyframes.append({
-                        'time': between_time,
-                        'word': word,
-                        'syllable': f"{word}_syllable_{i+1}_end",
-                        **self.phoneme_mapper.get_values(word),
-                        'jawValue': {'x': 0.0, 'y': 0.2 if i < syllables - 1 else 0.0, 'z': 0.0}  # Partial close between syllables, full close at end
-                    })
-                
-                # Add final word end if not already added
-                if keyframes[-1]['time'] < end_time:
-                    keyframes.append({
-                        'time': end_time,
-                        'word': word,
-                        'syllable': f"{word}_end",
-                        **self.phoneme_mapper.get_values(word),
-                        'jawValue': {'x': 0.0, 'y': 0.0, 'z': 0.0}  # Complete close at end of word
-                    })
+            # Everything at or before this word's earliest keyframe can no longer be reordered
+            horizon = min(kf['time'] for kf in word_kfs)
+            ready = [kf for kf in pending if kf['time'] <= horizon]
+            pending = [kf for kf in pending if kf['time'] > horizon]
+            release(ready)
+            
+            pending.extend(word_kfs)
+            last_raw_time = word_kfs[-1]['time']
+            
+            block = drain(final=False)
+            if block:
+                yield block
         
         # Add final rest position if not already at rest
-        if keyframes[-1]['time'] < duration:
-            final_rest = self.phoneme_mapper.get_values('rest')
-            final_rest['jawValue'] = {'x': 0.0, 'y': 0.0, 'z': 0.0}  # Ensure jaw ends closed
-            keyframes.append({
-                'time': round(duration, 3),
-                **final_rest
-            })
+        if last_raw_time < duration:
+            pending.append(self.rest_keyframe(round(duration, 3)))
+        release(pending)
         
-        # Sort by time and remove duplicates
-        keyframes.sort(key=lambda k: k['time'])
-        unique_keyframes = []
-        seen_times = set()
+        block = drain(final=True)
+        if block:
+            yield block
         
-        for kf in keyframes:
-            time = round(kf['time'], 3)  # Round to 3 decimal places for comparison
-            if time not in seen_times:
-                kf['time'] = time  # Update the time to rounded value
-                seen_times.add(time)
-                unique_keyframes.append(kf)
+    def estimate_word_timings(self, audio_file, transcript, duration):
+        """
+        Cheap alignment without Whisper for the 'fast' tier: spread the known
+        transcript over the voiced part of the audio, giving each word time in
+        proportion to its syllables plus a short pause after punctuation.
+        """
+        words = [(w, re.sub(r"[^\w']", "", w)) for w in transcript.split()]
+        words = [(raw, clean) for raw, clean in words if clean]
+        if not words:
+            return []
+        
+        start, end = (audio_file and voiced_span(audio_file)) or (0.0, duration)
+        pause = 0.5  # Syllables of silence after , . ! ? etc.
+        weights = [(max(1, self.syllable_analyzer.count_syllables(clean)),
+                    pause if raw[-1] in ',.;:!?' else 0.0) for raw, clean in words]
+        total = sum(s + p for s, p in weights) - weights[-1][1]
+        unit = (end - start) / total
         
-        # Add intermediate keyframes for smoother transitions
-        print("[INFO] Adding intermediate keyframes for smoother transitions...")
-        expanded_keyframes = self.generate_intermediate_keyframes(unique_keyframes, num_intermediates=1)
+        word_timings = []
+        t = start
+        for (_, clean), (syllables, after) in zip(words, weights):
+            word_timings.append({
+                "word": clean,
+                "start": t,
+                "end": t + syllables * unit,
+                "phonemes": self.word_extractor.get_word_phonemes(clean)
+            })
+            t += (syllables + after) * unit
+        return word_timings
+    
+    def align_words(self, audio_file, duration, transcript, tier):
+        """Word timings for a tier: Whisper, or the transcript estimate if the tier allows it"""
+        if tier["alignment"] == "transcript" and transcript:
+            with track("keyframes:word_estimate"):
+                return self.estimate_word_timings(audio_file, transcript, duration)
+        with track("keyframes:word_timing"):
+            return self.word_extractor.extract_word_timings(audio_file, transcript=transcript)
+    
+    def iter_aligned_words(self, audio_file, duration, transcript, tier):
+        """Streaming align_words: Whisper timings arrive a piece of audio at a time"""
+        if tier["alignment"] == "transcript" and transcript:
+            return self.align_words(audio_file, duration, transcript, tier) or []
+        return self.word_extractor.iter_word_timings(audio_file, transcript=transcript)
+    
+    def generate_keyframes(self, audio_file, duration, transcript=None, quality_tier=None):
+        """Generate keyframes based on word timing and syllable analysis."""
+        tier = get_quality_tier(quality_tier)
+        
+        # Extract word timings with phonemes
+        word_timings = self.align_words(audio_file, duration, transcript, tier)
+        if not word_timings:
+            logger.error("No word timings extracted")
+            return []
         
-        # Apply Gaussian smoothing for more natural movement
-        print("[INFO] Applying Gaussian smoothing to animation keyframes...")
-        smoothed_keyframes = self.gaussian_smooth_keyframes(expanded_keyframes, sigma=1.5, window_size=5)
+        # Sort, dedupe, add intermediate keyframes and apply Gaussian smoothing
+        logger.info("Generating keyframes (%s tier) with intermediates and Gaussian smoothing...", tier["name"])
+        smoothed_keyframes = []
+        with track("keyframes:smoothing"):
+            for block in self.iter_keyframe_blocks(word_timings, duration, num_intermediates=tier["num_intermediates"],
+                                                   sigma=tier["sigma"], window_size=tier["window_size"]):
+                smoothed_keyframes.extend(block)
         
-        print(f"[INFO] Generated {len(smoothed_keyframes)} keyframes with enhanced smoothing")
+        logger.info("Generated %s keyframes with enhanced smoothing", len(smoothed_keyframes))
         return smoothed_keyframes
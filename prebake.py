@@ -0,0 +1,220 @@
+"""
+Batch pre-baking of phoneme keyframes for scripted lines.
+
+Fans a directory (or manifest) of WAV files out over a process pool. Each
+worker builds its Whisper model, lexicon and phoneme generator once and reuses
+them for every file it is given. Output names are the input's relative path
+with a short hash of that path appended, so re-running over the same inputs
+writes the same files and "a/b.wav" and "a__b.wav" cannot collide.
+
+Usage:
+    python prebake.py <dir-or-manifest> --output-dir prebaked [--workers N]
+
+A directory is scanned recursively for *.wav files; a sibling <name>.txt is
+used as the transcript when present. A manifest is a JSON Lines file with
+one {"audio": "...", "transcript": "..."} object per line, relative paths
+being resolved against the manifest's directory.
+
+A transcript only biases Whisper's recognition (it is passed as the initial
+prompt); word timings still come from Whisper's own alignment, not forced
+alignment against the text, so a transcript that disagrees with the audio
+is not enforced.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from logging_setup import setup_logging
+
+logger = logging.getLogger("prebake")
+
+# Per-worker state, set up once by init_worker
+_generator = None
+
+
+def load_jobs(source):
+    """
+    Build the sorted job list from a directory or a JSON Lines manifest.
+
+    Returns:
+        list: dicts with 'audio', 'transcript' and 'output_name'
+    """
+    jobs = []
+
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in files:
+                if not name.lower().endswith(".wav"):
+                    continue
+                audio = os.path.join(root, name)
+                transcript = None
+                transcript_path = os.path.splitext(audio)[0] + ".txt"
+                if os.path.exists(transcript_path):
+                    with open(transcript_path, "r") as f:
+                        transcript = f.read().strip() or None
+                jobs.append({
+                    "audio": audio,
+                    "transcript": transcript,
+                    "relative": os.path.relpath(audio, source)
+                })
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, "r") as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{source}:{line_number}: invalid JSON ({e})")
+                if "audio" not in entry:
+                    raise ValueError(f"{source}:{line_number}: missing 'audio'")
+                audio = entry["audio"]
+                if not os.path.isabs(audio):
+                    audio = os.path.join(base_dir, audio)
+                jobs.append({
+                    "audio": audio,
+                    "transcript": entry.get("transcript"),
+                    "relative": entry.get("output") or os.path.relpath(audio, base_dir)
+                })
+
+    # Deterministic order and output names regardless of filesystem order
+    jobs.sort(key=lambda job: job["relative"])
+    for job in jobs:
+        relative = job.pop("relative")
+        stem = os.path.splitext(relative)[0].replace(os.sep, "__").replace("/", "__")
+        digest = hashlib.sha1(relative.replace(os.sep, "/").encode("utf-8")).hexdigest()[:8]
+        job["output_name"] = f"{stem}-{digest}.json"
+
+    return jobs
+
+
+def init_worker(threads_per_worker, rig_profile=None, asr_profile=None):
+    """Load models and the lexicon once per worker process"""
+    global _generator
+
+    # A forked worker needs its own log listener thread
+    setup_logging()
+
+    # Avoid oversubscribing cores: every worker gets its own small thread budget
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads_per_worker))
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+
+    from phonememapping import EnhancedPhonemeGenerator
+    _generator = EnhancedPhonemeGenerator(rig_profile=rig_profile, asr_profile=asr_profile)
+
+
+def bake_one(job, output_dir, frame_rate=None):
+    """Generate keyframes for one job inside a worker process"""
+    from phonememapping import process_audio_to_phonemes, get_audio_duration
+
+    started = time.perf_counter()
+    output_file = process_audio_to_phonemes(
+        job["audio"],
+        output_dir,
+        generator=_generator,
+        output_name=job["output_name"],
+        transcript=job["transcript"],
+        frame_rate=frame_rate
+    )
+    return {
+        "audio": job["audio"],
+        "output": output_file,
+        "ok": output_file is not None,
+        "audio_seconds": get_audio_duration(job["audio"]) if output_file else 0.0,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def run_batch(jobs, output_dir, workers=None, threads_per_worker=1, frame_rate=None, rig_profile=None, asr_profile=None):
+    """
+    Run all jobs over a process pool.
+
+    Returns:
+        dict: Summary with per-file results and throughput
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+
+    # Build/map the lexicon in the parent so forked workers share one mapping
+    from lexicon import get_lexicon
+    get_lexicon()
+
+    results = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(threads_per_worker, rig_profile, asr_profile)) as executor:
+        futures = {executor.submit(bake_one, job, output_dir, frame_rate): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"audio": job["audio"], "output": None, "ok": False,
+                          "audio_seconds": 0.0, "seconds": 0.0, "error": str(e)}
+            results.append(result)
+            if result["ok"]:
+                logger.info("%d/%d OK %s (%ss)", done, len(jobs), job["audio"], result["seconds"])
+            else:
+                logger.error("%d/%d FAILED %s (%ss): %s", done, len(jobs), job["audio"], result["seconds"], result.get("error"))
+    elapsed = time.perf_counter() - started
+
+    results.sort(key=lambda r: r["audio"])
+    succeeded = sum(1 for r in results if r["ok"])
+    audio_seconds = sum(r["audio_seconds"] for r in results)
+    return {
+        "files": len(jobs),
+        "succeeded": succeeded,
+        "failed": len(jobs) - succeeded,
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_second": round(len(jobs) / elapsed, 3) if elapsed > 0 else 0.0,
+        "audio_seconds_per_second": round(audio_seconds / elapsed, 3) if elapsed > 0 else 0.0,
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-bake phoneme keyframes for a batch of audio files")
+    parser.add_argument("source", help="Directory of WAV files or a JSON Lines manifest")
+    parser.add_argument("--output-dir", default="prebaked", help="Where to write keyframe JSON files")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="Torch threads per worker")
+    parser.add_argument("--frame-rate", type=int, default=None, help="Resample onto a fixed grid at this many fps")
+    parser.add_argument("--rig-profile", default=None, help="Rig profile name or JSON file (see rig_profiles.py)")
+    parser.add_argument("--asr-profile", default=None, help="Whisper inference profile (see asr.py)")
+    parser.add_argument("--report", default=None, help="Optional path for a JSON summary")
+    args = parser.parse_args()
+    setup_logging()
+
+    jobs = load_jobs(args.source)
+    if not jobs:
+        logger.error("No audio files found in %s", args.source)
+        return 1
+
+    logger.info("Pre-baking %d files with %d workers", len(jobs), args.workers or os.cpu_count())
+    summary = run_batch(jobs, args.output_dir, args.workers, args.threads_per_worker, args.frame_rate, args.rig_profile, args.asr_profile)
+
+    logger.info("%d/%d files in %ss (%s files/s, %sx realtime)", summary["succeeded"], summary["files"],
+                summary["elapsed_seconds"], summary["files_per_second"], summary["audio_seconds_per_second"])
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+        logger.info("Report saved to: %s", args.report)
+
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
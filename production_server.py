@@ -0,0 +1,346 @@
+"""
+Production entry point: load everything once, then fork workers that share it.
+
+serversetup.py's app.run(debug=True) is a single process, and its reloader
+imports the module (and loads Whisper) twice. Here the parent process
+imports serversetup once, which loads Whisper, the intent engine and the
+viseme pose table. It then loads the keyframe aligner and the lexicon,
+renders the canned replies and warms the LLM. Finally it freezes the
+garbage collector and forks N workers. The workers share those pages
+copy-on-write: gc.freeze() keeps collections in the workers from touching
+(and so copying) the preloaded objects, and model weights live in tensor
+buffers that are only ever read.
+
+Workers serve requests from a fixed pool of threads. SIGTERM or SIGINT
+stops them gracefully: workers stop accepting, finish queued requests and
+in-flight replies (up to --graceful-timeout), and exit. The parent replaces
+workers that die.
+
+    python production_server.py --workers 4 --threads 8 --bind 0.0.0.0:5050 --port-per-worker
+
+Each worker keeps its own per-session state: the reply being rendered and
+its audio file (output/sessions/<session>/response.wav), the reply text,
+keyframes and duration, the animation schedule, streaming transcription and
+the viseme opt-in. The whole reply flow for a session (POST /, /audio,
+/keyframes/stream, /start_animation, /cancel) must therefore reach the same
+worker. More than one worker requires --port-per-worker, which gives worker
+i its own port (port + i), behind a proxy that routes on X-Session-ID.
+
+CUDA cannot be used across fork(), so the preloaded models are kept on the
+CPU (CUDA_VISIBLE_DEVICES is cleared unless set): turn transcription uses
+the int8 'cpu' profile and keyframe alignment the unquantised 'default' one.
+
+Options can also be set with LIPRA_WORKERS, LIPRA_THREADS and LIPRA_BIND.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logging_setup import setup_logging, stop_logging
+
+logger = logging.getLogger("production_server")
+
+DEFAULT_BIND = "0.0.0.0:5050"
+DEFAULT_THREADS = 8
+GRACEFUL_TIMEOUT_SECONDS = 30.0
+
+# An idle keep-alive connection gives its pool thread back after this long
+KEEPALIVE_TIMEOUT_SECONDS = 10.0
+
+# A worker that exits sooner than this after starting is restarted with a delay
+MIN_WORKER_UPTIME_SECONDS = 5.0
+RESPAWN_DELAY_SECONDS = 1.0
+
+
+def parse_bind(bind):
+    """
+    Split 'host:port', ':port', 'port' or '[ipv6]:port'.
+
+    Returns:
+        tuple: (host, port)
+    """
+    host, _, port = bind.rpartition(":")
+    host = host.strip("[]") or "0.0.0.0"
+    return host, int(port)
+
+
+def create_listener(host, port, backlog=128):
+    """
+    Listening socket shared by the workers.
+
+    It is non-blocking, so a worker that loses the race for a connection
+    goes back to waiting instead of blocking in accept().
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    listener = socket.socket(family, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    listener.setblocking(False)
+    return listener
+
+
+def make_server(app, listener, threads):
+    """werkzeug server on an existing socket that runs requests on a fixed thread pool"""
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class RequestHandler(WSGIRequestHandler):
+        # HTTP/1.1, as in werkzeug's threaded server: /audio and /keyframes/stream
+        # are sent with chunked transfer encoding. A connection that sits idle
+        # between requests is closed so it does not hold a pool thread
+        protocol_version = "HTTP/1.1"
+        timeout = KEEPALIVE_TIMEOUT_SECONDS
+
+    class PooledWSGIServer(BaseWSGIServer):
+        multithread = True
+
+        def __init__(self):
+            host, port = listener.getsockname()[:2]
+            super().__init__(host, port, app, handler=RequestHandler, fd=listener.fileno())
+            self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return PooledWSGIServer()
+
+
+def set_torch_threads(threads):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def preload():
+    """
+    Import the server and load everything the workers will share.
+
+    Returns:
+        module: serversetup
+    """
+    # Inference in the parent (canned replies) runs single-threaded, so no
+    # OpenMP pool exists at fork time; workers set their own thread count
+    os.environ["LIPRA_ASR_THREADS"] = "1"
+    # Whisper picks CUDA when it sees it, even for unquantised profiles
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+    started = time.perf_counter()
+    import serversetup
+    from lexicon import get_lexicon
+    from canned_responses import load_canned_phrases
+
+    if not serversetup.STUB_BACKENDS:
+        # Word-alignment model used by keyframe generation, from the module the workers call
+        serversetup.keyframe_backend.get_phoneme_generator()
+    get_lexicon()
+    serversetup.canned_responses.warm_up(load_canned_phrases(serversetup.CANNED_PHRASES_FILE))
+    serversetup.llm_backend.warm_up()
+
+    try:
+        import torch
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            raise RuntimeError("CUDA was initialised while preloading; forked workers cannot use it. "
+                               "Unset CUDA_VISIBLE_DEVICES or run serversetup.py directly.")
+    except ImportError:
+        pass
+
+    # Threads do not survive fork(); workers start their own
+    serversetup.artifact_store.stop_collector()
+    serversetup.animation_scheduler.shutdown()
+
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded in %.1f seconds (%d objects frozen)", time.perf_counter() - started, gc.get_freeze_count())
+    return serversetup
+
+
+def run_worker(index, server_module, listener, args):
+    """
+    Serve requests until SIGTERM/SIGINT, then drain. Runs in a forked child.
+
+    Returns:
+        int: Exit code
+    """
+    stopping = threading.Event()
+    server = None
+
+    def request_stop(signum, frame):
+        if stopping.is_set():
+            return
+        stopping.set()
+        # shutdown() waits for serve_forever, which is running in this (main) thread
+        if server is not None:
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # A forked child has no log listener thread
+    setup_logging()
+    set_torch_threads(args.torch_threads)
+
+    from animation_scheduler import AnimationScheduler
+    server_module.animation_scheduler = AnimationScheduler()
+    if index == 0:
+        # Uses and pins are shared through the output directory; one collector serves every worker
+        server_module.artifact_store.start_collector(server_module.ARTIFACT_GC_INTERVAL_SECONDS)
+    # The LLM client was recreated after fork (see LLMBackend); its keeper thread was not
+    server_module.llm_backend.start_keeper()
+
+    server = make_server(server_module.app, listener, args.threads)
+    host, port = listener.getsockname()[:2]
+    logger.info("Worker %d (pid %d) serving on %s:%d with %d threads", index, os.getpid(), host, port, args.threads)
+
+    if not stopping.is_set():
+        server.serve_forever(poll_interval=0.5)
+
+    drained = drain(server, server_module, args.graceful_timeout)
+    server_module.llm_backend.stop_keeper()
+    server_module.artifact_store.stop_collector()
+    server_module.animation_scheduler.shutdown()
+    logger.info("Worker %d (pid %d) stopped%s", index, os.getpid(), "" if drained else " with work still in flight")
+    stop_logging()
+    return 0 if drained else 1
+
+
+def drain(server, server_module, timeout):
+    """
+    Wait for queued requests, then for replies rendering in the background.
+
+    Returns:
+        bool: True if everything finished within timeout
+    """
+    deadline = time.monotonic() + timeout
+    pool = threading.Thread(target=server.pool.shutdown, kwargs={"wait": True}, daemon=True)
+    pool.start()
+    pool.join(timeout)
+    while server_module.response_jobs.get_stats()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.1)
+    return not pool.is_alive() and not server_module.response_jobs.get_stats()["in_flight"]
+
+
+def spawn_worker(index, server_module, listener, args):
+    """Fork a worker. Returns its pid in the parent; never returns in the child."""
+    pid = os.fork()
+    if pid:
+        return pid
+
+    code = 1
+    try:
+        code = run_worker(index, server_module, listener, args)
+    except Exception:
+        logger.exception("Worker %d crashed", index)
+        stop_logging()
+    finally:
+        os._exit(code)
+
+
+def supervise(server_module, listeners, args):
+    """Start the workers, replace any that die, and stop them all on SIGTERM/SIGINT"""
+    parent_pid = os.getpid()
+    workers = {}   # pid -> (index, started)
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        if os.getpid() != parent_pid or stopping.is_set():
+            # A child that has not installed its own handlers yet
+            return
+        logger.info("Received %s, stopping %d workers", signal.Signals(signum).name, len(workers))
+        stopping.set()
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    for index in range(args.workers):
+        workers[spawn_worker(index, server_module, listeners[index % len(listeners)], args)] = (index, time.monotonic())
+
+    deadline = None
+    while workers:
+        if stopping.is_set() and deadline is None:
+            deadline = time.monotonic() + args.graceful_timeout + 5.0
+        if deadline is not None and time.monotonic() > deadline:
+            logger.warning("Killing %d workers that did not stop in time", len(workers))
+            for pid in workers:
+                os.kill(pid, signal.SIGKILL)
+            deadline = float("inf")
+
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+
+        index, started = workers.pop(pid)
+        if stopping.is_set():
+            continue
+        logger.warning("Worker %d (pid %d) exited with status %d, restarting", index, pid, os.waitstatus_to_exitcode(status))
+        if time.monotonic() - started < MIN_WORKER_UPTIME_SECONDS:
+            time.sleep(RESPAWN_DELAY_SECONDS)
+        workers[spawn_worker(index, server_module, listeners[index % len(listeners)], args)] = (index, time.monotonic())
+
+    logger.info("All workers stopped")
+    return 0
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Run the server as preloaded, forked workers")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("LIPRA_WORKERS", 1)),
+                        help="Worker processes (default: LIPRA_WORKERS or 1; more need --port-per-worker)")
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("LIPRA_THREADS", DEFAULT_THREADS)),
+                        help="Request threads per worker")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="Torch threads per worker (default: cores / workers)")
+    parser.add_argument("--bind", default=os.environ.get("LIPRA_BIND", DEFAULT_BIND), help="host:port to listen on")
+    parser.add_argument("--port-per-worker", action="store_true",
+                        help="Give worker i its own port (port + i) instead of sharing one, for session affinity")
+    parser.add_argument("--graceful-timeout", type=float, default=GRACEFUL_TIMEOUT_SECONDS,
+                        help="Seconds workers get to finish in-flight work on shutdown")
+    args = parser.parse_args()
+    if args.workers < 1 or args.threads < 1:
+        parser.error("--workers and --threads must be at least 1")
+    if args.workers > 1 and not args.port_per_worker:
+        # Workers sharing one socket would split a session's requests between them
+        parser.error("--workers > 1 needs --port-per-worker and a proxy that routes each session to one worker")
+    if args.torch_threads is None:
+        args.torch_threads = max(1, cores // args.workers)
+
+    setup_logging()
+    host, port = parse_bind(args.bind)
+    ports = [port + i for i in range(args.workers)] if args.port_per_worker else [port]
+    # Bind before preloading so a busy port fails fast
+    listeners = [create_listener(host, p) for p in ports]
+
+    server_module = preload()
+    logger.info("Starting %d workers x %d threads (torch threads %d) on %s:%s",
+                args.workers, args.threads, args.torch_threads, host,
+                f"{ports[0]}-{ports[-1]}" if len(ports) > 1 else ports[0])
+    return supervise(server_module, listeners, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Opt-in profiling of individual response pipelines.
+
+A request asks for a profile with the X-Profile header or ?profile= (either
+'cprofile' or 'sample'), or an admin sets a default mode so every Nth
+request is profiled. Nothing is profiled unless one of these is set.
+
+- cprofile: deterministic cProfile of every thread that works on the job,
+  merged and saved as <job_id>.pstats (open with pstats or snakeviz).
+- sample: a sampler thread records the job's stacks every few milliseconds
+  and saves them as <job_id>.collapsed (one 'frame;frame;frame count' line
+  per stack, the input format of flamegraph.pl and speedscope). Much lower
+  overhead, and time spent waiting in C code (subprocesses, Whisper's
+  tensor ops) shows up under the Python frame that called it.
+"""
+import logging
+import os
+import sys
+import time
+import cProfile
+import pstats
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+
+class ProfileSession:
+    """Profile of one job, which may run on several threads in turn"""
+
+    def __init__(self, job_id, mode, sample_interval):
+        self.job_id = job_id
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.started = time.perf_counter()
+
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._threads = set()
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._sampler = None
+        if mode == 'sample':
+            self._sampler = threading.Thread(target=self._sample, name=f"profile-{job_id}", daemon=True)
+            self._sampler.start()
+
+    @contextmanager
+    def thread(self):
+        """Profile the calling thread while the block runs"""
+        if self.mode == 'sample':
+            ident = threading.get_ident()
+            with self._lock:
+                self._threads.add(ident)
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._threads.discard(ident)
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:
+            # Only one deterministic profiler can run at a time on newer Pythons
+            logger.warning("Could not profile job %s: %s", self.job_id, e)
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._profiles.append(profile)
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                threads = list(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            for ident in threads:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    self._stacks[";".join(reversed(stack))] += 1
+
+    def save(self, output_dir):
+        """
+        Stop profiling and write the result.
+
+        Returns:
+            str: Path of the profile, or None if nothing was recorded
+        """
+        if self._sampler:
+            self._stop.set()
+            self._sampler.join()
+            if not self._stacks:
+                return None
+            path = os.path.join(output_dir, f"{self.job_id}.collapsed")
+            with open(path, 'w') as f:
+                for stack, count in self._stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            return path
+
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        path = os.path.join(output_dir, f"{self.job_id}.pstats")
+        stats.dump_stats(path)
+        return path
+
+
+class RequestProfiler:
+    """Decides which requests are profiled and keeps the saved profiles."""
+
+    def __init__(self, output_dir, sample_interval=0.005, max_profiles=200):
+        """
+        Args:
+            output_dir (str): Directory for .pstats / .collapsed files
+            sample_interval (float): Seconds between stack samples in 'sample' mode
+            max_profiles (int): Oldest profiles beyond this many are deleted
+        """
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.max_profiles = max_profiles
+        os.makedirs(output_dir, exist_ok=True)
+
+        # Admin toggle: profile every Nth request in this mode (None = off)
+        self.default_mode = None
+        self.every = 1
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self.saved = 0
+
+    def configure(self, mode=None, every=1):
+        """Set the admin default: a mode from PROFILE_MODES, or None to switch off"""
+        if mode not in PROFILE_MODES + (None,):
+            raise ValueError(f"Unknown profile mode '{mode}', expected one of {', '.join(PROFILE_MODES)}")
+        with self._lock:
+            self.default_mode = mode
+            self.every = max(1, int(every))
+            self._requests = 0
+
+    def mode_for(self, requested=None):
+        """
+        Profile mode for a new request.
+
+        Args:
+            requested (str): Mode asked for by the request (header or query), if any
+
+        Returns:
+            str: 'cprofile', 'sample' or None
+        """
+        if requested:
+            return requested if requested in PROFILE_MODES else 'cprofile'
+        with self._lock:
+            if self.default_mode is None:
+                return None
+            self._requests += 1
+            return self.default_mode if self._requests % self.every == 0 else None
+
+    def start(self, job_id, mode):
+        return ProfileSession(job_id, mode, self.sample_interval)
+
+    def finish(self, session):
+        """Save a session's profile and prune old ones. Returns the path or None."""
+        try:
+            path = session.save(self.output_dir)
+        except Exception as e:
+            logger.error("Failed to save profile for job %s: %s", session.job_id, e)
+            return None
+        if path:
+            with self._lock:
+                self.saved += 1
+            logger.info("Saved %s profile of job %s (%.2fs) to %s",
+                        session.mode, session.job_id, time.perf_counter() - session.started, path)
+            self._prune()
+        return path
+
+    def _prune(self):
+        files = self.list_profiles()
+        for entry in files[self.max_profiles:]:
+            try:
+                os.remove(os.path.join(self.output_dir, entry["file"]))
+            except OSError:
+                pass
+
+    def find(self, job_id):
+        """Path of a job's profile, or None"""
+        for ext in ('.pstats', '.collapsed'):
+            path = os.path.join(self.output_dir, os.path.basename(job_id) + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def list_profiles(self):
+        """Saved profiles, newest first"""
+        entries = []
+        for name in os.listdir(self.output_dir):
+            job_id, ext = os.path.splitext(name)
+            if ext in ('.pstats', '.collapsed'):
+                path = os.path.join(self.output_dir, name)
+                entries.append({"job_id": job_id, "file": name, "mode": 'cprofile' if ext == '.pstats' else 'sample',
+                                "created": os.path.getmtime(path), "bytes": os.path.getsize(path)})
+        return sorted(entries, key=lambda e: e["created"], reverse=True)
+
+    def get_stats(self):
+        with self._lock:
+            return {"default_mode": self.default_mode, "every": self.every, "saved": self.saved,
+                    "stored": len(self.list_profiles())}
+
+
+def format_pstats(path, sort='cumulative', limit=40):
+    """Text report of a .pstats file, like python -m pstats would print"""
+    import io
+
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
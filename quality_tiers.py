@@ -0,0 +1,165 @@
+"""
+Quality tiers for keyframe generation, chosen automatically from load.
+
+A tier trades animation smoothness for speed:
+
+- full:     Whisper word timestamps, one intermediate keyframe between each
+            pair, 5-tap Gaussian smoothing (the original pipeline)
+- balanced: Whisper word timestamps, no intermediates, 3-tap smoothing
+- fast:     the known reply text spread over the voiced part of the audio
+            by syllable count (no Whisper), no intermediates, 3-tap smoothing
+
+QualityGovernor picks the tier for each job from the number of keyframe
+jobs already running and the recent real-time factor of the keyframe stage
+(seconds of processing per second of audio). It degrades immediately and
+recovers one tier at a time after a hold period, so a burst does not make it
+flap. The chosen tier is written into the keyframes JSON ("quality_tier").
+"""
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+QUALITY_TIERS = {
+    'full': {
+        'alignment': 'whisper',
+        'num_intermediates': 1,
+        'sigma': 1.5,
+        'window_size': 5
+    },
+    'balanced': {
+        'alignment': 'whisper',
+        'num_intermediates': 0,
+        'sigma': 1.5,
+        'window_size': 3
+    },
+    'fast': {
+        'alignment': 'transcript',
+        'num_intermediates': 0,
+        'sigma': 1.0,
+        'window_size': 3
+    }
+}
+
+# Best first
+TIER_ORDER = ('full', 'balanced', 'fast')
+DEFAULT_QUALITY_TIER = 'full'
+
+
+def get_quality_tier(tier=None):
+    """
+    Settings for a tier.
+
+    Args:
+        tier (str): Tier name (defaults to 'full')
+
+    Returns:
+        dict: Copy of the tier's settings, with its 'name'
+    """
+    name = tier or DEFAULT_QUALITY_TIER
+    if name not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality tier '{name}', expected one of {', '.join(TIER_ORDER)}")
+    return {'name': name, **QUALITY_TIERS[name]}
+
+
+class QualityGovernor:
+    """Chooses a quality tier per keyframe job from queue depth and recent latency."""
+
+    def __init__(self, pinned=None, balanced_depth=2, fast_depth=4, balanced_rtf=0.5, fast_rtf=1.0,
+                 window=20, hold_seconds=10.0, clock=time.monotonic):
+        """
+        Args:
+            pinned (str): Always use this tier ('auto' or None to adapt; defaults to LIPRA_QUALITY_TIER)
+            balanced_depth (int): Jobs already running at which 'balanced' is used
+            fast_depth (int): Jobs already running at which 'fast' is used
+            balanced_rtf (float): Recent median real-time factor at which 'balanced' is used
+            fast_rtf (float): Recent median real-time factor at which 'fast' is used
+            window (int): Number of recent jobs the real-time factor is taken over
+            hold_seconds (float): Time a degraded tier is kept before stepping back up
+        """
+        pinned = pinned if pinned is not None else os.environ.get('LIPRA_QUALITY_TIER', 'auto')
+        self.pinned = None if pinned == 'auto' else get_quality_tier(pinned)['name']
+        self.balanced_depth = balanced_depth
+        self.fast_depth = fast_depth
+        self.balanced_rtf = balanced_rtf
+        self.fast_rtf = fast_rtf
+        self.hold_seconds = hold_seconds
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._rtfs = deque(maxlen=window)
+        self.in_flight = 0
+        self.current = TIER_ORDER[0]
+        self._degraded_at = None
+        self.counts = {name: 0 for name in TIER_ORDER}
+
+    def _recent_rtf(self):
+        ordered = sorted(self._rtfs)
+        return ordered[len(ordered) // 2] if ordered else 0.0
+
+    def _target(self, depth):
+        """Tier the current load calls for"""
+        rtf = self._recent_rtf()
+        if depth >= self.fast_depth or rtf >= self.fast_rtf:
+            return 'fast'
+        if depth >= self.balanced_depth or rtf >= self.balanced_rtf:
+            return 'balanced'
+        return 'full'
+
+    def select(self):
+        """
+        Tier for a job about to start (call with the job counted in in_flight).
+
+        Returns:
+            str: Tier name
+        """
+        with self._lock:
+            if self.pinned:
+                return self.pinned
+
+            target = self._target(self.in_flight - 1)
+            now = self.clock()
+            current = TIER_ORDER.index(self.current)
+            wanted = TIER_ORDER.index(target)
+            if wanted > current:
+                # Degrade straight away
+                self.current = target
+                self._degraded_at = now
+            elif wanted < current and now - self._degraded_at >= self.hold_seconds:
+                # Recover one tier per hold period
+                self.current = TIER_ORDER[current - 1]
+                self._degraded_at = now
+            return self.current
+
+    @contextmanager
+    def acquire(self, audio_seconds=None):
+        """
+        Run one keyframe job: yields its tier and records its latency.
+
+        Args:
+            audio_seconds (float): Length of the audio, for the real-time factor
+        """
+        with self._lock:
+            self.in_flight += 1
+        started = self.clock()
+        tier = self.select()
+        try:
+            yield tier
+        finally:
+            elapsed = self.clock() - started
+            with self._lock:
+                self.in_flight -= 1
+                self.counts[tier] += 1
+                if audio_seconds:
+                    self._rtfs.append(elapsed / audio_seconds)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "pinned": self.pinned,
+                "current": self.pinned or self.current,
+                "in_flight": self.in_flight,
+                "recent_rtf": round(self._recent_rtf(), 3),
+                "jobs_per_tier": dict(self.counts)
+            }
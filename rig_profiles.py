@@ -0,0 +1,158 @@
+"""
+Declarative rig profiles.
+
+A profile lists the animation channels a rig actually drives and, for vector
+channels, which coordinates it reads. The keyframe generator builds, smooths,
+interpolates and serialises only those channels, so both work and payload
+size follow the rig rather than the full union of channels.
+
+Profiles are plain dicts of channel name -> coordinates (None for scalar
+channels). Extra profiles can be loaded from a JSON file of the same shape:
+
+    {"my_rig": {"jawValue": ["y"], "funnelRightUp": null, "funnelLeftUp": null}}
+
+and selected with LIPRA_RIG_PROFILE (a built-in profile name or a path to
+such a file, optionally followed by ':<profile name>').
+"""
+import os
+import json
+
+XYZ = ('x', 'y', 'z')
+
+# Every channel the phoneme mapper can produce
+ALL_CHANNELS = {
+    'funnelRightUp': None,
+    'funnelRightDown': None,
+    'funnelLeftUp': None,
+    'funnelLeftDown': None,
+    'purseRightUp': None,
+    'purseRightDown': None,
+    'purseLeftUp': None,
+    'purseLeftDown': None,
+    'cornerPullRight': None,
+    'cornerPullLeft': None,
+    'teethUpperValue': XYZ,
+    'teethLowerValue': XYZ,
+    'tongueValue': XYZ,
+    'tongueInOut': None,
+    'pressRightUp': None,
+    'pressRightDown': None,
+    'pressLeftUp': None,
+    'pressLeftDown': None,
+    'towardsRightUp': None,
+    'towardsRightDown': None,
+    'towardsLeftUp': None,
+    'towardsLeftDown': None,
+    'jawValue': XYZ
+}
+
+RIG_PROFILES = {
+    # Everything the engine's FJawKeyframe understands (the original output)
+    'full': ALL_CHANNELS,
+
+    # Jaw, lip shapes and corners; no teeth, tongue, press or towards controls
+    'lips': {
+        'funnelRightUp': None,
+        'funnelRightDown': None,
+        'funnelLeftUp': None,
+        'funnelLeftDown': None,
+        'purseRightUp': None,
+        'purseRightDown': None,
+        'purseLeftUp': None,
+        'purseLeftDown': None,
+        'cornerPullRight': None,
+        'cornerPullLeft': None,
+        'jawValue': XYZ
+    },
+
+    # Jaw opening only, for simple or distant avatars
+    'jaw': {
+        'jawValue': XYZ
+    }
+}
+
+DEFAULT_RIG_PROFILE = 'full'
+
+
+class RigProfile:
+    """The set of channels (and vector coordinates) a rig animates."""
+
+    def __init__(self, name, channels):
+        unknown = set(channels) - set(ALL_CHANNELS)
+        if unknown:
+            raise ValueError(f"Rig profile '{name}' has unknown channels: {', '.join(sorted(unknown))}")
+
+        self.name = name
+        self.channels = {channel: tuple(coords) if coords else None for channel, coords in channels.items()}
+
+    def __contains__(self, channel):
+        return channel in self.channels
+
+    def select(self, values):
+        """
+        Keep only this rig's channels from a full set of channel values.
+
+        Args:
+            values (dict): Channel values, e.g. from PhonemeMapper.get_values
+
+        Returns:
+            dict: New dict with only the profile's channels and coordinates
+        """
+        selected = {}
+        for channel, coords in self.channels.items():
+            if channel not in values:
+                continue
+            value = values[channel]
+            if coords:
+                selected[channel] = {coord: value.get(coord, 0.0) for coord in coords}
+            else:
+                selected[channel] = value
+        return selected
+
+    def jaw(self, y):
+        """Jaw channel for the given opening, or an empty dict if the rig has no jaw"""
+        coords = self.channels.get('jawValue')
+        if not coords:
+            return {}
+        return {'jawValue': {coord: (y if coord == 'y' else 0.0) for coord in coords}}
+
+
+def load_rig_profiles(path):
+    """Load additional profiles from a JSON file"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return {name: RigProfile(name, channels) for name, channels in data.items()}
+
+
+def get_rig_profile(profile=None):
+    """
+    Resolve a profile from a RigProfile, a built-in name or a JSON file path.
+
+    Args:
+        profile: RigProfile, profile name, 'path.json' or 'path.json:name'.
+                 Defaults to LIPRA_RIG_PROFILE, then 'full'.
+
+    Returns:
+        RigProfile
+    """
+    if isinstance(profile, RigProfile):
+        return profile
+
+    profile = profile or os.environ.get("LIPRA_RIG_PROFILE") or DEFAULT_RIG_PROFILE
+    if profile in RIG_PROFILES:
+        return RigProfile(profile, RIG_PROFILES[profile])
+
+    path, name = profile, ''
+    if not os.path.exists(path) and ':' in profile:
+        path, _, name = profile.rpartition(':')
+    if os.path.exists(path):
+        profiles = load_rig_profiles(path)
+        if name:
+            if name not in profiles:
+                raise ValueError(f"Rig profile '{name}' not found in {path}")
+            return profiles[name]
+        if len(profiles) != 1:
+            raise ValueError(f"{path} defines several rig profiles; select one with '{path}:<name>'")
+        return next(iter(profiles.values()))
+
+    raise ValueError(f"Unknown rig profile: {profile}")
@@ -1,23 +1,87 @@
 import json
-from flask import Flask, request, jsonify
+import uuid
+import hashlib
+import logging
+import contextvars
+from contextlib import nullcontext
+from flask import Flask, request, jsonify, Response, stream_with_context, send_file
 import os
-import whisper
-import ollama
 import re
 import tempfile
 import subprocess
-import time
-import glob  # Add this import for file pattern matching
 from gtts import gTTS
-from threading import Timer
 import datetime
-from phoneme_generator import process_audio_to_phonemes
+import shutil
+import wave
+import threading
+from collections import OrderedDict
+import phonememapping
+from phonememapping import get_audio_duration, PhonemeMapper
+from intent_engine import IntentEngine
+from canned_responses import CannedResponseCache, load_canned_phrases
+from artifact_store import ArtifactStore
+from audio_streaming import iter_growing_wav, WriteTracker
+from animation_scheduler import AnimationScheduler
+from asr import load_asr_model, transcribe
+from llm_backend import LLMBackend
+from generation_controller import GenerationController
+from streaming_asr import StreamingTranscriber, StreamingSessions, SAMPLE_RATE
+from jobs import JobRegistry, JobCancelled, check_cancelled, current_job, run_process
+import stub_backends
+from stub_backends import STUB_BACKENDS
+from profiling import RequestProfiler, format_pstats
+from memory_stats import track, memory_tracker
+from quality_tiers import QualityGovernor, get_quality_tier
+from visemes import build_pose_table, VisemeSessions
+from rig_profiles import get_rig_profile
+from logging_setup import setup_logging, request_id_var, session_id_var
+
+# Log records are written by a background thread, never on request threads
+setup_logging()
+logger = logging.getLogger("serversetup")
+
+# Load testing: fixed-latency stand-ins for the models (see stub_backends.py)
+keyframe_backend = stub_backends if STUB_BACKENDS else phonememapping
+process_audio_to_phonemes = keyframe_backend.process_audio_to_phonemes
+stream_audio_to_keyframe_blocks = keyframe_backend.stream_audio_to_keyframe_blocks
 
 app = Flask(__name__)
 UPLOAD_DIR = 'uploads'
 OUTPUT_DIR = 'output'
 REMINDERS_FILE = 'reminders.json'
 PATIENT_HISTORY_FILE = 'patient_history.json'
+CANNED_PHRASES_FILE = 'canned_phrases.json'
+
+# Limits for generated artefacts in OUTPUT_DIR
+ARTIFACT_MAX_BYTES = 200 * 1024 * 1024
+ARTIFACT_MAX_AGE_SECONDS = 6 * 3600
+ARTIFACT_GC_INTERVAL_SECONDS = 60
+
+# Resample keyframes onto a fixed grid (e.g. 30 or 60 fps) so the engine can
+# index frames directly; None keeps the irregular syllable keyframes
+KEYFRAME_FRAME_RATE = None
+
+# /keyframes/stream waits this long for streamed reply audio to finish synthesising
+KEYFRAME_AUDIO_WAIT_SECONDS = 60.0
+
+# Local LLM, kept loaded between turns (seconds Ollama keeps it after a request)
+LLM_MODEL = "deepseek-r1:1.5b"
+LLM_KEEP_ALIVE_SECONDS = 30 * 60
+
+# Replies are 1-2 sentences: cap the answer, skip deepseek-r1's reasoning
+# (raise LLM_THINK_BUDGET_TOKENS to allow some) and stop after 2 sentences
+LLM_MAX_SENTENCES = 2
+LLM_NUM_PREDICT = 120
+LLM_THINK_BUDGET_TOKENS = 0
+
+# Whisper inference profile for transcribing the user's turn (see asr.py)
+ASR_PROFILE = 'cpu'
+
+# Per-request profiles (cProfile .pstats or sampled .collapsed stacks). Off
+# unless a request sends X-Profile / ?profile= or an admin enables it via
+# POST /profiling; set PROFILE_ON_REQUEST = False to ignore the header.
+PROFILE_DIR = os.path.join(OUTPUT_DIR, 'profiles')
+PROFILE_ON_REQUEST = True
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -80,40 +144,124 @@ if not os.path.exists(PATIENT_HISTORY_FILE):
     
     with open(PATIENT_HISTORY_FILE, 'w') as f:
         json.dump(default_patient_history, f, indent=2)
-    print(f"[INFO] Created default patient history file: {PATIENT_HISTORY_FILE}")
+    logger.info("Created default patient history file: %s", PATIENT_HISTORY_FILE)
 
 # Initialize reminders file if it doesn't exist
 if not os.path.exists(REMINDERS_FILE):
     with open(REMINDERS_FILE, 'w') as f:
         json.dump([], f)
-    print(f"[INFO] Created empty reminders file: {REMINDERS_FILE}")
+    logger.info("Created empty reminders file: %s", REMINDERS_FILE)
 
-# Add cleanup function for JSON files
-def cleanup_json_files():
-    try:
-        # Get all JSON files in the output directory
-        json_files = glob.glob(os.path.join(OUTPUT_DIR, "*.json"))
-        for file in json_files:
-            try:
-                os.remove(file)
-                print(f"[CLEANUP] Deleted: {file}")
-            except Exception as e:
-                print(f"[CLEANUP] Error deleting {file}: {e}")
-        print(f"[CLEANUP] Removed {len(json_files)} JSON files from {OUTPUT_DIR}")
-    except Exception as e:
-        print(f"[CLEANUP] Error during cleanup: {e}")
+# Content-hashed keyframe files with size/age limits, collected in the background
+artifact_store = ArtifactStore(
+    OUTPUT_DIR,
+    max_bytes=ARTIFACT_MAX_BYTES,
+    max_age_seconds=ARTIFACT_MAX_AGE_SECONDS
+)
+artifact_store.collect()
+artifact_store.start_collector(ARTIFACT_GC_INTERVAL_SECONDS)
+
+if STUB_BACKENDS:
+    logger.warning("LIPRA_STUB_BACKENDS is set: Whisper, Ollama, gTTS and keyframes are stubbed")
+    model = stub_backends.StubASRModel()
+else:
+    model = load_asr_model("tiny.en", ASR_PROFILE)
+
+# Transcriptions of audio streamed while the user is still speaking
+asr_streams = StreamingSessions(lambda input_rate: StreamingTranscriber(model, ASR_PROFILE, input_rate=input_rate))
+
+# Each session's reply audio lives in its own directory (see session_audio_path)
+SESSION_AUDIO_DIR = os.path.join(OUTPUT_DIR, "sessions")
+MAX_REPLY_SESSIONS = 1000
+
+# Fast-path answers for structured questions about the patient
+intent_engine = IntentEngine(min_confidence=0.75)
+
+# One persistent client to the LLM backend; warmed and kept resident from __main__
+if STUB_BACKENDS:
+    llm_backend = stub_backends.StubLLMBackend(LLM_MODEL)
+else:
+    llm_backend = LLMBackend(LLM_MODEL, keep_alive_seconds=LLM_KEEP_ALIVE_SECONDS)
+generation_controller = GenerationController(
+    llm_backend,
+    max_sentences=LLM_MAX_SENTENCES,
+    num_predict=LLM_NUM_PREDICT,
+    think_budget_tokens=LLM_THINK_BUDGET_TOKENS
+)
+
+# One scheduler thread starts and stops animations for every session
+animation_scheduler = AnimationScheduler()
 
-# Call cleanup function when server starts
-cleanup_json_files()
+# In-flight reply per session, cancelled when the user speaks again
+response_jobs = JobRegistry()
 
-model = whisper.load_model("tiny.en")
-AUDIO_OUTPUT_FILE = os.path.join(OUTPUT_DIR, "response.wav")
+# Opt-in profiling of individual replies
+request_profiler = RequestProfiler(PROFILE_DIR)
 
-# Global variables to track animation state
-animation_active = False
-animation_start_time = 0
-current_audio_duration = 0
-current_keyframes_path = None
+# Drops keyframe quality when keyframe jobs pile up or slow down (LIPRA_QUALITY_TIER pins a tier)
+quality_governor = QualityGovernor()
+
+# Sessions that fetched the viseme pose table get compact viseme records instead of keyframes
+viseme_pose_table = build_pose_table(PhonemeMapper(), get_rig_profile())
+viseme_sessions = VisemeSessions()
+
+# Latest reply per session (text, audio duration, keyframes, quality tier), least recent first
+session_replies = OrderedDict()
+session_replies_lock = threading.Lock()
+
+# Reply audio files still being written, so /audio knows to stream them
+audio_writes = WriteTracker()
+
+def get_session_id():
+    """Session (avatar) the request belongs to, from the X-Session-ID header or ?session_id="""
+    return request.headers.get('X-Session-ID') or request.args.get('session_id') or 'default'
+
+def session_audio_path(session_id):
+    """Reply audio file for a session: output/sessions/<session>/response.wav"""
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', session_id)[:48]
+    digest = hashlib.sha1(session_id.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(SESSION_AUDIO_DIR, f"{name}-{digest}", "response.wav")
+
+def get_reply(session_id, create=True):
+    """
+    The session's latest reply state, created on first use.
+    
+    Beyond MAX_REPLY_SESSIONS the least recently used session is forgotten
+    and its audio removed, unless a reply is still being written there.
+    
+    Returns:
+        dict: text, audio_path, audio_duration, keyframes_path and quality_tier,
+              or None if create is False and the session has no reply
+    """
+    with session_replies_lock:
+        reply = session_replies.get(session_id)
+        if reply is None:
+            if not create:
+                return None
+            reply = session_replies[session_id] = {
+                "text": None,
+                "audio_path": session_audio_path(session_id),
+                "audio_duration": 0,
+                "keyframes_path": None,
+                "quality_tier": None
+            }
+        session_replies.move_to_end(session_id)
+        while len(session_replies) > MAX_REPLY_SESSIONS:
+            _, evicted = session_replies.popitem(last=False)
+            if not audio_writes.is_writing(evicted["audio_path"]):
+                shutil.rmtree(os.path.dirname(evicted["audio_path"]), ignore_errors=True)
+        return reply
+
+@app.before_request
+def bind_log_context():
+    """Tag this request's log records with its request and session IDs"""
+    request_id_var.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12])
+    session_id_var.set(get_session_id())
+
+@app.after_request
+def add_request_id(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    return response
 
 def get_patient_history():
     """Load the patient history data"""
@@ -121,7 +269,7 @@ def get_patient_history():
         with open(PATIENT_HISTORY_FILE, 'r') as f:
             return json.load(f)
     except Exception as e:
-        print(f"[ERROR] Failed to load patient history: {e}")
+        logger.error("Failed to load patient history: %s", e)
         return {}
 
 SYSTEM_PROMPT = """
@@ -184,7 +332,7 @@ def get_all_reminders():
             reminders = json.load(f)
         return reminders
     except Exception as e:
-        print(f"[ERROR] Failed to load reminders: {e}")
+        logger.error("Failed to load reminders: %s", e)
         return []
 
 def format_reminders_response(reminders):
@@ -224,10 +372,10 @@ def save_reminder(reminder_text, reminder_time):
         with open(REMINDERS_FILE, 'w') as f:
             json.dump(reminders, f, indent=2)
             
-        print(f"[INFO] Saved reminder: '{reminder_text}' for {reminder_time}")
+        logger.info("Saved reminder: '%s' for %s", reminder_text, reminder_time)
         return True
     except Exception as e:
-        print(f"[ERROR] Failed to save reminder: {e}")
+        logger.error("Failed to save reminder: %s", e)
         return False
 
 def clean_llm_output(raw: str) -> str:
@@ -240,63 +388,150 @@ def estimate_audio_duration(text):
     # Add a little buffer
     return max(estimated_seconds + 0.5, 1.0)
 
-def reset_animation_after_delay(delay_seconds):
-    global animation_active
+def split_sentences(text):
+    """Split a reply into sentences so audio can be written as each one is synthesised"""
+    sentences = [sentence.strip() for sentence in re.split(r'(?<=[.!?])\s+', text.strip())]
+    return [sentence for sentence in sentences if sentence] or [text]
+
+def decode_mp3_to_pcm(mp3_path):
+    """Decode an MP3 to raw 16-bit 22.05kHz mono PCM"""
+    try:
+        result = run_process([
+            'ffmpeg',
+            '-i', mp3_path,
+            '-f', 's16le',
+            '-acodec', 'pcm_s16le',
+            '-ar', '22050',
+            '-ac', '1',
+            '-'
+        ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+        return result.stdout
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        from pydub import AudioSegment
+        sound = AudioSegment.from_mp3(mp3_path)
+        sound = sound.set_frame_rate(22050).set_channels(1).set_sample_width(2)
+        return sound.raw_data
+
+def synthesize_speech(text, output_audio_path):
+    """
+    Render text to a 22.05kHz mono WAV with gTTS + ffmpeg.
+    
+    Sentences are synthesised one at a time and appended to the WAV as they
+    are ready, so the file can be streamed while later sentences are still
+    being synthesised.
+    """
+    if STUB_BACKENDS:
+        return stub_backends.synthesize_speech(text, output_audio_path, split_sentences(text))
     
-    def reset():
-        global animation_active
-        animation_active = False
-        print(f"[INFO] Animation automatically deactivated after {delay_seconds:.2f} seconds")
+    with wave.open(output_audio_path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(22050)
+        
+        for sentence in split_sentences(text):
+            check_cancelled("tts")
+            tts = gTTS(text=sentence, lang='en', tld='com.au', slow=False)
+            
+            temp_mp3_path = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False).name
+            try:
+                tts.save(temp_mp3_path)
+                # wave patches the header after every write, so the file is always playable
+                wav_file.writeframes(decode_mp3_to_pcm(temp_mp3_path))
+            finally:
+                os.remove(temp_mp3_path)
     
-    # Schedule the reset
-    timer = Timer(delay_seconds, reset)
-    timer.daemon = True  # So the timer doesn't prevent app shutdown
-    timer.start()
+    return output_audio_path
+
+# Fixed replies are rendered in the background at startup and served from disk
+canned_responses = CannedResponseCache(
+    os.path.join(OUTPUT_DIR, 'canned'),
+    render_audio=synthesize_speech,
+    render_keyframes=lambda audio, out_dir, name: process_audio_to_phonemes(audio, out_dir, output_name=name, frame_rate=KEYFRAME_FRAME_RATE),
+    get_duration=get_audio_duration,
+    keyframe_variant=json.dumps([KEYFRAME_FRAME_RATE, get_rig_profile().name, sorted(get_rig_profile().channels.items()),
+                                 keyframe_backend.KEYFRAME_GENERATOR_VERSION])
+)
 
-def text_to_speech_and_save(text, output_audio_path=AUDIO_OUTPUT_FILE):
-    global current_audio_duration, current_keyframes_path
+def serve_canned_response(text, output_audio_path, reply):
+    """Serve a pre-rendered reply if one is ready. Returns True on a hit."""
+    entry = canned_responses.get(text)
+    if not entry:
+        return False
     
-    try:
-        # Estimate duration before generating audio
-        current_audio_duration = estimate_audio_duration(text)
-        print(f"[INFO] Estimated audio duration: {current_audio_duration:.2f} seconds")
-        
-        tts = gTTS(text=text, lang='en', tld='com.au', slow=False)
+    shutil.copyfile(entry["audio"], output_audio_path)
+    reply["audio_duration"] = entry["duration"]
+    reply["keyframes_path"] = entry["keyframes"]
+    logger.info("Served pre-rendered response (%.2f seconds)", reply["audio_duration"])
+    return True
+
+def alignment_transcript(text, tier):
+    """
+    The reply text for tiers that time words from it directly. Whisper tiers get
+    None: Whisper would take the text as its initial prompt, and the server's
+    keyframes were never biased that way.
+    """
+    return text if get_quality_tier(tier)["alignment"] == "transcript" else None
 
-        temp_mp3_path = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False).name
-        tts.save(temp_mp3_path)
+def partial_audio_path(output_audio_path, job=None):
+    """File a reply is synthesised into before it is renamed onto output_audio_path"""
+    root, ext = os.path.splitext(output_audio_path)
+    return f"{root}.{job.id if job else uuid.uuid4().hex[:12]}.part{ext}"
 
-        try:
-            subprocess.run([
-                'ffmpeg',
-                '-y',
-                '-i', temp_mp3_path,
-                '-acodec', 'pcm_s16le',
-                '-ar', '22050',
-                '-ac', '1',
-                output_audio_path
-            ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            from pydub import AudioSegment
-            sound = AudioSegment.from_mp3(temp_mp3_path)
-            sound = sound.set_frame_rate(22050).set_channels(1)
-            sound.export(output_audio_path, format="wav")
-
-        os.remove(temp_mp3_path)
+def text_to_speech_and_save(text, session_id, generate_keyframes=True):
+    """Synthesise the session's reply into its audio file and record it in the session's reply state"""
+    reply = get_reply(session_id)
+    reply["text"] = text
+    output_audio_path = reply["audio_path"]
+    os.makedirs(os.path.dirname(output_audio_path), exist_ok=True)
+    # The reply is written to a file of its own and renamed into place once
+    # complete, so a cancelled or failed render only removes its own file
+    job = current_job()
+    partial_path = partial_audio_path(output_audio_path, job)
+    if job:
+        job.add_artifact(partial_path)
+    
+    try:
+        with audio_writes.writing(output_audio_path, partial_path):
+            # Fixed replies skip synthesis entirely
+            canned = serve_canned_response(text, partial_path, reply)
+            if not canned:
+                with track("tts"):
+                    synthesize_speech(text, partial_path)
+            os.replace(partial_path, output_audio_path)
+        if canned:
+            return output_audio_path
+        
+        # Measure the real duration now that the WAV exists
+        reply["audio_duration"] = get_audio_duration(output_audio_path)
+        logger.info("Audio duration: %.2f seconds", reply["audio_duration"])
+        
+        # Keyframes will be streamed from /keyframes/stream instead
+        if not generate_keyframes:
+            reply["keyframes_path"] = None
+            return output_audio_path
         
         # Generate phonemes after creating the audio file
-        print("[INFO] Generating phoneme keyframes...")
-        current_keyframes_path = process_audio_to_phonemes(output_audio_path, OUTPUT_DIR)
-        if current_keyframes_path:
-            print(f"[INFO] Generated keyframes at: {current_keyframes_path}")
+        logger.info("Generating phoneme keyframes...")
+        output_format = 'visemes' if session_id in viseme_sessions else 'keyframes'
+        with track("keyframes"), quality_governor.acquire(reply["audio_duration"]) as tier:
+            reply["quality_tier"] = tier
+            reply["keyframes_path"] = process_audio_to_phonemes(output_audio_path, OUTPUT_DIR, store=artifact_store, frame_rate=KEYFRAME_FRAME_RATE,
+                                                                transcript=alignment_transcript(text, tier), quality_tier=tier,
+                                                                output_format=output_format)
+        if reply["keyframes_path"]:
+            logger.info("Generated %s quality keyframes at: %s", reply["quality_tier"], reply["keyframes_path"])
         else:
-            print("[WARNING] Failed to generate phoneme keyframes")
+            logger.warning("Failed to generate phoneme keyframes")
             
         return output_audio_path
+    except JobCancelled:
+        raise
     except Exception as e:
-        print(f"[ERROR] TTS generation failed: {e}")
-        current_audio_duration = 0
-        current_keyframes_path = None
+        logger.error("TTS generation failed: %s", e)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        reply["audio_duration"] = 0
+        reply["keyframes_path"] = None
         return None
 
 def generate_response(transcript):
@@ -320,6 +555,11 @@ def generate_response(transcript):
         # Load patient history to provide context
         patient_history = get_patient_history()
         
+        # Answer structured questions (medications, allergies, appointments...) without the LLM
+        intent_response = intent_engine.answer(prompt, patient_history)
+        if intent_response:
+            return intent_response
+        
         # Add patient context to the system prompt
         context_prompt = SYSTEM_PROMPT
         if patient_history:
@@ -340,69 +580,363 @@ Current reminders:
 """
             context_prompt += additional_context
 
-        print(f"[INFO] Sending prompt to Ollama: {prompt[:50]}...")
-        response = ollama.chat(
-            model="deepseek-r1:1.5b",
-            messages=[
-                {"role": "system", "content": context_prompt},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        if response and "message" in response and "content" in response["message"]:
-            raw_content = response["message"]["content"]
-            return clean_llm_output(raw_content)
+        logger.info("Sending prompt to Ollama: %s...", prompt[:50])
+        reply = generation_controller.generate([
+            {"role": "system", "content": context_prompt},
+            {"role": "user", "content": prompt}
+        ])
+        reply = clean_llm_output(reply)
+        if reply:
+            return reply
         else:
-            print("[ERROR] Unexpected response format from Ollama")
+            logger.error("Empty response from Ollama")
             return "Sorry, I couldn't generate a response."
+    except JobCancelled:
+        raise
     except Exception as e:
-        print(f"[ERROR] Error generating LLM response: {e}")
+        logger.error("Error generating LLM response: %s", e)
         return f"Error generating response: {str(e)}"
 
+def render_response(llm_response, session_id, generate_keyframes=True):
+    """Synthesise the reply, generate keyframes and start the animation"""
+    check_cancelled("tts")
+    text_to_speech_and_save(llm_response, session_id, generate_keyframes=generate_keyframes)
+    check_cancelled("animation")
+    reply = get_reply(session_id)
+    
+    # Keep this session's keyframes safe from the collector while it plays them
+    artifact_store.pin(session_id, reply["keyframes_path"])
+    
+    # Start the animation now and stop it when the audio finishes
+    animation_scheduler.schedule(session_id, reply["audio_duration"])
+    logger.info("Animation activated and will remain active for %.2f seconds", reply["audio_duration"])
+
+def profile_thread(job):
+    """Profile the calling thread for the job, if the job is being profiled"""
+    return job.profile.thread() if job.profile else nullcontext()
+
+def finish_job(job):
+    """Forget a finished job and save its profile"""
+    response_jobs.finish(job)
+    if job.profile:
+        request_profiler.finish(job.profile)
+
+def render_response_in_background(job, llm_response, session_id, generate_keyframes=True):
+    with job.activate(), profile_thread(job):
+        try:
+            render_response(llm_response, session_id, generate_keyframes)
+        except JobCancelled as e:
+            logger.info("%s", e)
+            job.cleanup()
+        except Exception as e:
+            logger.error("Background response rendering failed: %s", e)
+        finally:
+            # Marked as being written by respond_to_transcript before handing off
+            audio_writes.end(session_audio_path(session_id))
+            finish_job(job)
+
+def cancel_response(session_id, reason):
+    """Barge-in: abort the session's in-flight reply and stop its animation"""
+    job = response_jobs.cancel(session_id, reason)
+    animation_scheduler.cancel(session_id)
+    return job
+
+def run_response_job(session_id, transcribe_fn):
+    """
+    Run transcription and the reply as a cancellable job that replaces the
+    session's in-flight one.
+    
+    Args:
+        session_id (str): Session the utterance belongs to
+        transcribe_fn (callable): Returns the transcript
+        
+    Returns:
+        tuple: (response body, HTTP status)
+    """
+    job = response_jobs.start(session_id)
+    animation_scheduler.cancel(session_id)
+    
+    requested = (request.headers.get('X-Profile') or request.args.get('profile')) if PROFILE_ON_REQUEST else None
+    mode = request_profiler.mode_for(requested)
+    if mode:
+        job.profile = request_profiler.start(job.id, mode)
+    
+    with job.activate(), profile_thread(job):
+        try:
+            job.check("transcribe")
+            with track("transcribe"):
+                transcript = transcribe_fn()
+            logger.info("Transcript: %s", transcript)
+            body = respond_to_transcript(transcript, session_id, job)
+            if job.profile:
+                body["profile"] = f"/profiles/{job.id}"
+            return body, 200
+        except JobCancelled as e:
+            logger.info("%s", e)
+            job.cleanup()
+            return {"status": "cancelled", "job_id": job.id, "message": str(e)}, 409
+        finally:
+            if not job.handed_off:
+                finish_job(job)
+
+def respond_to_transcript(transcript, session_id, job):
+    """
+    Generate and render the reply to a transcript.
+    
+    Honours the stream_keyframes and stream_audio query parameters.
+    With stream_audio the background renderer takes over the job.
+    
+    Returns:
+        dict: Response body for the engine
+    """
+    stream_keyframes = request.args.get('stream_keyframes') == '1'
+    stream_audio = request.args.get('stream_audio') == '1'
+    
+    job.check("llm")
+    with track("llm"):
+        llm_response = generate_response(transcript)
+    logger.info("LLM response: %s", llm_response)
+    job.check("tts")
+    reply = get_reply(session_id)
+
+    if stream_audio:
+        # Return now and let the engine stream /audio while it is synthesised
+        audio_writes.begin(reply["audio_path"], partial_audio_path(reply["audio_path"], job))
+        if os.path.exists(reply["audio_path"]):
+            os.remove(reply["audio_path"])
+        job.handed_off = True
+        # Run in a copy of this context so its log records keep the request's IDs
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(render_response_in_background, job, llm_response, session_id, not stream_keyframes),
+            daemon=True
+        ).start()
+    else:
+        render_response(llm_response, session_id, generate_keyframes=not stream_keyframes)
+
+    return {
+        "status": "success",
+        "job_id": job.id,
+        "message": "Transcription completed, audio streaming" if stream_audio else "Transcription and audio response completed",
+        "transcript": transcript,
+        "llm_response": llm_response,
+        "audio_file": reply["audio_path"],
+        "audio_url": "/audio",
+        "start_animation": not stream_audio,
+        "audio_duration": estimate_audio_duration(llm_response) if stream_audio else reply["audio_duration"],
+        "keyframes_path": None if stream_audio else reply["keyframes_path"],
+        "quality_tier": None if stream_audio else reply["quality_tier"],
+        "keyframes_stream": "/keyframes/stream" if stream_keyframes and (stream_audio or not reply["keyframes_path"]) else None
+    }
+
 @app.route('/', methods=['POST'])
 def transcribe_trail():
-    global animation_active, animation_start_time, current_keyframes_path
-    print("[INFO] Incoming request")
+    logger.info("Incoming request")
     audio_file_path = os.path.join(UPLOAD_DIR, 'trail.wav')
-    transcript = None
-    llm_response = None
+    session_id = get_session_id()
 
-    if os.path.exists(audio_file_path):
-        print(f"[SCAN] Found audio file: {audio_file_path}")
-        try:
-            result = model.transcribe(audio_file_path)
-            transcript = result["text"].strip()
-            print(f"[TRANSCRIPT] {transcript}")
+    if not os.path.exists(audio_file_path):
+        logger.error("trail.wav not found")
+        return jsonify({"status": "error", "message": "trail.wav not found in uploads/"}), 404
+
+    logger.info("Found audio file: %s", audio_file_path)
+    try:
+        body, status = run_response_job(
+            session_id,
+            lambda: transcribe(model, audio_file_path, ASR_PROFILE)["text"].strip()
+        )
+        return jsonify(body), status
+    except Exception as e:
+        logger.error("Error processing trail.wav: %s", e)
+        return jsonify({"status": "error", "message": f"Failed to process audio: {e}"}), 500
 
-            llm_response = generate_response(transcript)
-            print(f"[LLM] Response: {llm_response}")
+@app.route('/stream/start', methods=['POST'])
+def stream_start():
+    """Start transcribing audio streamed while the user speaks (?sample_rate=, default 16000)"""
+    session_id = get_session_id()
+    sample_rate = int(request.args.get('sample_rate', SAMPLE_RATE))
+    
+    # The user has started speaking again: drop the reply still being prepared
+    cancel_response(session_id, "user started speaking")
+    asr_streams.start(session_id, sample_rate)
+    logger.info("Streaming transcription started for session %s (%s Hz)", session_id, sample_rate)
+    return jsonify({"status": "success", "session_id": session_id, "sample_rate": sample_rate})
 
-            text_to_speech_and_save(llm_response, AUDIO_OUTPUT_FILE)
-            
-            # Set animation to active when we have a response
-            animation_active = True
-            animation_start_time = time.time()
-            print(f"[INFO] Animation activated and will remain active for ~{current_audio_duration:.2f} seconds")
-            
-            # Schedule animation to turn off after audio finishes
-            reset_animation_after_delay(current_audio_duration)
+@app.route('/stream/chunk', methods=['POST'])
+def stream_chunk():
+    """
+    Add a chunk of 16-bit little-endian mono PCM (the raw request body).
+    Returns the committed and partial transcript so far, and whether the
+    user appears to have stopped speaking.
+    """
+    stream = asr_streams.get(get_session_id())
+    if not stream:
+        return jsonify({"status": "error", "message": "No active stream, call /stream/start first"}), 404
+    
+    stream.add_chunk(request.get_data())
+    return jsonify({"status": "success", **stream.state()})
+
+@app.route('/stream/finish', methods=['POST'])
+def stream_finish():
+    """Finalise the streamed transcript and reply to it like a POST to /"""
+    session_id = get_session_id()
+    if not asr_streams.get(session_id):
+        return jsonify({"status": "error", "message": "No active stream, call /stream/start first"}), 404
+    try:
+        body, status = run_response_job(session_id, lambda: asr_streams.finish(session_id) or "")
+        return jsonify(body), status
+    except Exception as e:
+        logger.error("Error finishing streamed transcription: %s", e)
+        return jsonify({"status": "error", "message": f"Failed to process audio: {e}"}), 500
 
+@app.route('/audio', methods=['GET'])
+def get_audio():
+    """
+    Serve the session's current response audio.
+    
+    While the WAV is still being synthesised it is sent with chunked transfer
+    encoding and open-ended RIFF/data sizes, so the engine can start buffering
+    straight away. Once complete, HTTP Range requests are supported.
+    """
+    audio_path = session_audio_path(get_session_id())
+    if audio_writes.is_writing(audio_path):
+        response = Response(
+            stream_with_context(iter_growing_wav(audio_writes.partial_path(audio_path),
+                                                 audio_writes.completion(audio_path),
+                                                 completed_path=audio_path)),
+            mimetype='audio/wav'
+        )
+        response.headers['Cache-Control'] = 'no-store'
+        response.headers['Accept-Ranges'] = 'none'
+        return response
+    
+    if not os.path.exists(audio_path):
+        return jsonify({"status": "error", "message": "No response audio available"}), 404
+    
+    # conditional=True makes Flask answer Range requests with 206 Partial Content
+    response = send_file(os.path.abspath(audio_path), mimetype='audio/wav', conditional=True, max_age=0)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/keyframes/stream', methods=['GET'])
+def stream_keyframes():
+    """
+    Stream keyframes for the session's current response audio as NDJSON, one
+    block per line, as soon as each block is finalised. The full result is
+    stored like a regular keyframes file once the stream completes.
+    
+    With stream_audio the reply is still being synthesised when this is
+    requested; alignment starts once the audio file is complete.
+    """
+    session_id = get_session_id()
+    reply = get_reply(session_id)
+    
+    def generate():
+        keyframes = []
+        duration = 0
+        text = reply["text"]
+        try:
+            # Waited for outside the governor, so synthesis time does not count as keyframe time
+            if not audio_writes.wait(reply["audio_path"], KEYFRAME_AUDIO_WAIT_SECONDS):
+                yield json.dumps({"done": True, "error": "Reply audio was not ready in time"}) + "\n"
+                return
+            with quality_governor.acquire(estimate_audio_duration(text) if text else None) as tier:
+                yield json.dumps({"quality_tier": tier}) + "\n"
+                for event in stream_audio_to_keyframe_blocks(reply["audio_path"], transcript=alignment_transcript(text, tier),
+                                                             quality_tier=tier):
+                    if "duration" in event:
+                        duration = event["duration"]
+                    else:
+                        keyframes.extend(event["keyframes"])
+                    yield json.dumps(event) + "\n"
+            
+            if keyframes:
+                reply["keyframes_path"] = artifact_store.put_json({"keyframes": keyframes, "duration": duration, "quality_tier": tier})
+                artifact_store.pin(session_id, reply["keyframes_path"])
+            yield json.dumps({"done": True, "keyframes_path": reply["keyframes_path"]}) + "\n"
         except Exception as e:
-            print(f"[ERROR] Error processing trail.wav: {e}")
-            return jsonify({"status": "error", "message": f"Failed to process audio: {e}"}), 500
-    else:
-        print("[ERROR] trail.wav not found")
-        return jsonify({"status": "error", "message": "trail.wav not found in uploads/"}), 404
+            logger.error("Keyframe streaming failed: %s", e)
+            yield json.dumps({"done": True, "error": str(e)}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/visemes/poses', methods=['GET', 'DELETE'])
+def viseme_poses():
+    """
+    Pose table for compact viseme output (see visemes.py). Fetching it switches
+    the session's replies to [time, viseme, weight, jaw] records; DELETE
+    switches the session back to full keyframes. Pre-rendered replies and
+    /keyframes/stream always send keyframes.
+    """
+    session_id = get_session_id()
+    if request.method == 'DELETE':
+        viseme_sessions.discard(session_id)
+        return jsonify({"status": "success", "output_format": "keyframes"})
+    viseme_sessions.add(session_id)
+    return jsonify({"status": "success", "output_format": "visemes", "pose_table": viseme_pose_table})
 
+@app.route('/cancel', methods=['POST'])
+def cancel():
+    """Abort the session's in-flight reply (barge-in)"""
+    session_id = get_session_id()
+    job = cancel_response(session_id, request.args.get('reason', 'cancelled by client'))
     return jsonify({
         "status": "success",
-        "message": "Transcription and audio response completed",
-        "transcript": transcript,
-        "llm_response": llm_response,
-        "audio_file": "output/response.wav",
-        "start_animation": True,
-        "audio_duration": current_audio_duration,
-        "keyframes_path": current_keyframes_path
-    }), 200
+        "cancelled": job is not None,
+        "job_id": job.id if job else None,
+        "stage": job.stage if job else None
+    })
+
+@app.route('/jobs', methods=['GET'])
+def get_jobs():
+    """API endpoint to get in-flight replies per session"""
+    return jsonify({"status": "success", "jobs": response_jobs.get_stats()})
+
+@app.route('/memory', methods=['GET', 'POST'])
+def get_memory_stats():
+    """
+    RSS and allocation cost per pipeline stage and per loaded model/lexicon.
+    POST ?trace=on|off starts or stops tracemalloc (allocation peaks).
+    """
+    if request.method == 'POST':
+        if request.args.get('trace') == 'on':
+            memory_tracker.start_tracing()
+        elif request.args.get('trace') == 'off':
+            memory_tracker.stop_tracing()
+    return jsonify({"status": "success", "memory_stats": memory_tracker.get_stats()})
+
+@app.route('/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """
+    Admin toggle for profiling: POST ?mode=cprofile|sample|off&every=N
+    profiles every Nth reply until switched off.
+    """
+    if request.method == 'POST':
+        mode = request.args.get('mode', 'off')
+        try:
+            request_profiler.configure(None if mode == 'off' else mode, request.args.get('every', 1))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        logger.info("Profiling set to %s (every %s replies)", mode, request_profiler.every)
+    return jsonify({"status": "success", "profiling": request_profiler.get_stats()})
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """API endpoint to list saved reply profiles, newest first"""
+    return jsonify({"status": "success", "profiles": request_profiler.list_profiles()})
+
+@app.route('/profiles/<job_id>', methods=['GET'])
+def get_profile(job_id):
+    """
+    Download a reply's profile by job ID. ?format=text renders a .pstats
+    profile as a cumulative-time report instead.
+    """
+    path = request_profiler.find(job_id)
+    if not path:
+        return jsonify({"status": "error", "message": f"No profile for job {job_id}"}), 404
+    if request.args.get('format') == 'text' and path.endswith('.pstats'):
+        return Response(format_pstats(path, sort=request.args.get('sort', 'cumulative')), mimetype='text/plain')
+    return send_file(os.path.abspath(path), as_attachment=True, max_age=0)
 
 @app.route('/', methods=['GET'])
 def home():
@@ -410,16 +944,17 @@ def home():
 
 @app.route('/start_animation', methods=['GET'])
 def start_animation():
-    global animation_active, current_keyframes_path
+    session_id = get_session_id()
     
-    # Convert to absolute path if we have a keyframes file
-    absolute_keyframes_path = os.path.abspath(current_keyframes_path) if current_keyframes_path else None
+    # Convert to absolute path if we have a keyframes file (polling does not create reply state)
+    reply = get_reply(session_id, create=False)
+    keyframes_path = reply["keyframes_path"] if reply else None
+    absolute_keyframes_path = os.path.abspath(keyframes_path) if keyframes_path else None
     
     # Get the current state but immediately reset it
-    current_state = animation_active
-    if animation_active:
-        animation_active = False
-        print("[DEBUG] Animation flag reset after query")
+    current_state = animation_scheduler.consume_start(session_id)
+    if current_state:
+        logger.debug("Animation flag reset after query")
     
     # Return the animation state with absolute keyframes path
     response = {
@@ -427,28 +962,35 @@ def start_animation():
         "json_file_path": absolute_keyframes_path if current_state else None
     }
     
-    # Add some debug info
-    elapsed = time.time() - animation_start_time if current_state else 0
-    print(f"[DEBUG] Animation status returned: {current_state}, elapsed time: {elapsed:.2f}s")
-    print(f"[DEBUG] Current keyframes path: {absolute_keyframes_path}")
+    # Polled at 10 Hz per avatar: only spend time on debug output when it is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        elapsed = animation_scheduler.elapsed(session_id) if current_state else 0
+        logger.debug("Animation status returned: %s, elapsed time: %.2fs", current_state, elapsed)
+        logger.debug("Current keyframes path: %s", absolute_keyframes_path)
     
     return jsonify(response)
 
 @app.route('/force_animation', methods=['GET'])
 def force_animation():
     """Manually control animation state"""
-    global animation_active
-    
+    session_id = get_session_id()
     action = request.args.get('action', 'status')
     
     if action == 'start':
-        animation_active = True
-        return jsonify({"status": "Animation started", "start_animation": True})
+        try:
+            reply = get_reply(session_id, create=False)
+            duration = float(request.args.get('duration', (reply and reply["audio_duration"]) or 5.0))
+        except ValueError:
+            return jsonify({"status": "error", "message": "duration must be a number of seconds"}), 400
+        if not 0 < duration < float('inf'):
+            return jsonify({"status": "error", "message": "duration must be a positive number of seconds"}), 400
+        animation_scheduler.schedule(session_id, duration)
+        return jsonify({"status": "Animation started", "start_animation": True, "duration": duration})
     elif action == 'stop':
-        animation_active = False
+        animation_scheduler.cancel(session_id)
         return jsonify({"status": "Animation stopped", "start_animation": False})
     else:
-        return jsonify({"status": "Current animation state", "start_animation": animation_active})
+        return jsonify({"status": "Current animation state", "start_animation": animation_scheduler.is_active(session_id)})
 
 @app.route('/reminders', methods=['GET'])
 def get_reminders():
@@ -460,6 +1002,35 @@ def get_reminders():
     except Exception as e:
         return jsonify({"status": "error", "message": f"Failed to load reminders: {e}"}), 500
 
+@app.route('/artifact_stats', methods=['GET'])
+def get_artifact_stats():
+    """API endpoint to get output directory usage"""
+    return jsonify({"status": "success", "artifact_stats": artifact_store.get_stats()})
+
+@app.route('/animation_stats', methods=['GET'])
+def get_animation_stats():
+    """API endpoint to get animation scheduling drift and load"""
+    return jsonify({"status": "success", "animation_stats": animation_scheduler.get_stats()})
+
+@app.route('/llm_stats', methods=['GET'])
+def get_llm_stats():
+    """API endpoint to get LLM backend warm-up and keep-alive status"""
+    return jsonify({
+        "status": "success",
+        "llm_stats": llm_backend.get_stats(),
+        "generation_stats": generation_controller.get_stats()
+    })
+
+@app.route('/quality_stats', methods=['GET'])
+def get_quality_stats():
+    """API endpoint to get the keyframe quality tier and the load it was chosen from"""
+    return jsonify({"status": "success", "quality_stats": quality_governor.get_stats()})
+
+@app.route('/intent_stats', methods=['GET'])
+def get_intent_stats():
+    """API endpoint to get fast-path intent hit-rate statistics"""
+    return jsonify({"status": "success", "intent_stats": intent_engine.get_stats()})
+
 @app.route('/patient_history', methods=['GET'])
 def get_history():
     """API endpoint to get patient history"""
@@ -470,5 +1041,10 @@ def get_history():
         return jsonify({"status": "error", "message": f"Failed to load patient history: {e}"}), 500
 
 if __name__ == '__main__':
-    print("[BOOT] Flask server running on port 5050")
+    # Pre-render fixed replies and load the LLM without delaying startup
+    canned_responses.warm_up_async(load_canned_phrases(CANNED_PHRASES_FILE))
+    llm_backend.start_keeper()
+    
+    # Development server; production_server.py preloads once and forks several workers
+    logger.info("Flask server running on port 5050")
     app.run(host='0.0.0.0', port=5050, debug=True)
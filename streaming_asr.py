@@ -0,0 +1,254 @@
+"""
+Incremental transcription of audio streamed while the user is speaking.
+
+Audio arrives in chunks (16-bit mono PCM). A worker thread re-runs Whisper on
+a rolling window of the uncommitted audio whenever enough new audio has
+arrived. Words on which two consecutive hypotheses agree (local agreement)
+are committed and the audio before them is dropped from the window. When
+the user stops, only the short uncommitted tail still has to be transcribed.
+"""
+import logging
+import re
+import time
+import threading
+
+from asr import transcribe
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000  # Whisper's input rate
+
+
+def normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def pcm16_to_float(pcm_bytes, input_rate=SAMPLE_RATE):
+    """Convert little-endian 16-bit mono PCM to float32 at Whisper's sample rate"""
+    import numpy as np
+
+    samples = np.frombuffer(pcm_bytes[:len(pcm_bytes) - len(pcm_bytes) % 2], dtype='<i2').astype(np.float32) / 32768.0
+    if input_rate != SAMPLE_RATE and len(samples):
+        target_length = int(round(len(samples) * SAMPLE_RATE / input_rate))
+        positions = np.linspace(0, len(samples) - 1, target_length)
+        samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+    return samples
+
+
+class StreamingTranscriber:
+    """Rolling-window Whisper transcription for one speaker."""
+
+    def __init__(self, model, profile=None, input_rate=SAMPLE_RATE, step_seconds=1.0,
+                 max_window_seconds=15.0, endpoint_silence_seconds=0.6, silence_threshold=0.01):
+        """
+        Args:
+            model: Whisper model from asr.load_asr_model
+            profile (str): ASR profile for the decoding options
+            input_rate (int): Sample rate of the incoming PCM
+            step_seconds (float): New audio needed before the window is transcribed again
+            max_window_seconds (float): Window length at which committed audio is dropped
+            endpoint_silence_seconds (float): Trailing silence that counts as the user stopping
+            silence_threshold (float): RMS level below which audio counts as silence
+        """
+        import numpy as np
+
+        self.model = model
+        self.profile = profile
+        self.input_rate = input_rate
+        self.step_seconds = step_seconds
+        self.max_window_seconds = max_window_seconds
+        self.endpoint_silence_seconds = endpoint_silence_seconds
+        self.silence_threshold = silence_threshold
+
+        self.audio = np.zeros(0, dtype=np.float32)  # Uncommitted window
+        self.offset = 0.0                            # Stream time of audio[0]
+        self.committed = []                          # (start, end, word), stream times
+        self.hypothesis = []                         # Latest uncommitted words
+        self.new_samples = 0
+        self.speech_seen = False
+        self.passes = 0
+        self.last_activity = time.time()
+
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="streaming-asr", daemon=True)
+        self._worker.start()
+
+    def add_chunk(self, pcm_bytes):
+        """Append a chunk of 16-bit mono PCM"""
+        import numpy as np
+
+        samples = pcm16_to_float(pcm_bytes, self.input_rate)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Stream is already finished")
+            self.audio = np.concatenate([self.audio, samples])
+            self.new_samples += len(samples)
+            self.last_activity = time.time()
+            if len(samples) and float(np.sqrt(np.mean(samples ** 2))) >= self.silence_threshold:
+                self.speech_seen = True
+            self._condition.notify()
+
+    def endpoint_detected(self):
+        """True once the user has spoken and the latest audio is silence"""
+        import numpy as np
+
+        with self._condition:
+            tail = self.audio[-int(self.endpoint_silence_seconds * SAMPLE_RATE):]
+            if not self.speech_seen or len(tail) < int(self.endpoint_silence_seconds * SAMPLE_RATE):
+                return False
+            return float(np.sqrt(np.mean(tail ** 2))) < self.silence_threshold
+
+    def committed_text(self):
+        with self._condition:
+            return " ".join(word for _, _, word in self.committed).strip()
+
+    def partial_text(self):
+        with self._condition:
+            return " ".join(word for _, _, word in self.hypothesis).strip()
+
+    def state(self):
+        return {
+            "committed": self.committed_text(),
+            "partial": self.partial_text(),
+            "endpoint": self.endpoint_detected(),
+            "passes": self.passes
+        }
+
+    def finish(self):
+        """
+        Stop the stream, transcribe the remaining tail and commit everything.
+
+        Returns:
+            str: Final transcript
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+        with self._condition:
+            audio, offset = self.audio, self.offset
+            if self.committed:
+                # Only the audio after the last committed word is left to transcribe
+                cut = int((self.committed[-1][1] - offset) * SAMPLE_RATE)
+                if cut > 0:
+                    audio = audio[cut:]
+                    offset += cut / SAMPLE_RATE
+        if len(audio):
+            self._process(audio, offset, final=True)
+        return self.committed_text()
+
+    def _run(self):
+        step_samples = int(self.step_seconds * SAMPLE_RATE)
+        while True:
+            with self._condition:
+                while not self._closed and self.new_samples < step_samples:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                self.new_samples = 0
+                audio, offset = self.audio, self.offset
+            try:
+                self._process(audio, offset)
+            except Exception as e:
+                logger.error("Streaming transcription pass failed: %s", e)
+
+    def _transcribe(self, audio, offset):
+        """Whisper over the window; returns (start, end, word) in stream time"""
+        options = {"word_timestamps": True}
+        # Previously committed words give the decoder context across window cuts
+        context = self.committed_text()[-200:]
+        if context:
+            options["initial_prompt"] = context
+
+        result = transcribe(self.model, audio, self.profile, **options)
+        words = []
+        for segment in result.get("segments", []):
+            for word_data in segment.get("words", []):
+                word = (word_data.get("word") or word_data.get("text") or "").strip()
+                if word:
+                    words.append((offset + word_data["start"], offset + word_data["end"], word))
+        return words
+
+    def _process(self, audio, offset, final=False):
+        words = self._transcribe(audio, offset)
+        self.passes += 1
+
+        with self._condition:
+            # Only words after what is already committed are candidates
+            committed_end = self.committed[-1][1] if self.committed else 0.0
+            words = [w for w in words if w[0] >= committed_end - 0.1]
+
+            # Drop words repeated from the end of the committed text
+            for n in range(min(5, len(self.committed), len(words)), 0, -1):
+                tail = [normalize_word(w[2]) for w in self.committed[-n:]]
+                if [normalize_word(w[2]) for w in words[:n]] == tail:
+                    words = words[n:]
+                    break
+
+            if final:
+                agreed = words
+            else:
+                # Local agreement: commit the prefix this pass shares with the previous one
+                agreed = []
+                for previous, current in zip(self.hypothesis, words):
+                    if normalize_word(previous[2]) != normalize_word(current[2]):
+                        break
+                    agreed.append(current)
+
+            self.committed.extend(agreed)
+            self.hypothesis = words[len(agreed):]
+
+            # Keep the window short: drop audio that only holds committed words
+            window_seconds = len(self.audio) / SAMPLE_RATE
+            if self.committed and window_seconds > self.max_window_seconds:
+                cut = int((self.committed[-1][1] - self.offset) * SAMPLE_RATE)
+                if cut > 0:
+                    self.audio = self.audio[cut:]
+                    self.offset += cut / SAMPLE_RATE
+
+
+class StreamingSessions:
+    """Active streaming transcriptions, one per session."""
+
+    def __init__(self, create, max_idle_seconds=60):
+        """
+        Args:
+            create (callable): (input_rate) -> StreamingTranscriber
+            max_idle_seconds (float): Streams without chunks for this long are dropped
+        """
+        self.create = create
+        self.max_idle_seconds = max_idle_seconds
+        self.streams = {}
+        self._lock = threading.Lock()
+
+    def start(self, session_id, input_rate=SAMPLE_RATE):
+        """Start a new stream for the session, abandoning any previous one"""
+        self.expire()
+        stream = self.create(input_rate)
+        with self._lock:
+            previous = self.streams.pop(session_id, None)
+            self.streams[session_id] = stream
+        if previous:
+            threading.Thread(target=previous.finish, daemon=True).start()
+        return stream
+
+    def get(self, session_id):
+        with self._lock:
+            return self.streams.get(session_id)
+
+    def finish(self, session_id):
+        """Finalise and remove a session's stream; returns the transcript or None"""
+        with self._lock:
+            stream = self.streams.pop(session_id, None)
+        return stream.finish() if stream else None
+
+    def expire(self):
+        now = time.time()
+        with self._lock:
+            stale = [sid for sid, s in self.streams.items() if now - s.last_activity > self.max_idle_seconds]
+            expired = [self.streams.pop(sid) for sid in stale]
+        for stream in expired:
+            threading.Thread(target=stream.finish, daemon=True).start()
+        return len(expired)
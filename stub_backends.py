@@ -0,0 +1,191 @@
+"""
+Fixed-latency stand-ins for Whisper, Ollama, gTTS and keyframe generation.
+
+Enabled with LIPRA_STUB_BACKENDS=1 so the server can be load tested (see
+loadtest.py) without a GPU, a running Ollama or network access. Each stage
+sleeps for a configurable time and produces output of the right shape, so
+the numbers reflect the server's own request handling, locking and
+threading rather than the models.
+
+Latencies (seconds) can be overridden with LIPRA_STUB_LATENCIES, a JSON
+object with any of the keys in STUB_LATENCIES, e.g.
+    LIPRA_STUB_LATENCIES='{"asr": 0.5, "llm_token": 0.03}'
+"""
+import os
+import json
+import time
+import wave
+import itertools
+import threading
+
+from rig_profiles import get_rig_profile
+from artifact_store import content_hash_name
+
+STUB_BACKENDS = os.environ.get('LIPRA_STUB_BACKENDS', '').lower() in ('1', 'true', 'yes')
+
+STUB_LATENCIES = {
+    "asr": 0.3,          # Per transcription
+    "llm_first": 0.15,   # Until the first token
+    "llm_token": 0.02,   # Per streamed token
+    "tts": 0.2,          # Per synthesised sentence
+    "keyframes": 0.15    # Per keyframes file
+}
+STUB_LATENCIES.update(json.loads(os.environ.get('LIPRA_STUB_LATENCIES', '{}')))
+
+# Transcripts returned in turn: a structured question (intent fast path),
+# a reminder query and open questions that go to the LLM
+STUB_UTTERANCES = [
+    "What medications am I taking?",
+    "I have a mild headache after my walk, what should I do?",
+    "Do I have any reminders?",
+    "Is it normal to feel tired a few weeks after heart surgery?"
+]
+
+STUB_REPLY = ("Mild headaches after exercise are common, so drink some water and rest for a while. "
+              "If it gets worse or you feel chest pain, please call your doctor straight away.")
+
+SPEECH_WORDS_PER_SECOND = 2.5
+
+# Keeps stub keyframes cached on disk apart from real ones (see phonememapping)
+KEYFRAME_GENERATOR_VERSION = "stub-1"
+STUB_SAMPLE_RATE = 22050
+
+
+class StubASRModel:
+    """Takes the place of a Whisper model: model.transcribe(audio, **options)"""
+
+    def __init__(self, latency=None):
+        self.latency = STUB_LATENCIES["asr"] if latency is None else latency
+        self._utterances = itertools.cycle(STUB_UTTERANCES)
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio, **options):
+        time.sleep(self.latency)
+        with self._lock:
+            text = next(self._utterances)
+
+        # Evenly spaced word timings, for callers that ask for word_timestamps
+        words = []
+        for i, word in enumerate(text.split()):
+            start = i / SPEECH_WORDS_PER_SECOND
+            words.append({"word": " " + word, "start": start, "end": start + 0.8 / SPEECH_WORDS_PER_SECOND})
+        end = words[-1]["end"] if words else 0.0
+        return {"text": text, "segments": [{"start": 0.0, "end": end, "text": text, "words": words}]}
+
+
+class StubLLMBackend:
+    """Drop-in for LLMBackend that streams a canned reply token by token"""
+
+    def __init__(self, model="stub", reply=STUB_REPLY, first_token_latency=None, token_latency=None):
+        self.model = model
+        self.reply = reply
+        self.first_token_latency = STUB_LATENCIES["llm_first"] if first_token_latency is None else first_token_latency
+        self.token_latency = STUB_LATENCIES["llm_token"] if token_latency is None else token_latency
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def chat(self, messages, stream=False, options=None, **kwargs):
+        with self._lock:
+            self.requests += 1
+        limit = (options or {}).get("num_predict") or None
+        tokens = [word + " " for word in self.reply.split()][:limit]
+
+        def generate():
+            time.sleep(self.first_token_latency)
+            for token in tokens:
+                time.sleep(self.token_latency)
+                yield {"message": {"role": "assistant", "content": token}, "done": False}
+            yield {"message": {"role": "assistant", "content": ""}, "done": True}
+
+        if stream:
+            return generate()
+        return {"message": {"role": "assistant", "content": "".join(c["message"]["content"] for c in generate())}}
+
+    def preload(self, prompt=""):
+        return True
+
+    def warm_up(self):
+        self.ready.set()
+
+    def is_loaded(self):
+        return True
+
+    def start_keeper(self):
+        self.warm_up()
+
+    def stop_keeper(self):
+        pass
+
+    def get_stats(self):
+        with self._lock:
+            return {"model": self.model, "requests": self.requests, "stub": True, "ready": self.ready.is_set()}
+
+
+def synthesize_speech(text, output_audio_path, sentences=None):
+    """
+    Write a quiet 22.05kHz mono WAV as long as the text would take to say,
+    sleeping STUB_LATENCIES['tts'] per sentence.
+    """
+    sentences = sentences or [text]
+    with wave.open(output_audio_path, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(STUB_SAMPLE_RATE)
+        for sentence in sentences:
+            time.sleep(STUB_LATENCIES["tts"])
+            seconds = max(len(sentence.split()) / SPEECH_WORDS_PER_SECOND, 0.5)
+            wav_file.writeframes(b'\x00\x00' * int(seconds * STUB_SAMPLE_RATE))
+    return output_audio_path
+
+
+def stub_keyframes(duration, rig, frame_rate=None):
+    """Keyframes with the jaw opening and closing (five times a second by default)"""
+    step = 1.0 / (frame_rate or 10)
+    return [{"time": round(i * step, 4), **rig.jaw(0.4 if i % 2 else 0.0)} for i in range(int(duration / step) + 1)]
+
+
+def process_audio_to_phonemes(audio_file_path, output_dir=None, output_name=None, store=None, frame_rate=None, quality_tier=None,
+                              output_format='keyframes', **kwargs):
+    """
+    Same signature and output layout as phonememapping.process_audio_to_phonemes,
+    with the jaw opening and closing five times a second.
+    """
+    time.sleep(STUB_LATENCIES["keyframes"])
+    with wave.open(audio_file_path, 'rb') as wav_file:
+        duration = wav_file.getnframes() / float(wav_file.getframerate())
+
+    rig = get_rig_profile()
+    keyframes = stub_keyframes(duration, rig, frame_rate)
+
+    result = {"keyframes": keyframes, "duration": duration, "rig_profile": rig.name, "quality_tier": quality_tier or "full"}
+    if output_format == 'visemes':
+        # Alternate between rest and the open 'aa' viseme
+        result = {"format": "visemes", "duration": duration, "rig_profile": rig.name, "quality_tier": quality_tier or "full",
+                  "visemes": [[kf["time"], 1 if i % 2 else 0, float(i % 2), 0.4 if i % 2 else 0.0] for i, kf in enumerate(keyframes)]}
+    elif frame_rate:
+        result["frame_rate"] = frame_rate
+
+    if store is not None and output_name is None:
+        return store.put_json(result)
+    if output_name is None:
+        output_name, _ = content_hash_name(result)
+    output_file = os.path.join(output_dir, output_name)
+    with open(output_file, 'w') as f:
+        json.dump(result, f)
+    return output_file
+
+
+def stream_audio_to_keyframe_blocks(audio_file_path, generator=None, transcript=None, quality_tier=None, block_size=10):
+    """
+    Same events as phonememapping.stream_audio_to_keyframe_blocks: the duration,
+    then the stub keyframes in blocks, the first after STUB_LATENCIES['keyframes'].
+    """
+    with wave.open(audio_file_path, 'rb') as wav_file:
+        duration = wav_file.getnframes() / float(wav_file.getframerate())
+    yield {"duration": duration}
+
+    time.sleep(STUB_LATENCIES["keyframes"])
+    keyframes = stub_keyframes(duration, get_rig_profile())
+    for i in range(0, len(keyframes), block_size):
+        yield {"keyframes": keyframes[i:i + block_size]}
@@ -0,0 +1,215 @@
+"""
+Compact viseme output: a pose table sent once per session plus a stream of
+small records instead of fully spelled-out keyframes.
+
+PhonemeMapper only knows a few dozen fixed poses, and simplify_phoneme
+already folds IPA variants onto them (ɛ -> e, ɔ -> o, θ/ð -> th, ...). Those
+are collapsed further into the inventory below, one pose per viseme. The
+engine fetches the table once (GET /visemes/poses) and then receives, per
+utterance, records of
+
+    [time, viseme_id, weight, jaw]
+
+meaning "at this time show weight * (pose - rest) on top of the rest pose,
+with the jaw open this far". Consecutive records are interpolated linearly,
+as the engine already does between keyframes.
+"""
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from lexicon import CMU_TO_PHONEME, CMU_VOWELS, syllabify_phones
+
+# (name, PhonemeMapper phoneme whose pose the viseme uses). IDs are the indices.
+VISEMES = (
+    ('rest', 'rest'),
+    ('aa', 'a'),    # a ɑ æ ə ʌ ɐ, aw, ay
+    ('eh', 'e'),    # e ɛ eɪ
+    ('ih', 'i'),    # i ɪ y
+    ('oh', 'o'),    # o ɔ ɒ oʊ
+    ('uw', 'u'),    # u ʊ juː
+    ('pp', 'm'),    # p b m pl
+    ('ff', 'f'),    # f v
+    ('th', 'th'),   # θ ð
+    ('ss', 's'),    # s z t d n k g h ng st nt
+    ('sh', 'sh'),   # ʃ ʒ tʃ dʒ
+    ('ll', 'l'),
+    ('rr', 'r'),    # r tr
+    ('ww', 'w')
+)
+
+VISEME_IDS = {name: i for i, (name, _) in enumerate(VISEMES)}
+REST_VISEME = VISEME_IDS['rest']
+
+RECORD_FIELDS = ('time', 'viseme', 'weight', 'jaw')
+
+# Simplified phoneme (output of PhonemeMapper.simplify_phoneme, which keeps
+# phonemes that have their own pose unchanged) -> viseme name
+PHONEME_VISEMES = {
+    'rest': 'rest',
+    'a': 'aa', 'ɑ': 'aa', 'ˈa': 'aa', 'aw': 'aa', 'ay': 'aa', 'aɪ': 'aa', 'aʊ': 'aa',
+    'e': 'eh', 'ɛ': 'eh', 'eɪ': 'eh',
+    'i': 'ih', 'ɪ': 'ih', 'ˈɪ': 'ih', 'ˈiː': 'ih', 'y': 'ih',
+    'o': 'oh', 'ɔ': 'oh', 'ˈɒ': 'oh', 'oʊ': 'oh',
+    'u': 'uw', 'ʊ': 'uw', 'juː': 'uw', 'kʊd': 'uw',
+    'p': 'pp', 'b': 'pp', 'm': 'pp', 'pl': 'pp',
+    'f': 'ff', 'v': 'ff',
+    'th': 'th', 'θ': 'th', 'ð': 'th',
+    's': 'ss', 'z': 'ss', 't': 'ss', 'd': 'ss', 'n': 'ss', 'k': 'ss', 'g': 'ss',
+    'h': 'ss', 'ng': 'ss', 'st': 'ss', 'nt': 'ss',
+    'sh': 'sh', 'ʃ': 'sh', 'zh': 'sh', 'tʃ': 'sh', 'dʒ': 'sh',
+    'l': 'll',
+    'r': 'rr', 'tr': 'rr',
+    'w': 'ww'
+}
+
+VOWEL_VISEMES = frozenset(['aa', 'eh', 'ih', 'oh', 'uw'])
+
+
+def viseme_for_phoneme(phoneme, mapper):
+    """
+    Viseme ID for an IPA or CMU phoneme.
+
+    Args:
+        phoneme (str): IPA phoneme, CMU phone (e.g. 'AH') or alias
+        mapper (PhonemeMapper): Supplies simplify_phoneme
+
+    Returns:
+        int: Index into VISEMES
+    """
+    simple = mapper.simplify_phoneme(CMU_TO_PHONEME.get(phoneme, phoneme))
+    name = PHONEME_VISEMES.get(simple)
+    if name is None:
+        # Multi-character leftovers: use the first character we know
+        name = next((PHONEME_VISEMES[c] for c in simple if c in PHONEME_VISEMES), 'aa')
+    return VISEME_IDS[name]
+
+
+def syllable_visemes(word, phonemes, syllable_count, mapper):
+    """
+    One viseme per syllable, taken from each syllable's vowel.
+
+    Args:
+        word (str): The word, used when phonemes are unknown
+        phonemes (list): Stress-stripped CMU phones, or [word] if not in the lexicon
+        syllable_count (int): Number of syllables the keyframes are built for
+        mapper (PhonemeMapper): Supplies simplify_phoneme
+
+    Returns:
+        list: syllable_count viseme IDs (at least one)
+    """
+    visemes = []
+    if phonemes and phonemes != [word]:
+        for syllable in syllabify_phones(phonemes):
+            vowel = next((p for p in syllable if p in CMU_VOWELS), syllable[0])
+            visemes.append(viseme_for_phoneme(vowel, mapper))
+    if not visemes:
+        # Unknown word: the first vowel-like sound in its spelling
+        for char in mapper.simplify_phoneme(word.lower()):
+            name = PHONEME_VISEMES.get(char)
+            if name in VOWEL_VISEMES:
+                visemes.append(VISEME_IDS[name])
+                break
+        else:
+            visemes.append(VISEME_IDS['aa'])
+
+    count = max(1, syllable_count)
+    return (visemes + visemes[-1:] * count)[:count]
+
+
+def build_pose_table(mapper, rig):
+    """
+    Pose per viseme for a rig, to be sent to the engine once per session.
+
+    Args:
+        mapper (PhonemeMapper): Source of the poses
+        rig (RigProfile): Channels to include (the jaw is carried by the records)
+
+    Returns:
+        dict: {'version', 'rig_profile', 'record_fields', 'visemes': [{'id', 'name', 'pose'}]}
+    """
+    visemes = []
+    for i, (name, phoneme) in enumerate(VISEMES):
+        pose = rig.select(mapper.get_values(phoneme))
+        pose.pop('jawValue', None)
+        visemes.append({'id': i, 'name': name, 'pose': pose})
+
+    table = {'rig_profile': rig.name, 'record_fields': list(RECORD_FIELDS), 'visemes': visemes}
+    # Lets the engine check that a stream was made for the table it holds
+    table['version'] = hashlib.sha1(json.dumps(table, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return table
+
+
+def expand_records(records, pose_table):
+    """
+    Expand viseme records back into keyframes, as the engine does. Used for
+    checking the compact stream against full keyframes.
+
+    Returns:
+        list: Keyframe dicts with 'time', the pose channels and 'jawValue'
+    """
+    poses = [v['pose'] for v in pose_table['visemes']]
+    rest = poses[REST_VISEME]
+    keyframes = []
+    for time, viseme, weight, jaw in records:
+        keyframe = {'time': time}
+        for channel, rest_value in rest.items():
+            value = poses[viseme].get(channel, rest_value)
+            if isinstance(rest_value, dict):
+                keyframe[channel] = {c: rest_value[c] + weight * (value[c] - rest_value[c]) for c in rest_value}
+            else:
+                keyframe[channel] = rest_value + weight * (value - rest_value)
+        keyframe['jawValue'] = {'x': 0.0, 'y': jaw, 'z': 0.0}
+        keyframes.append(keyframe)
+    return keyframes
+
+
+class VisemeSessions:
+    """
+    Sessions that fetched the pose table and get viseme records. Bounded: a
+    session is forgotten after max_idle_seconds without a reply, and the
+    least recently used ones are dropped beyond max_sessions. A forgotten
+    session gets full keyframes again until it fetches the table again.
+    """
+
+    def __init__(self, max_sessions=1000, max_idle_seconds=6 * 3600, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.max_idle_seconds = max_idle_seconds
+        self.clock = clock
+        self._sessions = OrderedDict()   # session_id -> last use, least recent first
+        self._lock = threading.Lock()
+
+    def add(self, session_id):
+        with self._lock:
+            self._sessions[session_id] = self.clock()
+            self._sessions.move_to_end(session_id)
+            self._prune()
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __contains__(self, session_id):
+        """Whether the session gets viseme records (counts as a use)"""
+        with self._lock:
+            self._prune()
+            if session_id not in self._sessions:
+                return False
+            self._sessions[session_id] = self.clock()
+            self._sessions.move_to_end(session_id)
+            return True
+
+    def __len__(self):
+        with self._lock:
+            self._prune()
+            return len(self._sessions)
+
+    def _prune(self):
+        cutoff = self.clock() - self.max_idle_seconds
+        while self._sessions:
+            session_id, last_used = next(iter(self._sessions.items()))
+            if last_used >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]